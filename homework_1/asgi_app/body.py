@@ -0,0 +1,94 @@
+import os
+from typing import Any, Callable, Dict, Optional
+
+
+MAX_BODY_SIZE_ENV = 'ASGI_MAX_BODY_SIZE'
+DEFAULT_MAX_BODY_SIZE = 64 * 1024 * 1024
+# Больше заранее не выделяем, какой бы Content-Length ни заявил клиент:
+# иначе соединения с одними заголовками держали бы по max_size памяти
+PREALLOCATE_SIZE = 1024 * 1024
+
+
+def max_body_size() -> int:
+    '''
+    Лимит тела запроса из переменной окружения ASGI_MAX_BODY_SIZE (в
+    байтах, по умолчанию 64 МиБ)
+    '''
+    return int(os.environ.get(MAX_BODY_SIZE_ENV, DEFAULT_MAX_BODY_SIZE))
+
+
+MAX_BODY_SIZE = max_body_size()
+
+
+class BodyTooLarge(Exception):
+    '''
+    Тело запроса больше допустимого размера
+    '''
+
+
+class ClientDisconnected(Exception):
+    '''
+    Клиент отключился, не дослав тело запроса
+    '''
+
+
+def content_length(scope: Dict[str, Any]) -> Optional[int]:
+    for name, value in scope.get('headers', ()):
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+async def read_body(
+    scope: Dict[str, Any],
+    receive: Callable,
+    max_size: Optional[int] = None,
+) -> bytearray:
+    '''
+    Читает тело запроса целиком, собирая все сообщения http.request.
+    max_size по умолчанию - MAX_BODY_SIZE.
+
+    Если клиент прислал Content-Length больше max_size, отказываем еще
+    до чтения. Иначе заранее выделяем буфер размером Content-Length, но
+    не больше PREALLOCATE_SIZE, и копируем куски в него; дальше (и без
+    Content-Length) буфер растет по мере прихода байт, но не дальше
+    max_size.
+    '''
+    if max_size is None:
+        max_size = MAX_BODY_SIZE
+    expected = content_length(scope)
+    if expected is not None and expected > max_size:
+        raise BodyTooLarge
+
+    buffer = bytearray(min(expected or 0, PREALLOCATE_SIZE))
+    view = memoryview(buffer)
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected
+        chunk = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not chunk:
+            continue
+
+        end = size + len(chunk)
+        if end > max_size:
+            raise BodyTooLarge
+        if end <= len(buffer):
+            view[size:end] = chunk
+        else:
+            # Content-Length не было, он соврал или больше PREALLOCATE_SIZE
+            view.release()
+            del buffer[size:]
+            buffer += chunk
+            view = memoryview(buffer)
+        size = end
+
+    view.release()
+    del buffer[size:]
+    return buffer
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class ResultCache:
+    '''
+    LRU-кэш, ограниченный суммарным размером значений в байтах.
+
+    Результаты вычислений занимают от одного байта до мегабайт, поэтому
+    ограничение по числу записей не подходит: вытесняем самые старые
+    записи, пока сумма размеров не влезет в max_bytes. Значения больше
+    max_item_bytes не кэшируются вовсе, чтобы одна запись не вымыла
+    все остальные.
+    '''
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_item_bytes: Optional[int] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = (
+            max_bytes // 8 if max_item_bytes is None else max_item_bytes
+        )
+        self._entries: OrderedDict[Hashable, Tuple[Any, int]] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def fits(self, size: int) -> bool:
+        return size <= self.max_item_bytes
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> bool:
+        '''
+        Кладет значение размером size байт; возвращает False, если оно
+        слишком большое для кэша
+        '''
+        if not self.fits(size):
+            return False
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old[1]
+        self._entries[key] = (value, size)
+        self._size += size
+
+        while self._size > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'max_item_bytes': self.max_item_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+result_cache = ResultCache()
@@ -0,0 +1,50 @@
+from typing import Callable, Iterator, List
+
+
+# Меньше sys.get_int_max_str_digits() по умолчанию (4300)
+CHUNK_DIGITS = 4000
+
+
+def int_to_decimal_chunks(
+    n: int, chunk_digits: int = CHUNK_DIGITS
+) -> Iterator[bytes]:
+    '''
+    Переводит целое число в десятичную запись по частям.
+
+    Число делится пополам по степеням 10^(chunk_digits * 2^k), куски
+    выдаются слева направо, так что целая строка в памяти не собирается
+    и лимит на длину str(int) не срабатывает.
+    '''
+    if n < 0:
+        yield b'-'
+        n = -n
+
+    powers = [10 ** chunk_digits]
+    while powers[-1] * powers[-1] <= n:
+        powers.append(powers[-1] * powers[-1])
+
+    yield from _split(n, powers, len(powers) - 1, chunk_digits, False)
+
+
+def _split(
+    n: int, powers: List[int], level: int, chunk_digits: int, pad: bool
+) -> Iterator[bytes]:
+    if level < 0:
+        digits = str(n).encode()
+        yield digits.zfill(chunk_digits) if pad else digits
+        return
+
+    high, low = divmod(n, powers[level])
+    if high or pad:
+        yield from _split(high, powers, level - 1, chunk_digits, pad)
+    yield from _split(low, powers, level - 1, chunk_digits, pad or high > 0)
+
+
+def decimal_chunks(func: Callable[[int], int], n: int) -> List[bytes]:
+    '''
+    Считает func(n) и сразу переводит результат в десятичные куски.
+
+    Вызывается в воркере пула, чтобы квадратичный перевод больших чисел
+    в строку тоже не занимал event loop.
+    '''
+    return list(int_to_decimal_chunks(func(n)))
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+
+class BudgetExceeded(Exception):
+    '''
+    n больше, чем разрешено для этого вычисления
+    '''
+
+
+class Overloaded(Exception):
+    '''
+    Вычисление не уложилось в бюджет времени или очередь переполнена
+    '''
+
+
+@dataclass(frozen=True)
+class Budget:
+    # До inline_max_n считаем прямо в обработчике, дальше - в пуле процессов
+    inline_max_n: int
+    max_n: int
+
+
+class ComputeExecutor:
+    '''
+    Выполняет тяжелые вычисления над большими числами.
+
+    Маленькие n считаются сразу, большие уходят в ProcessPoolExecutor,
+    чтобы не блокировать event loop. На каждое вычисление в пуле
+    действует ограничение по времени, а число незавершенных задач
+    ограничено max_pending - при превышении сразу отвечаем Overloaded.
+    '''
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout: float = 5.0,
+        max_pending: int = 8,
+    ):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, func: Callable[[int], Any], n: int, budget: Budget):
+        if n > budget.max_n:
+            raise BudgetExceeded(f'n must be <= {budget.max_n}')
+        if n <= budget.inline_max_n:
+            return func(n)
+        return await self._offload(func, n)
+
+    async def _offload(self, func: Callable[[int], Any], n: int):
+        if self._pending >= self.max_pending:
+            raise Overloaded('Too many pending computations')
+
+        try:
+            future = self._get_pool().submit(func, n)
+        except BrokenProcessPool:
+            self.shutdown()
+            raise Overloaded('Worker pool is broken')
+
+        # Задача занимает слот, пока реально не завершится в воркере,
+        # даже если клиент уже получил ответ по таймауту
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), self.timeout
+            )
+        except asyncio.TimeoutError:
+            raise Overloaded('Computation time budget exceeded')
+        except BrokenProcessPool:
+            self.shutdown()
+            raise Overloaded('Worker pool is broken')
+
+    def _release(self, _) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Верхние границы подобраны так, чтобы вычисление вместе с переводом
+# в десятичную запись укладывалось в timeout по умолчанию
+FACTORIAL_BUDGET = Budget(inline_max_n=1_000, max_n=100_000)
+FIBONACCI_BUDGET = Budget(inline_max_n=20_000, max_n=2_000_000)
+
+executor = ComputeExecutor()
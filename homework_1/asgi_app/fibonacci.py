@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+Pair = Tuple[int, int]
+
+
+class FibonacciEngine:
+    '''
+    Считает числа Фибоначчи методом быстрого удвоения за O(log n)
+    умножений больших чисел.
+
+    В LRU-кэше хранятся пары (F(k), F(k + 1)). Каждый вызов кладет туда
+    опорные точки - пары для префиксов n (n >> 1, n >> 2, ...), поэтому
+    соседние индексы с теми же старшими битами пересчитывают только
+    нижние уровни. Если рядом с n (не дальше max_step) уже есть пара,
+    досчитываем до n обычными сложениями.
+    '''
+
+    def __init__(self, cache_size: int = 256, max_step: int = 16):
+        if cache_size <= 0:
+            raise ValueError('cache_size must be positive')
+        if max_step < 0:
+            raise ValueError('max_step must be non-negative')
+        self.cache_size = cache_size
+        self.max_step = max_step
+        self._cache: OrderedDict[int, Pair] = OrderedDict()
+
+    def __call__(self, n: int) -> int:
+        return self.pair(n)[0]
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def pair(self, n: int) -> Pair:
+        '''
+        Возвращает пару (F(n), F(n + 1))
+        '''
+        if n < 0:
+            raise ValueError('n must be non-negative')
+
+        cached = self._get(n)
+        if cached is not None:
+            return cached
+
+        # Досчитываем от ближайшей опорной точки снизу
+        for step in range(1, min(self.max_step, n) + 1):
+            anchor = self._cache.get(n - step)
+            if anchor is not None:
+                self._cache.move_to_end(n - step)
+                a, b = anchor
+                for _ in range(step):
+                    a, b = b, a + b
+                return self._put(n, (a, b))
+
+        if n == 0:
+            return (0, 1)
+
+        a, b = self.pair(n >> 1)
+        # F(2k) = F(k) * (2F(k + 1) - F(k)), F(2k + 1) = F(k)^2 + F(k + 1)^2
+        c = a * ((b << 1) - a)
+        d = a * a + b * b
+        if n & 1:
+            return self._put(n, (d, c + d))
+        return self._put(n, (c, d))
+
+    def _get(self, n: int) -> Optional[Pair]:
+        cached = self._cache.get(n)
+        if cached is not None:
+            self._cache.move_to_end(n)
+        return cached
+
+    def _put(self, n: int, value: Pair) -> Pair:
+        self._cache[n] = value
+        self._cache.move_to_end(n)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+
+engine = FibonacciEngine()
+
+
+def fibonacci(n: int) -> int:
+    return engine(n)
@@ -1,100 +1,185 @@
 import json
+import math
 from typing import Any, Dict
+from functools import partial
 from math import factorial
-from .statuses import bad_request, unprocessable_entity, not_found, ok
-
-
-def fibonacci(n: int) -> int:
-    if n in [0, 1]:
-        return n
+from . import stats
+from .body import BodyTooLarge, ClientDisconnected, read_body
+from .cache import result_cache
+from .digits import decimal_chunks
+from .executor import (
+    FACTORIAL_BUDGET,
+    FIBONACCI_BUDGET,
+    BudgetExceeded,
+    Overloaded,
+    executor,
+)
+from .fibonacci import fibonacci
+from .router import Router, parse_query
+from .statuses import (
+    STREAM_BUFFER_SIZE,
+    bad_request,
+    unprocessable_entity,
+    not_found,
+    method_not_allowed,
+    ok,
+    ok_chunks,
+    ok_encoded,
+    payload_too_large,
+    service_unavailable,
+)
+
+
+async def compute_result(name, func, n, budget):
+    # Горячие n отдаются готовым ответом из кэша, без вычислений
+    key = (name, n)
+    response = result_cache.get(key)
+    if response is not None:
+        return response
+
+    chunks = await executor.run(partial(decimal_chunks, func), n, budget)
+    size = sum(map(len, chunks))
+    # Большие результаты и из кэша уходят кусками: тело не склеивается
+    # в одну копию, и первые байты уходят раньше
+    if size > STREAM_BUFFER_SIZE:
+        response = ok_chunks(chunks)
     else:
-        a, b = 0, 1
-        for _ in range(2, n + 1):
-            a, b = b, a + b
-        return b
+        response = ok_encoded(chunks)
+    result_cache.put(key, response, size)
+    return response
 
 
-async def handler_factorial(query_string):
+async def handler_factorial(params, query, body):
     try:
-        n = int(query_string.split('=')[-1])
+        n = int(query['n'][0])
         if n < 0:
             return bad_request()
-        return ok(factorial(n))
+        return await compute_result(
+            'factorial', factorial, n, FACTORIAL_BUDGET
+        )
+    except BudgetExceeded as e:
+        return unprocessable_entity(str(e))
+    except Overloaded as e:
+        return service_unavailable(str(e))
     except Exception as e:
         return unprocessable_entity()
 
 
-async def handler_fibonacci(path):
+async def handler_fibonacci(params, query, body):
     try:
-        n = int(path.split('/')[-1])
+        n = int(params['n'])
         if n < 0:
             return bad_request()
-        return ok(fibonacci(n))
+        return await compute_result(
+            'fibonacci', fibonacci, n, FIBONACCI_BUDGET
+        )
+    except BudgetExceeded as e:
+        return unprocessable_entity(str(e))
+    except Overloaded as e:
+        return service_unavailable(str(e))
     except Exception as e:
         return unprocessable_entity()
 
 
-async def handler_mean(body):
-    print(body)
+async def handle_statistic(body, statistic):
+    try:
+        data = stats.to_array(body)
+    except TypeError:
+        return unprocessable_entity()
+    if not len(data):
+        return bad_request()
     try:
-        numbers = body
+        result = statistic(data)
+    except OverflowError:
+        # math.fsum без NumPy падает, если сумма не помещается в float
+        return unprocessable_entity('result is out of float range')
+    # NumPy вместо исключения дает inf/nan, а их нет в JSON
+    if not math.isfinite(result):
+        return unprocessable_entity('result is out of float range')
+    return ok(result)
 
-        if not isinstance(numbers, list) or (
-            not all(isinstance(n, (int, float)) for n in numbers)
-        ):
-            raise TypeError
-        elif not len(numbers):
-            return bad_request()
 
-        result = sum(numbers) / len(numbers)
+async def handler_mean(params, query, body):
+    return await handle_statistic(body, stats.mean)
 
-        return ok(result)
-    except TypeError:
+
+async def handler_variance(params, query, body):
+    return await handle_statistic(body, stats.variance)
+
+
+async def handler_median(params, query, body):
+    return await handle_statistic(body, stats.median)
+
+
+async def handler_quantile(params, query, body):
+    try:
+        q = float(query['q'][0])
+    except (KeyError, ValueError):
         return unprocessable_entity()
+    if not 0 <= q <= 1:
+        return bad_request()
+    return await handle_statistic(body, partial(stats.quantile, q=q))
+
+
+async def handler_cache_stats(params, query, body):
+    return ok(result_cache.stats())
+
 
+router = Router()
+router.add('GET', '/factorial', handler_factorial)
+router.add('GET', '/fibonacci/{n}', handler_fibonacci)
+router.add('GET', '/mean', handler_mean)
+router.add('GET', '/variance', handler_variance)
+router.add('GET', '/median', handler_median)
+router.add('GET', '/quantile', handler_quantile)
+router.add('GET', '/cache/stats', handler_cache_stats)
 
-async def route(path, method, query_string, body):
-    if method == 'GET':
-        if path == '/factorial':
-            return await handler_factorial(query_string)
-        elif '/fibonacci' in path:
-            return await handler_fibonacci(path)
-        elif path == '/mean':
-            return await handler_mean(body)
+
+async def http_handler(scope, receive, send):
+    handler, params, allow = router.resolve(scope['method'], scope['path'])
+    if handler is None:
+        # Тело не читаем: ответ известен заранее
+        if allow:
+            await method_not_allowed(allow)(send)
         else:
-            return not_found()
-    else:
-        return not_found()
+            await not_found()(send)
+        return
 
+    try:
+        body = await read_json(scope, receive)
+    except BodyTooLarge:
+        await payload_too_large()(send)
+        return
+    except ClientDisconnected:
+        return
 
-async def http_handler(scope, recieve, send):
-    path = scope['path']
-    method = scope['method']
-    query_string = scope['query_string'].decode()
+    query = parse_query(scope['query_string'].decode())
+    response = await handler(params, query, body)
+    await response(send)
 
+
+async def read_json(scope, receive):
+    raw = await read_body(scope, receive)
     try:
-        body = await recieve()
-        body = json.loads(body['body'].decode())
-    except Exception as e:
-        body = None
+        # json.loads принимает bytearray напрямую, без лишней копии
+        return json.loads(raw)
+    except (ValueError, RecursionError):
+        return None
 
-    response = await route(path, method, query_string, body)
 
-    await send(
-        {
-            'type': 'http.response.start',
-            'status': response['status'],
-            'headers': [(b'content-type', b'application/json')],
-        }
-    )
-    await send(
-        {
-            'type': 'http.response.body',
-            'body': json.dumps(response['body']).encode(),
-        }
-    )
+async def lifespan_handler(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
 
 
 async def app(scope: Dict[str, Any], receive: Any, send: Any) -> None:
     if scope['type'] == 'http':
         await http_handler(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await lifespan_handler(scope, receive, send)
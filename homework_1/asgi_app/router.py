@@ -0,0 +1,133 @@
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from urllib.parse import parse_qs
+
+
+Handler = Callable[..., Any]
+
+EMPTY_PARAMS: Mapping[str, str] = MappingProxyType({})
+
+
+class Match(NamedTuple):
+    # handler is None, если маршрут не найден (allow пуст) или метод
+    # не поддерживается (в allow - разрешенные методы)
+    handler: Optional[Handler]
+    params: Mapping[str, str]
+    allow: Tuple[str, ...]
+
+
+NOT_FOUND = Match(None, EMPTY_PARAMS, ())
+
+
+class _Node:
+    __slots__ = ('children', 'param', 'param_child', 'methods', 'not_allowed')
+
+    def __init__(self):
+        self.children: Dict[str, _Node] = {}
+        self.param: Optional[str] = None
+        self.param_child: Optional[_Node] = None
+        self.methods: Dict[str, Handler] = {}
+        self.not_allowed: Match = NOT_FOUND
+
+
+class Router:
+    '''
+    Таблица маршрутов, собранная заранее.
+
+    Статические пути ищутся одним обращением к словарю и сразу отдают
+    готовый Match. Пути с параметрами вида /fibonacci/{n} хранятся в
+    префиксном дереве по сегментам, так что поиск стоит O(число
+    сегментов). Для каждого пути есть таблица методов, поэтому
+    известный путь с чужим методом дает 405, а не 404.
+    '''
+
+    def __init__(self):
+        self._static: Dict[str, Dict[str, Match]] = {}
+        self._static_not_allowed: Dict[str, Match] = {}
+        self._root = _Node()
+
+    def add(self, method: str, path: str, handler: Handler) -> None:
+        segments = path.strip('/').split('/')
+        if not any(_is_param(segment) for segment in segments):
+            methods = self._static.setdefault(path, {})
+            methods[method] = Match(handler, EMPTY_PARAMS, ())
+            self._static_not_allowed[path] = Match(
+                None, EMPTY_PARAMS, tuple(sorted(methods))
+            )
+            return
+
+        node = self._root
+        for segment in segments:
+            if _is_param(segment):
+                name = segment[1:-1]
+                if node.param_child is None:
+                    node.param = name
+                    node.param_child = _Node()
+                elif node.param != name:
+                    raise ValueError(
+                        f'Conflicting parameter names: {node.param}, {name}'
+                    )
+                node = node.param_child
+            else:
+                node = node.children.setdefault(segment, _Node())
+        node.methods[method] = handler
+        node.not_allowed = Match(
+            None, EMPTY_PARAMS, tuple(sorted(node.methods))
+        )
+
+    def resolve(self, method: str, path: str) -> Match:
+        methods = self._static.get(path)
+        if methods is not None:
+            return methods.get(method) or self._static_not_allowed[path]
+
+        node = self._root
+        params: Optional[Dict[str, str]] = None
+        for segment in path.strip('/').split('/'):
+            child = node.children.get(segment)
+            if child is not None:
+                node = child
+            elif node.param_child is not None and segment:
+                if params is None:
+                    params = {}
+                params[node.param] = segment
+                node = node.param_child
+            else:
+                return NOT_FOUND
+
+        if not node.methods:
+            return NOT_FOUND
+        handler = node.methods.get(method)
+        if handler is None:
+            return node.not_allowed
+        return Match(handler, params or EMPTY_PARAMS, ())
+
+
+def _is_param(segment: str) -> bool:
+    return len(segment) > 2 and segment[0] == '{' and segment[-1] == '}'
+
+
+def parse_query(query_string: str) -> Dict[str, List[str]]:
+    '''
+    Разбирает query string так же, как urllib.parse.parse_qs, но
+    сохраняет пустые значения (?n= дает {'n': ['']})
+    '''
+    if not query_string:
+        return {}
+    if (
+        '&' not in query_string
+        and '%' not in query_string
+        and '+' not in query_string
+    ):
+        # Одна пара без экранирования - ответ parse_qs очевиден
+        name, _, value = query_string.partition('=')
+        return {name: [value]}
+    return parse_qs(query_string, keep_blank_values=True)
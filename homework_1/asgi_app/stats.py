@@ -0,0 +1,75 @@
+import math
+from array import array
+from typing import Any, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def to_array(values: Any) -> Sequence[float]:
+    '''
+    Переводит разобранный JSON в массив float64.
+
+    Проверка идет целиком на стороне C: array('d', ...) падает на
+    первом же не-числе. Если установлен NumPy, возвращается ndarray
+    поверх того же буфера без копирования.
+    '''
+    if not isinstance(values, list):
+        raise TypeError('expected a list of numbers')
+    try:
+        data = array('d', values)
+    except OverflowError:
+        raise TypeError('number is too large')
+    if np is not None:
+        return np.frombuffer(data, dtype=np.float64)
+    return data
+
+
+def mean(data: Sequence[float]) -> float:
+    if np is not None:
+        # Переполнение дает inf без RuntimeWarning; его отсекает
+        # обработчик по math.isfinite
+        with np.errstate(over='ignore', invalid='ignore'):
+            return float(np.mean(data))
+    return math.fsum(data) / len(data)
+
+
+def variance(data: Sequence[float]) -> float:
+    '''
+    Дисперсия генеральной совокупности (ddof=0)
+    '''
+    if np is not None:
+        with np.errstate(over='ignore', invalid='ignore'):
+            return float(np.var(data))
+    # Алгоритм Уэлфорда: один проход без потери точности на больших
+    # значениях, в отличие от E[x^2] - E[x]^2
+    count = 0
+    current_mean = 0.0
+    m2 = 0.0
+    for value in data:
+        count += 1
+        delta = value - current_mean
+        current_mean += delta / count
+        m2 += delta * (value - current_mean)
+    return m2 / count
+
+
+def quantile(data: Sequence[float], q: float) -> float:
+    '''
+    Квантиль с линейной интерполяцией, как numpy.quantile по умолчанию
+    '''
+    if np is not None:
+        # np.quantile делает частичную сортировку (np.partition), O(n)
+        with np.errstate(over='ignore', invalid='ignore'):
+            return float(np.quantile(data, q))
+    ordered = sorted(data)
+    position = q * (len(ordered) - 1)
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def median(data: Sequence[float]) -> float:
+    return quantile(data, 0.5)
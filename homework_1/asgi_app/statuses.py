@@ -1,17 +1,131 @@
 import json
+from functools import lru_cache
+from itertools import chain
+from typing import Iterable, Tuple
+
+
+Headers = Tuple[Tuple[bytes, bytes], ...]
+
+JSON_CONTENT_TYPE = (b'content-type', b'application/json')
+RESULT_PREFIX = b'{"result": '
+RESULT_SUFFIX = b'}'
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class Response:
+    '''
+    Ответ с готовыми сообщениями http.response.start и http.response.body.
+
+    Сообщения собираются один раз в конструкторе, так что отправка - это
+    два вызова send без сериализации. Постоянные ответы переиспользуются
+    между запросами, поэтому сообщения нельзя менять после создания.
+    '''
+
+    __slots__ = ('status', 'start_message', 'body_message')
+
+    def __init__(self, status: int, body: bytes, headers: Headers = ()):
+        self.status = status
+        self.start_message = {
+            'type': 'http.response.start',
+            'status': status,
+            'headers': (JSON_CONTENT_TYPE, *headers),
+        }
+        self.body_message = {'type': 'http.response.body', 'body': body}
+
+    @property
+    def body(self) -> bytes:
+        return self.body_message['body']
+
+    async def __call__(self, send) -> None:
+        await send(self.start_message)
+        await send(self.body_message)
+
+
+class StreamingResponse:
+    '''
+    Ответ, тело которого отправляется кусками с more_body=True.
+
+    chunks обходится заново при каждой отправке, так что ответ из
+    списка кусков можно кэшировать и отдавать много раз.
+    '''
+
+    __slots__ = ('status', 'start_message', 'chunks')
+
+    def __init__(
+        self, status: int, chunks: Iterable[bytes], headers: Headers = ()
+    ):
+        self.status = status
+        self.start_message = {
+            'type': 'http.response.start',
+            'status': status,
+            'headers': (JSON_CONTENT_TYPE, *headers),
+        }
+        self.chunks = chunks
+
+    async def __call__(self, send) -> None:
+        await send(self.start_message)
+        # Склеиваем мелкие куски, чтобы не отправлять сообщение на каждый
+        buffer = bytearray()
+        for chunk in self.chunks:
+            buffer += chunk
+            if len(buffer) >= STREAM_BUFFER_SIZE:
+                await send(
+                    {
+                        'type': 'http.response.body',
+                        'body': bytes(buffer),
+                        'more_body': True,
+                    }
+                )
+                buffer.clear()
+        await send({'type': 'http.response.body', 'body': bytes(buffer)})
+
+
+@lru_cache(maxsize=256)
+def error(status: int, message: str, headers: Headers = ()) -> Response:
+    return Response(status, json.dumps({'error': message}).encode(), headers)
 
 
 def bad_request(message='Bad Request'):
-    return {'status': 400, 'body': json.dumps({'error': message})}
+    return error(400, message)
 
 
 def unprocessable_entity(message='Unprocessable Entity'):
-    return {'status': 422, 'body': json.dumps({'error': message})}
+    return error(422, message)
 
 
 def not_found(message='Not Found'):
-    return {'status': 404, 'body': json.dumps({'error': message})}
+    return error(404, message)
+
+
+def payload_too_large(message='Payload Too Large'):
+    return error(413, message)
+
+
+def method_not_allowed(allow, message='Method Not Allowed'):
+    return error(405, message, ((b'allow', ', '.join(allow).encode()),))
 
 
 def ok(message):
-    return {'status': 200, 'body': json.dumps({'result': message})}
+    return Response(200, json.dumps({'result': message}).encode())
+
+
+def ok_chunks(chunks: Iterable[bytes]):
+    '''
+    Ответ, где result - уже закодированное в JSON число, отданное кусками
+    '''
+    # Список ссылок на те же куски, а не одноразовый chain
+    return StreamingResponse(200, [RESULT_PREFIX, *chunks, RESULT_SUFFIX])
+
+
+def ok_encoded(chunks: Iterable[bytes]):
+    '''
+    То же, что ok_chunks, но тело склеивается целиком - для небольших
+    результатов это дешевле отправки кусками
+    '''
+    return Response(
+        200, b''.join(chain((RESULT_PREFIX,), chunks, (RESULT_SUFFIX,)))
+    )
+
+
+def service_unavailable(message='Service Unavailable'):
+    return error(503, message)
@@ -0,0 +1,56 @@
+'''
+Сравнение старого цикла и FibonacciEngine для n от 10 до 10^6.
+
+Запуск из homework_1/: python -m benchmarks.bench_fibonacci
+'''
+
+import time
+
+from asgi_app.fibonacci import FibonacciEngine
+
+
+def fibonacci_loop(n: int) -> int:
+    if n in [0, 1]:
+        return n
+    a, b = 0, 1
+    for _ in range(2, n + 1):
+        a, b = b, a + b
+    return b
+
+
+def measure(func, n: int, repeat: int = 3, setup=None) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func(n)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def warm_up(engine: FibonacciEngine, n: int):
+    def setup():
+        engine.clear()
+        engine(n)
+    return setup
+
+
+def main():
+    print(f'{"n":>9} | {"loop, ms":>10} | {"cold, ms":>10} | '
+          f'{"warm, ms":>10} | {"n+1, ms":>10}')
+    for power in range(1, 7):
+        n = 10 ** power
+        loop = measure(fibonacci_loop, n, repeat=1 if power == 6 else 3)
+
+        engine = FibonacciEngine()
+        cold = measure(engine, n, setup=engine.clear)
+        warm = measure(engine, n)
+        # Соседний индекс считается от опорной точки n
+        nearby = measure(engine, n + 1, setup=warm_up(engine, n))
+        print(f'{n:>9} | {loop * 1e3:>10.3f} | {cold * 1e3:>10.3f} | '
+              f'{warm * 1e3:>10.3f} | {nearby * 1e3:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
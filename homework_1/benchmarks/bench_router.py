@@ -0,0 +1,133 @@
+'''
+Запросы в секунду через app() с поддельными receive/send: старая цепочка
+if/elif против скомпилированного Router.
+
+Запуск из homework_1/: python -m benchmarks.bench_router
+'''
+
+import asyncio
+import time
+from unittest import mock
+
+from asgi_app import main as asgi_main
+from asgi_app.router import parse_query
+from asgi_app.statuses import method_not_allowed, not_found
+
+REQUESTS = [
+    ('GET', '/factorial', b'n=10', b''),
+    ('GET', '/fibonacci/20', b'', b''),
+    ('GET', '/mean', b'', b'[1, 2, 3]'),
+    ('GET', '/wp-login.php', b'', b''),
+    ('POST', '/factorial', b'n=10', b''),
+]
+
+
+async def legacy_route(path, method, query_string, body):
+    if method == 'GET':
+        if path == '/factorial':
+            query = {'n': [query_string.split('=')[-1]]}
+            return await asgi_main.handler_factorial({}, query, body)
+        elif '/fibonacci' in path:
+            params = {'n': path.split('/')[-1]}
+            return await asgi_main.handler_fibonacci(params, {}, body)
+        elif path == '/mean':
+            return await asgi_main.handler_mean({}, {}, body)
+        else:
+            return not_found()
+    else:
+        return not_found()
+
+
+async def legacy_http_handler(scope, receive, send):
+    try:
+        body = await asgi_main.read_json(scope, receive)
+    except Exception:
+        body = None
+    response = await legacy_route(
+        scope['path'], scope['method'], scope['query_string'].decode(), body
+    )
+    await response(send)
+
+
+async def compiled_route(path, method, query_string, body):
+    handler, params, allow = asgi_main.router.resolve(method, path)
+    if handler is None:
+        if allow:
+            return method_not_allowed(allow)
+        return not_found()
+    return await handler(params, parse_query(query_string), body)
+
+
+async def run(requests_count: int) -> float:
+    async def send(message):
+        pass
+
+    scopes = []
+    for method, path, query_string, body in REQUESTS:
+        message = {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def receive(message=message):
+            return message
+
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'query_string': query_string,
+            'headers': [],
+        }
+        scopes.append((scope, receive))
+
+    start = time.perf_counter()
+    for i in range(requests_count):
+        scope, receive = scopes[i % len(scopes)]
+        await asgi_main.app(scope, receive, send)
+    return requests_count / (time.perf_counter() - start)
+
+
+async def resolve_only(requests_count: int, route) -> float:
+    # Обработчики заменены заглушкой, меряется только диспетчеризация
+    async def stub(*args):
+        return None
+
+    patches = [
+        mock.patch.object(asgi_main, name, stub)
+        for name in ('handler_factorial', 'handler_fibonacci', 'handler_mean')
+    ]
+    router = asgi_main.Router()
+    router.add('GET', '/factorial', stub)
+    router.add('GET', '/fibonacci/{n}', stub)
+    router.add('GET', '/mean', stub)
+    patches.append(mock.patch.object(asgi_main, 'router', router))
+
+    for patch in patches:
+        patch.start()
+    try:
+        start = time.perf_counter()
+        for i in range(requests_count):
+            method, path, query_string, body = REQUESTS[i % len(REQUESTS)]
+            await route(path, method, query_string.decode(), None)
+        return requests_count / (time.perf_counter() - start)
+    finally:
+        for patch in patches:
+            patch.stop()
+
+
+def main():
+    requests_count = 100_000
+    with mock.patch('builtins.print'):
+        with mock.patch.object(
+            asgi_main, 'http_handler', legacy_http_handler
+        ):
+            before = asyncio.run(run(requests_count))
+        after = asyncio.run(run(requests_count))
+    legacy = asyncio.run(resolve_only(requests_count, legacy_route))
+    compiled = asyncio.run(resolve_only(requests_count, compiled_route))
+
+    print(f'{"":14} | {"app(), req/s":>13} | {"route(), req/s":>15}')
+    print(f'{"if/elif route":14} | {before:>13.0f} | {legacy:>15.0f}')
+    print(f'{"Router":14} | {after:>13.0f} | {compiled:>15.0f}')
+
+
+if __name__ == '__main__':
+    main()
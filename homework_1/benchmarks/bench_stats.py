@@ -0,0 +1,68 @@
+'''
+Статистики по массивам от 10^3 до 10^7 элементов: старый handler_mean
+(проверка генератором + sum/len) против stats с NumPy и без него.
+
+Время указано без json.loads - разбор тела одинаков для всех вариантов
+и печатается отдельной колонкой.
+
+Запуск из homework_1/: python -m benchmarks.bench_stats
+'''
+
+import json
+import random
+import time
+from unittest import mock
+
+from asgi_app import stats
+
+
+def legacy_mean(numbers):
+    if not isinstance(numbers, list) or (
+        not all(isinstance(n, (int, float)) for n in numbers)
+    ):
+        raise TypeError
+    return sum(numbers) / len(numbers)
+
+
+def measure(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run_stats(values):
+    data = stats.to_array(values)
+    return (
+        stats.mean(data),
+        stats.variance(data),
+        stats.median(data),
+        stats.quantile(data, 0.9),
+    )
+
+
+def main():
+    print(f'{"n":>9} | {"json, ms":>9} | {"old mean":>9} | '
+          f'{"mean":>9} | {"mean*":>9} | {"all 4":>9} | {"all 4*":>9}')
+    # Первый вызов NumPy-функций заметно дороже, прогреваем
+    run_stats([1.0, 2.0])
+    for power in range(3, 8):
+        n = 10 ** power
+        body = json.dumps([random.uniform(-1e3, 1e3) for _ in range(n)])
+
+        parse = measure(json.loads, body)
+        values = json.loads(body)
+        old = measure(legacy_mean, values)
+        mean = measure(lambda: stats.mean(stats.to_array(values)))
+        every = measure(run_stats, values)
+        # * - без NumPy, на array('d')
+        with mock.patch.object(stats, 'np', None):
+            mean_array = measure(lambda: stats.mean(stats.to_array(values)))
+            every_array = measure(run_stats, values)
+
+        print(f'{n:>9} | {parse * 1e3:>9.2f} | {old * 1e3:>9.2f} | '
+              f'{mean * 1e3:>9.2f} | {mean_array * 1e3:>9.2f} | '
+              f'{every * 1e3:>9.2f} | {every_array * 1e3:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import gzip
+import os
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+MIN_SIZE_ENV = 'SHOP_COMPRESSION_MIN_SIZE'
+LEVEL_ENV = 'SHOP_COMPRESSION_LEVEL'
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    # mtime=0: одинаковое тело сжимается в одинаковые байты
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body: bytes, level: int) -> bytes:
+    return brotli.compress(body, quality=level)
+
+
+def _zstd(body: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# Доступные кодировки в порядке предпочтения при равном q:
+# имя -> (уровень по умолчанию, функция сжатия)
+CODECS: Dict[str, Tuple[int, Callable[[bytes, int], bytes]]] = {}
+if zstandard is not None:
+    CODECS['zstd'] = (3, _zstd)
+if brotli is not None:
+    CODECS['br'] = (4, _brotli)
+CODECS['gzip'] = (6, _gzip)
+
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    # Accept-Encoding: gzip;q=0.8, br, * -> {'gzip': 0.8, 'br': 1.0, ...}
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+class Compressor:
+    '''
+    Выбор кодировки по Accept-Encoding и сжатие тела.
+
+    Тела короче minimum_size не сжимаются: на маленьких ответах
+    выигрыш в байтах меньше, чем цена сжатия и заголовков. level - один
+    уровень для всех кодировок (gzip 1-9, br 0-11, zstd 1-22); без него
+    у каждой свой по умолчанию. brotli и zstd используются, только если
+    установлены пакеты brotli и zstandard, иначе остается gzip.
+    '''
+
+    def __init__(self, minimum_size: int = 1024, level: Optional[int] = None):
+        self.minimum_size = minimum_size
+        self.level = level
+
+    @classmethod
+    def from_env(cls) -> 'Compressor':
+        '''
+        Настройки из переменных окружения SHOP_COMPRESSION_MIN_SIZE (в
+        байтах, по умолчанию 1024) и SHOP_COMPRESSION_LEVEL
+        '''
+        level = os.environ.get(LEVEL_ENV)
+        return cls(
+            minimum_size=int(os.environ.get(MIN_SIZE_ENV, '1024')),
+            level=None if level is None else int(level),
+        )
+
+    def choose(self, accept_encoding: Optional[str], size: int) -> Optional[str]:
+        '''
+        Кодировка для тела из size байт: с наибольшим q среди доступных,
+        None - отдавать как есть
+        '''
+        if size < self.minimum_size or not accept_encoding:
+            return None
+        accepted = _accepted(accept_encoding)
+        default = accepted.get('*', 0.0)
+        best, best_q = None, 0.0
+        for name in CODECS:
+            q = accepted.get(name, default)
+            if q > best_q:
+                best, best_q = name, q
+        return best
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        default_level, compress = CODECS[encoding]
+        return compress(body, default_level if self.level is None else self.level)
+
+
+class CompressionMiddleware:
+    '''
+    Сжимает ответы по Accept-Encoding запроса. Ответы, у которых уже
+    есть content-encoding (сжатые из кэша представлений, см. caching),
+    и потоковые ответы из нескольких кусков проходят как есть.
+    '''
+
+    def __init__(self, app: ASGIApp, compressor: Compressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        accept_encoding = None
+        if scope['type'] == 'http':
+            accept_encoding = Headers(scope=scope).get('accept-encoding')
+        if not accept_encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                if 'content-encoding' in Headers(raw=message['headers']):
+                    await send(message)
+                else:
+                    start = message
+                return
+            if start is None:
+                await send(message)
+                return
+
+            response_start, start = start, None
+            body = message.get('body', b'')
+            encoding = None
+            if not message.get('more_body', False):
+                encoding = self.compressor.choose(accept_encoding, len(body))
+            if encoding is not None:
+                body = self.compressor.compress(body, encoding)
+                headers = MutableHeaders(raw=list(response_start['headers']))
+                headers['content-encoding'] = encoding
+                headers['content-length'] = str(len(body))
+                headers.add_vary_header('accept-encoding')
+                response_start = {**response_start, 'headers': headers.raw}
+                message = {**message, 'body': body}
+            await send(response_start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
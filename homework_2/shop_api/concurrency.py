@@ -0,0 +1,90 @@
+import threading
+from typing import FrozenSet, Optional
+
+
+class VersionConflict(Exception):
+    '''
+    Версия объекта не совпала с ожидаемой из If-Match
+    '''
+
+
+class StripedLock:
+    '''
+    Блокировки, между которыми объекты раскладываются по id.
+
+    Одному объекту всегда достается одна и та же блокировка, так что
+    чтение-изменение-запись корзины или товара атомарно, а запись в
+    разные объекты почти никогда не ждет друг друга - в отличие от одной
+    глобальной блокировки. Памяти уходит stripes блокировок, а не по
+    одной на объект.
+    '''
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, id: int) -> threading.Lock:
+        return self._locks[id % len(self._locks)]
+
+
+def etag(version: int, encoding: Optional[str] = None) -> str:
+    '''
+    ETag версии объекта. Сжатое представление - другие байты, поэтому
+    строгий тег у него свой: "3-gzip"
+    '''
+    return f'"{version}"' if encoding is None else f'"{version}-{encoding}"'
+
+
+def _tag_version(tag: str) -> Optional[int]:
+    # "3" и "3-gzip" -> 3; слабые и чужие теги -> None
+    if len(tag) > 2 and tag[0] == tag[-1] == '"':
+        version, _, _ = tag[1:-1].partition('-')
+        if version.isdecimal():
+            return int(version)
+    return None
+
+
+def parse_if_match(header: Optional[str]) -> Optional[FrozenSet[int]]:
+    '''
+    Версии из заголовка If-Match; None - если заголовка нет или он "*".
+    If-Match сравнивает ETag строго, поэтому слабые (W/) и чужие теги
+    ни с чем не совпадают. Тег сжатого представления ("3-gzip") - та же
+    версия объекта: запись сверяется с состоянием, а не с байтами.
+    '''
+    if header is None or header.strip() == '*':
+        return None
+    versions = set()
+    for tag in header.split(','):
+        version = _tag_version(tag.strip())
+        if version is not None:
+            versions.add(version)
+    return frozenset(versions)
+
+
+def not_modified(
+    if_none_match: Optional[str],
+    version: int,
+    encoding: Optional[str] = None,
+) -> bool:
+    '''
+    Есть ли в If-None-Match ETag представления, которое GET отдал бы
+    сейчас (версия и content-encoding), - тогда он отвечает 304.
+    If-None-Match сравнивает теги слабо: W/"3" совпадает с "3", а "*" -
+    с любой версией.
+    '''
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tag = etag(version, encoding)
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == tag:
+            return True
+    return False
+
+
+def check_version(obj, if_match: Optional[FrozenSet[int]]) -> None:
+    if if_match is not None and obj.version not in if_match:
+        raise VersionConflict(obj.id)
@@ -0,0 +1,68 @@
+from dataclasses import dataclass, field
+from typing import Dict
+
+from .models import Cart, CartItem, Item
+
+
+# Хранилища держат миллионы объектов, поэтому внутри они - dataclass со
+# __slots__: без __dict__ и без проверки при каждом присваивании, как у
+# pydantic. Модели из models.py создаются только на границе API -
+# при разборе запроса и при ответе (to_model).
+
+
+@dataclass(slots=True)
+class ItemRecord:
+    id: int
+    name: str
+    price: float
+    deleted: bool = False
+    # Растет при каждом изменении; наружу отдается как ETag
+    version: int = 0
+
+    def to_model(self) -> Item:
+        return Item(
+            id=self.id, name=self.name, price=self.price, deleted=self.deleted
+        )
+
+
+@dataclass(slots=True)
+class CartLineRecord:
+    id: int
+    name: str
+    quantity: int
+    available: bool
+    # Цена товара, по которой строка учтена в цене корзины (если
+    # available); наружу не отдается
+    price: float
+
+    def to_model(self) -> CartItem:
+        return CartItem(
+            id=self.id,
+            name=self.name,
+            quantity=self.quantity,
+            available=self.available,
+        )
+
+
+@dataclass(slots=True)
+class CartRecord:
+    '''
+    Корзина в хранилище. Строки лежат в словаре id товара -> строка: он
+    сохраняет порядок добавления, а найти, добавить или удалить строку
+    можно за O(1) даже в корзине на тысячи позиций.
+    '''
+
+    id: int
+    items: Dict[int, CartLineRecord] = field(default_factory=dict)
+    price: float = 0.0
+    # Сумма quantity по items; ведется хранилищем и не попадает в ответы
+    total_quantity: int = 0
+    # Растет при каждом изменении; наружу отдается как ETag
+    version: int = 0
+
+    def to_model(self) -> Cart:
+        return Cart(
+            id=self.id,
+            items=[line.to_model() for line in self.items.values()],
+            price=self.price,
+        )
@@ -0,0 +1,171 @@
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from operator import itemgetter
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+
+class SortedIndex:
+    '''
+    Вторичный индекс: пары (ключ, id), упорядоченные по ключу, а при
+    равных ключах - по id.
+
+    Пары хранятся в корзинах по ~LOAD элементов (как в sortedcontainers),
+    поэтому вставка и удаление стоят O(log n + LOAD), а не сдвиг всего
+    списка. Порядок по id позволяет найти пару бинарным поиском, даже
+    если с таким ключом тысячи записей.
+    '''
+
+    LOAD = 1000
+
+    def __init__(self):
+        self._keys: List[List[Any]] = []
+        self._ids: List[List[int]] = []
+        self._maxes: List[Tuple[Any, int]] = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key: Any, id: int) -> None:
+        if not self._maxes:
+            self._keys.append([key])
+            self._ids.append([id])
+            self._maxes.append((key, id))
+            self._len = 1
+            return
+
+        bucket = bisect_right(self._maxes, (key, id))
+        if bucket == len(self._maxes):
+            bucket -= 1
+        keys = self._keys[bucket]
+        ids = self._ids[bucket]
+        pos = self._position(keys, ids, key, id)
+        keys.insert(pos, key)
+        ids.insert(pos, id)
+        self._maxes[bucket] = (keys[-1], ids[-1])
+        self._len += 1
+
+        if len(keys) > 2 * self.LOAD:
+            self._split(bucket)
+
+    def update(self, pairs: Iterable[Tuple[Any, int]]) -> None:
+        '''
+        Добавляет пары (ключ, id) пачкой. Если пачка не меньше индекса
+        (например, загрузка в пустой), все пары сортируются и заново
+        нарезаются на корзины за O(n log n) одной сортировкой вместо
+        вставки по одной.
+        '''
+        pairs = list(pairs)
+        if len(pairs) < self._len:
+            for key, id in pairs:
+                self.add(key, id)
+            return
+
+        pairs.extend(zip(
+            chain.from_iterable(self._keys), chain.from_iterable(self._ids)
+        ))
+        # Две устойчивые сортировки по одному полю в несколько раз быстрее
+        # одной по кортежам: числа и строки сравниваются напрямую
+        pairs.sort(key=itemgetter(1))
+        pairs.sort(key=itemgetter(0))
+        keys = list(map(itemgetter(0), pairs))
+        ids = list(map(itemgetter(1), pairs))
+        starts = range(0, len(pairs), self.LOAD)
+        self._keys = [keys[start:start + self.LOAD] for start in starts]
+        self._ids = [ids[start:start + self.LOAD] for start in starts]
+        self._maxes = [
+            (keys[-1], ids[-1]) for keys, ids in zip(self._keys, self._ids)
+        ]
+        self._len = len(pairs)
+
+    def remove(self, key: Any, id: int) -> None:
+        bucket = bisect_left(self._maxes, (key, id))
+        if bucket < len(self._maxes):
+            keys = self._keys[bucket]
+            ids = self._ids[bucket]
+            pos = self._position(keys, ids, key, id)
+            if pos < len(keys) and keys[pos] == key and ids[pos] == id:
+                del keys[pos]
+                del ids[pos]
+                self._len -= 1
+                self._shrink(bucket)
+                return
+        raise KeyError((key, id))
+
+    def range(
+        self,
+        min_key: Optional[Any] = None,
+        max_key: Optional[Any] = None,
+        offset: int = 0,
+    ) -> Iterator[int]:
+        '''
+        id с ключами из [min_key, max_key] по возрастанию ключа, начиная
+        с offset-го подходящего
+        '''
+        if min_key is None:
+            bucket, pos = 0, 0
+        else:
+            bucket = bisect_left(self._maxes, (min_key,))
+            if bucket == len(self._maxes):
+                return
+            pos = bisect_left(self._keys[bucket], min_key)
+
+        # Пропускаем offset целыми корзинами, не перебирая элементы
+        pos += offset
+        while bucket < len(self._keys) and pos >= len(self._keys[bucket]):
+            pos -= len(self._keys[bucket])
+            bucket += 1
+
+        while bucket < len(self._keys):
+            keys = self._keys[bucket]
+            ids = self._ids[bucket]
+            end = len(keys) if max_key is None else bisect_right(keys, max_key)
+            yield from ids[pos:end]
+            if end < len(keys):
+                return
+            bucket += 1
+            pos = 0
+
+    def keys(self, min_key: Optional[Any] = None) -> Iterator[Any]:
+        '''
+        Ключи начиная с min_key по возрастанию - по одному на пару
+        '''
+        if min_key is None:
+            bucket, pos = 0, 0
+        else:
+            bucket = bisect_left(self._maxes, (min_key,))
+            if bucket == len(self._maxes):
+                return
+            pos = bisect_left(self._keys[bucket], min_key)
+
+        while bucket < len(self._keys):
+            yield from self._keys[bucket][pos:]
+            bucket += 1
+            pos = 0
+
+    @staticmethod
+    def _position(keys: List[Any], ids: List[int], key: Any, id: int) -> int:
+        # Среди равных ключей id упорядочены, так что ищем бинарно
+        low = bisect_left(keys, key)
+        high = bisect_right(keys, key, low)
+        return bisect_left(ids, id, low, high)
+
+    def _split(self, bucket: int) -> None:
+        keys = self._keys[bucket]
+        ids = self._ids[bucket]
+        half = len(keys) // 2
+        self._keys[bucket:bucket + 1] = [keys[:half], keys[half:]]
+        self._ids[bucket:bucket + 1] = [ids[:half], ids[half:]]
+        self._maxes[bucket:bucket + 1] = [
+            (keys[half - 1], ids[half - 1]),
+            (keys[-1], ids[-1]),
+        ]
+
+    def _shrink(self, bucket: int) -> None:
+        keys = self._keys[bucket]
+        if keys:
+            self._maxes[bucket] = (keys[-1], self._ids[bucket][-1])
+            return
+        del self._keys[bucket]
+        del self._ids[bucket]
+        del self._maxes[bucket]
@@ -1,56 +1,101 @@
 
-from typing import List, Optional, Dict
-
-from fastapi import FastAPI, HTTPException, Query, Response, status
+import math
+
+from fastapi import (
+    Body,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel, confloat, conint
+from pydantic import ValidationError
+
+from .bulk import CartQuantities, is_ndjson, parse_new_items
+from .caching import RepresentationCache, cached_response
+from .compression import CompressionMiddleware, Compressor
+from .concurrency import VersionConflict, etag, parse_if_match
+from .execution import handler_mode
+from .ids import IdAllocator
+from .domain import CartRecord, ItemRecord
+from .models import NewItem, UpdateItem
+from .pagination import decode_cursor, paginate
+from .serialization import (
+    dump_cart,
+    dump_carts,
+    dump_item,
+    dump_items,
+    json_response,
+)
+from .store import CartStore, ItemStore
 
 
 app = FastAPI()
 
 
-class UpdateItem(BaseModel):
-    name: Optional[str] = None
-    price: Optional[float] = None
-
-    model_config = {
-        'extra': 'forbid'
-    }
-
+carts = CartStore()
+items = ItemStore()
 
-class NewItem(BaseModel):
-    name: str
-    price: confloat(gt=0)  # type: ignore
+# id выдаются блоками, без гонки глобального счетчика между потоками
+cart_ids = IdAllocator(carts.reserve_ids)
+item_ids = IdAllocator(items.reserve_ids)
 
+# Обработчики над хранилищем в памяти выполняются прямо в цикле событий,
+# без перехода в пул потоков на каждый запрос; SHOP_HANDLERS меняет режим
+endpoint = handler_mode(items.blocking)
 
-class Item(BaseModel):
-    id: int
-    name: str
-    price: confloat(gt=0)  # type: ignore
-    deleted: bool = False
+# Сжатие ответов по Accept-Encoding; порог и уровень - из переменных
+# окружения SHOP_COMPRESSION_MIN_SIZE и SHOP_COMPRESSION_LEVEL
+compressor = Compressor.from_env()
+app.add_middleware(CompressionMiddleware, compressor=compressor)
 
+# Закодированные (и сжатые) ответы GET /item/{id} и GET /cart/{cart_id}
+# по версиям
+item_cache = RepresentationCache(dump_item, compressor)
+cart_cache = RepresentationCache(dump_cart, compressor)
 
-class CartItem(BaseModel):
-    id: int
-    name: str
-    quantity: conint(gt=0)  # type: ignore
-    available: bool
 
+def _json_float(value: float):
+    # NaN и бесконечность не записываются в JSON
+    return value if math.isfinite(value) else str(value)
 
-class Cart(BaseModel):
-    id: int
-    items: List[CartItem] = []
-    price: float = 0.0
 
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(
+    request: Request, exc: RequestValidationError
+):
+    '''
+    Как стандартный ответ FastAPI на 422, но NaN и бесконечность из
+    запроса возвращаются в ошибке строками - иначе сам ответ не
+    сериализуется и превращается в 500
+    '''
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={'detail': jsonable_encoder(
+            exc.errors(), custom_encoder={float: _json_float}
+        )}
+    )
 
-carts: Dict[int, Cart] = {}
-items: Dict[int, Item] = {}
 
-cart_id_counter = 0
-item_id_counter = 0
+@app.exception_handler(VersionConflict)
+async def version_conflict_handler(request: Request, exc: VersionConflict):
+    '''
+    If-Match не совпал с текущей версией товара или корзины
+    '''
+    return JSONResponse(
+        status_code=status.HTTP_412_PRECONDITION_FAILED,
+        content={'detail': 'Объект уже изменен, перечитайте его и повторите'}
+    )
 
 
 @app.get('/')
+@endpoint
 def read_root():
     '''
     Возвращает приветственное сообщение
@@ -61,38 +106,68 @@ def read_root():
 
 
 @app.post('/item', status_code=status.HTTP_201_CREATED)
+@endpoint
 def create_item(item: NewItem, response: Response):
     '''
     Создает новый товар и возвращает его
     '''
-    global item_id_counter
-    item_id_counter += 1
-    new_item = Item(
-        id=item_id_counter,
+    new_item = ItemRecord(
+        id=item_ids.next(),
         name=item.name,
         price=item.price,
         deleted=False
     )
-    items[item_id_counter] = new_item
-    response.headers['location'] = f'/item/{item_id_counter}'
-    return new_item.model_dump()
+    items.add(new_item)
+    response.headers['location'] = f'/item/{new_item.id}'
+    response.headers['etag'] = etag(new_item.version)
+    return new_item.to_model().model_dump()
+
+
+@app.post('/item/bulk', status_code=status.HTTP_201_CREATED)
+async def create_items_bulk(request: Request):
+    '''
+    Создает пачку товаров из JSON-массива или NDJSON и возвращает их.
+    Пачка проверяется целиком до создания первого товара: при ошибке
+    не создается ни один.
+    '''
+    body = await request.body()
+    try:
+        new_items = parse_new_items(
+            body, ndjson=is_ndjson(request.headers.get('content-type', ''))
+        )
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False))
+
+    created = [
+        ItemRecord(
+            id=id, name=new_item.name, price=new_item.price, deleted=False
+        )
+        for id, new_item in zip(item_ids.take(len(new_items)), new_items)
+    ]
+    if items.blocking:
+        await run_in_threadpool(items.add_many, created)
+    else:
+        items.add_many(created)
+    return [item.to_model().model_dump() for item in created]
 
 
 @app.post('/cart', status_code=status.HTTP_201_CREATED)
+@endpoint
 def create_cart(response: Response):
     '''
     Создает новую корзину и возвращает её ID
     '''
-    global cart_id_counter
-    cart_id_counter += 1
-    cart_id = cart_id_counter
-    carts[cart_id] = Cart(id=cart_id)
+    cart_id = cart_ids.next()
+    carts.add(CartRecord(id=cart_id))
     response.headers['location'] = f'/cart/{cart_id}'
     return {'id': cart_id}
 
 
 @app.post('/cart/{cart_id}/add/{item_id}', status_code=status.HTTP_200_OK)
-def add_item_to_cart(cart_id: int, item_id: int):
+@endpoint
+def add_item_to_cart(
+    cart_id: int, item_id: int, if_match: str | None = Header(None)
+):
     '''
     Добавляет товар в корзину по ID корзины и ID товара
     '''
@@ -116,69 +191,146 @@ def add_item_to_cart(cart_id: int, item_id: int):
             detail='Этот товар недоступен :('
         )
 
-    existing_item = next(
-        (
-            cart_item for cart_item in cart.items if cart_item.id == item_id
-        ), 
-        None
+    carts.add_item(cart, item, if_match=parse_if_match(if_match))
+    return JSONResponse(
+        content={'message': 'Товар добавлен в корзину'},
+        headers={'etag': etag(cart.version)}
     )
-    
-    if existing_item:
-        existing_item.quantity += 1
-    else:
-        cart_item = CartItem(
-            id=item.id,
-            name=item.name,
-            quantity=1,
-            available=not item.deleted
+
+
+@app.post('/cart/{cart_id}/add', status_code=status.HTTP_200_OK)
+@endpoint
+def add_items_to_cart(
+    cart_id: int,
+    # Пустой словарь не меняет корзину, но поднял бы ее версию и ETag
+    quantities: CartQuantities = Body(min_length=1),
+    if_match: str | None = Header(None)
+):
+    '''
+    Добавляет в корзину товары из словаря {ID товара: количество}.
+    Сначала проверяются все товары, поэтому при ошибке корзина не
+    меняется.
+    '''
+    if cart_id not in carts:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Такой корзины нету :('
         )
-        cart.items.append(cart_item)
+    for item_id in quantities:
+        item = items.get(item_id)
+        if item is None or item.deleted:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'Товар {item_id} недоступен :('
+            )
 
-    cart.price += item.price
+    cart = carts[cart_id]
+    carts.add_items(
+        cart,
+        [(items[item_id], quantity) for item_id, quantity in quantities.items()],
+        if_match=parse_if_match(if_match)
+    )
     return JSONResponse(
-        content={'message': 'Товар добавлен в корзину'}
+        content={'message': 'Товары добавлены в корзину'},
+        headers={'etag': etag(cart.version)}
     )
 
 
 @app.get('/cart/{cart_id}')
-def get_cart_by_id(cart_id: int):
+@endpoint
+def get_cart_by_id(
+    cart_id: int,
+    if_none_match: str | None = Header(None),
+    accept_encoding: str | None = Header(None)
+):
     '''
-    Возвращает корзину по её ID.
+    Возвращает корзину по её ID. С If-None-Match текущей версии - 304
+    без тела.
     '''
     if cart_id not in carts:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='Такой корзины нету :('
         )
-    return carts[cart_id]
+    return cached_response(
+        cart_cache, carts[cart_id], if_none_match, accept_encoding
+    )
 
 
 @app.get('/cart')
+@endpoint
 def get_carts(
+    response: Response,
     offset: int = Query(0, ge=0),
     limit: int = Query(10, gt=0),
     min_price: float | None = Query(None, ge=0),
     max_price: float | None = Query(None, ge=0),
     min_quantity: int | None = Query(None, ge=0),
-    max_quantity: int | None = Query(None, ge=0)
+    max_quantity: int | None = Query(None, ge=0),
+    after_id: str | None = Query(None)
 ):
     '''
-    Возвращает список корзин с возможностью фильтрации и пагинации
+    Возвращает список корзин с возможностью фильтрации и пагинации.
+    Без фильтра по количеству вместо offset можно передать курсор
+    after_id из заголовка x-next-after-id предыдущей страницы.
     '''
-    filtered_carts = [
-        cart for cart in carts.values()
+    after = decode_cursor(after_id)
+    if after is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Некорректный after_id'
+        )
+
+    by_quantity = min_quantity is not None or max_quantity is not None
+    if by_quantity and after_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='after_id работает только без фильтра по количеству'
+        )
+
+    if by_quantity:
+        # С фильтром по количеству корзины идут по возрастанию количества
+        candidates = carts.by_quantity(min_quantity, max_quantity)
+    else:
+        candidates = carts.values(after)
+
+    filtered_carts = (
+        cart for cart in candidates
         if (min_price is None or cart.price >= min_price) and
-           (max_price is None or cart.price <= max_price) and
-           (min_quantity is None or sum(item.quantity for item in cart.items) >= min_quantity) and
-           (max_quantity is None or sum(item.quantity for item in cart.items) <= max_quantity)
-    ]
-    return filtered_carts[offset:offset + limit]
+           (max_price is None or cart.price <= max_price)
+    )
+    page = paginate(
+        filtered_carts, offset, limit, response, with_cursor=not by_quantity
+    )
+    return json_response(dump_carts(page), response)
+
+
+@app.get('/item/search')
+@endpoint
+def search_items(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, gt=0)
+):
+    '''
+    Ищет неудаленные товары, в названии которых каждое слово запроса -
+    начало какого-нибудь слова (без учета регистра, е/ё не различаются).
+    Товары идут по возрастанию id.
+    '''
+    return json_response(dump_items(items.search(q, offset, limit)), response)
 
 
 @app.get('/item/{id}')
-def get_item_by_id(id: int):
+@endpoint
+def get_item_by_id(
+    id: int,
+    if_none_match: str | None = Header(None),
+    accept_encoding: str | None = Header(None)
+):
     '''
-    Возвращает товар по его ID
+    Возвращает товар по его ID. С If-None-Match текущей версии - 304
+    без тела.
     '''
     if id not in items:
         raise HTTPException(
@@ -192,49 +344,95 @@ def get_item_by_id(id: int):
             detail='Товар удален'
         )
 
-    return items[id]
+    return cached_response(
+        item_cache, items[id], if_none_match, accept_encoding
+    )
 
 
 @app.get('/item')
+@endpoint
 def get_item(
+    response: Response,
     offset: int = Query(0, ge=0),
     limit: int = Query(10, gt=0),
     min_price: float | None = Query(None, ge=0),
     max_price: float | None = Query(None, ge=0),
-    show_deleted: bool = Query(False)
+    show_deleted: bool = Query(False),
+    after_id: str | None = Query(None)
 ):
     '''
     Возвращает список товаров с возможностью фильтрации и пагинации.
+    Без фильтра по цене вместо offset можно передать курсор after_id из
+    заголовка x-next-after-id предыдущей страницы.
     '''
-    filtered_items = [
-        item for item in items.values()
-        if (min_price is None or item.price >= min_price) and
-           (max_price is None or item.price <= max_price) and
-           (show_deleted or not item.deleted)
-    ]
-    return filtered_items[offset:offset + limit]
+    after = decode_cursor(after_id)
+    if after is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='Некорректный after_id'
+        )
+
+    by_price = min_price is not None or max_price is not None
+    if by_price and after_id is not None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='after_id работает только без фильтра по цене'
+        )
+
+    if by_price:
+        # С фильтром по цене товары идут по возрастанию цены из индекса,
+        # offset в нем и так пропускается без перебора
+        page = items.by_price(
+            min_price, max_price, offset, limit, show_deleted
+        )
+        return json_response(dump_items(page), response)
+
+    filtered_items = (
+        item for item in items.values(after)
+        if show_deleted or not item.deleted
+    )
+    page = paginate(filtered_items, offset, limit, response)
+    return json_response(dump_items(page), response)
 
 
 @app.put('/item/{id}')
-def put_item_by_id(id: int, new_item: NewItem):
+@endpoint
+def put_item_by_id(
+    id: int,
+    new_item: NewItem,
+    response: Response,
+    if_match: str | None = Header(None)
+):
     '''
     Полностью обновляет товар по его ID.
     '''
-    if id not in items.keys():
+    if id not in items:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail='Товара не существует. Только замена существующего :('
         )
         
     item = items[id]
-    item.name = new_item.name
-    item.price = new_item.price
+    items.update(
+        item,
+        name=new_item.name,
+        price=new_item.price,
+        if_match=parse_if_match(if_match)
+    )
+    carts.refresh_item(item)
+    response.headers['etag'] = etag(item.version)
 
-    return item
+    return item.to_model()
 
 
 @app.patch('/item/{id}')
-def patch_item_by_id(id: int, update_item: UpdateItem):
+@endpoint
+def patch_item_by_id(
+    id: int,
+    update_item: UpdateItem,
+    response: Response,
+    if_match: str | None = Header(None)
+):
     '''
     Частично обновляет товар по его ID.
     '''
@@ -252,16 +450,21 @@ def patch_item_by_id(id: int, update_item: UpdateItem):
             detail='Товар удален'
         )
 
-    if update_item.name is not None:
-        item.name = update_item.name
-    if update_item.price is not None:
-        item.price = update_item.price
+    items.update(
+        item,
+        name=update_item.name,
+        price=update_item.price,
+        if_match=parse_if_match(if_match)
+    )
+    carts.refresh_item(item)
+    response.headers['etag'] = etag(item.version)
 
-    return item
+    return item.to_model()
 
 
 @app.delete('/item/{id}')
-def delete_item(id: int):
+@endpoint
+def delete_item(id: int, if_match: str | None = Header(None)):
     '''
     Удаляет товар по его ID
     '''
@@ -271,5 +474,6 @@ def delete_item(id: int):
             detail='Такого товара нету :('
         )
     item = items[id]
-    item.deleted = True
+    items.delete(item, if_match=parse_if_match(if_match))
+    carts.refresh_item(item)
     return {'message': 'Товар удален'}
@@ -0,0 +1,38 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, confloat, conint
+
+
+class UpdateItem(BaseModel):
+    name: Optional[str] = None
+    # Проверяется до записи: неверная цена не должна попасть в хранилище
+    price: Optional[confloat(gt=0, allow_inf_nan=False)] = None  # type: ignore
+
+    model_config = {
+        'extra': 'forbid'
+    }
+
+
+class NewItem(BaseModel):
+    name: str
+    price: confloat(gt=0, allow_inf_nan=False)  # type: ignore
+
+
+class Item(BaseModel):
+    id: int
+    name: str
+    price: confloat(gt=0)  # type: ignore
+    deleted: bool = False
+
+
+class CartItem(BaseModel):
+    id: int
+    name: str
+    quantity: conint(gt=0)  # type: ignore
+    available: bool
+
+
+class Cart(BaseModel):
+    id: int
+    items: List[CartItem] = []
+    price: float = 0.0
@@ -0,0 +1,63 @@
+from typing import Iterable, List
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from .domain import CartLineRecord, CartRecord, ItemRecord
+
+
+class _CartJSON(TypedDict):
+    # Корзина в ответе: строки списком, без служебных полей CartRecord
+    id: int
+    items: List[CartLineRecord]
+    price: float
+
+
+# Записи хранилища сериализуются pydantic-core прямо в байты: без
+# моделей Item/Cart на каждый объект и без jsonable_encoder, через
+# который FastAPI прогоняет возвращенные списки перед json.dumps
+_item_adapter = TypeAdapter(ItemRecord)
+_items_adapter = TypeAdapter(List[ItemRecord])
+_cart_adapter = TypeAdapter(_CartJSON)
+_carts_adapter = TypeAdapter(List[_CartJSON])
+
+_ITEM_EXCLUDE = {'version'}
+_CART_EXCLUDE = {'items': {'__all__': {'price'}}}
+
+
+def _cart_json(cart: CartRecord) -> _CartJSON:
+    return {'id': cart.id, 'items': list(cart.items.values()), 'price': cart.price}
+
+
+def dump_item(item: ItemRecord) -> bytes:
+    return _item_adapter.dump_json(item, exclude=_ITEM_EXCLUDE)
+
+
+def dump_items(items: Iterable[ItemRecord]) -> bytes:
+    return _items_adapter.dump_json(
+        list(items), exclude={'__all__': _ITEM_EXCLUDE}
+    )
+
+
+def dump_cart(cart: CartRecord) -> bytes:
+    return _cart_adapter.dump_json(_cart_json(cart), exclude=_CART_EXCLUDE)
+
+
+def dump_carts(carts: Iterable[CartRecord]) -> bytes:
+    return _carts_adapter.dump_json(
+        [_cart_json(cart) for cart in carts],
+        exclude={'__all__': _CART_EXCLUDE},
+    )
+
+
+def json_response(content: bytes, response: Response) -> Response:
+    '''
+    Готовый JSON в ответ. FastAPI не переносит заголовки из параметра
+    response в возвращенный Response, поэтому копируем их сами
+    '''
+    return Response(
+        content=content,
+        media_type='application/json',
+        headers=dict(response.headers),
+    )
@@ -0,0 +1,69 @@
+'''
+Импорт каталога и наполнение корзины: по запросу на товар (POST /item,
+POST /cart/{cart_id}/add/{item_id}) против пакетных POST /item/bulk
+(JSON и NDJSON) и POST /cart/{cart_id}/add.
+
+Запуск из homework_3/: python -m benchmarks.bench_bulk
+'''
+
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from server.shop_api import app
+
+ITEMS_COUNT = 2_000
+UNITS_PER_ITEM = 3
+
+
+def main():
+    client = TestClient(app)
+    catalog = [
+        {'name': f'Товар {i}', 'price': 1.0 + i % 500} for i in range(ITEMS_COUNT)
+    ]
+
+    start = time.perf_counter()
+    ids = [client.post('/item', json=item).json()['id'] for item in catalog]
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    client.post('/item/bulk', json=catalog)
+    bulk_json = time.perf_counter() - start
+
+    ndjson = '\n'.join(json.dumps(item) for item in catalog).encode()
+    start = time.perf_counter()
+    client.post(
+        '/item/bulk',
+        content=ndjson,
+        headers={'content-type': 'application/x-ndjson'},
+    )
+    bulk_ndjson = time.perf_counter() - start
+
+    print(f'{ITEMS_COUNT} товаров')
+    print(f'  POST /item x{ITEMS_COUNT}: {single * 1e3:>9.1f} ms')
+    print(f'  POST /item/bulk (JSON):   {bulk_json * 1e3:>9.1f} ms')
+    print(f'  POST /item/bulk (NDJSON): {bulk_ndjson * 1e3:>9.1f} ms')
+
+    cart_id = client.post('/cart').json()['id']
+    start = time.perf_counter()
+    for id in ids:
+        for _ in range(UNITS_PER_ITEM):
+            client.post(f'/cart/{cart_id}/add/{id}')
+    single = time.perf_counter() - start
+
+    cart_id = client.post('/cart').json()['id']
+    start = time.perf_counter()
+    client.post(
+        f'/cart/{cart_id}/add', json={str(id): UNITS_PER_ITEM for id in ids}
+    )
+    bulk = time.perf_counter() - start
+
+    units = ITEMS_COUNT * UNITS_PER_ITEM
+    print(f'{units} единиц в корзину')
+    print(f'  POST /cart/{{id}}/add/{{item_id}} x{units}: {single * 1e3:>9.1f} ms')
+    print(f'  POST /cart/{{id}}/add:               {bulk * 1e3:>9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
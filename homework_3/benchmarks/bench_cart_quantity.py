@@ -0,0 +1,95 @@
+'''
+GET /cart с фильтром по количеству на 100 000 корзин по 50 строк:
+суммирование строк каждой корзины (как было в get_carts) против
+индекса CartStore по total_quantity.
+
+Строки корзин берутся из общего пула объектов, чтобы не создавать
+5 млн моделей ради замера.
+
+Запуск из homework_3/: python -m benchmarks.bench_cart_quantity
+'''
+
+import random
+import time
+from itertools import islice
+
+from server.domain import CartLineRecord, CartRecord
+from server.models import Cart
+from server.store import CartStore
+
+CARTS_COUNT = 100_000
+LINES_PER_CART = 50
+QUERIES = [
+    # min_quantity, max_quantity, offset, limit
+    (2500, 2510, 0, 10),
+    (None, 2300, 0, 10),
+    (2700, None, 100, 100),
+]
+
+
+def legacy_filter(carts, min_quantity, max_quantity, offset, limit):
+    filtered_carts = [
+        cart for cart in carts.values()
+        if (min_quantity is None or sum(item.quantity for item in cart.items) >= min_quantity) and
+           (max_quantity is None or sum(item.quantity for item in cart.items) <= max_quantity)
+    ]
+    return filtered_carts[offset:offset + limit]
+
+
+def indexed_filter(store, min_quantity, max_quantity, offset, limit):
+    candidates = store.by_quantity(min_quantity, max_quantity)
+    return list(islice(candidates, offset, offset + limit))
+
+
+def measure(func, *args, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    random.seed(0)
+    pool = [
+        CartLineRecord(id=id, name=f'Товар {id}',
+                       quantity=random.randint(1, 100), available=True,
+                       price=1.0)
+        for id in range(10_000)
+    ]
+
+    legacy = {}
+    store = CartStore()
+    for id in range(1, CARTS_COUNT + 1):
+        lines = random.sample(pool, LINES_PER_CART)
+        legacy[id] = Cart(id=id, items=[line.to_model() for line in lines])
+        cart = CartRecord(id=id, items={line.id: line for line in lines})
+        store.add(cart)
+        store.add_quantity(cart, sum(line.quantity for line in lines))
+
+    # Стоимость поддержки индекса на одно добавление товара в корзину
+    updates = random.choices(range(1, CARTS_COUNT + 1), k=100_000)
+    start = time.perf_counter()
+    for id in updates:
+        store.add_quantity(store[id], 1)
+    elapsed = time.perf_counter() - start
+    print(f'add_quantity: {elapsed / len(updates) * 1e6:.2f} us')
+
+    print(f'{"query":>26} | {"scan, ms":>9} | {"index, ms":>9}')
+    for query in QUERIES:
+        min_quantity, max_quantity, _, _ = query
+        found = indexed_filter(store, *query)
+        assert len(found) == len(legacy_filter(legacy, *query))
+        assert all(
+            (min_quantity is None or cart.total_quantity >= min_quantity)
+            and (max_quantity is None or cart.total_quantity <= max_quantity)
+            for cart in found
+        )
+        scan = measure(legacy_filter, legacy, *query, repeat=1)
+        index = measure(indexed_filter, store, *query)
+        print(f'{str(query):>26} | {scan * 1e3:>9.1f} | {index * 1e3:>9.4f}')
+
+
+if __name__ == '__main__':
+    main()
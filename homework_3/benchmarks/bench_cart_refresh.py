@@ -0,0 +1,79 @@
+'''
+Смена цены товара, который лежит в 1% из 1 000 000 корзин: перебор всех
+корзин (как пришлось бы без индекса) против CartStore.refresh_item по
+обратному индексу товар -> корзины.
+
+Запуск из homework_3/: python -m benchmarks.bench_cart_refresh
+'''
+
+import random
+import time
+
+from server.domain import CartLineRecord, CartRecord, ItemRecord
+from server.store import CartStore, sync_line
+
+CARTS_COUNT = 1_000_000
+SHARE = 0.01
+FILLER_ITEMS = 1_000
+UPDATES = 5
+
+
+def line(item):
+    return CartLineRecord(
+        id=item.id, name=item.name, quantity=1, available=True,
+        price=item.price,
+    )
+
+
+def build(hot):
+    rng = random.Random(0)
+    fillers = [
+        ItemRecord(id=id, name=f'Товар {id}', price=float(id))
+        for id in range(2, FILLER_ITEMS + 2)
+    ]
+    carts = CartStore()
+    for id in range(1, CARTS_COUNT + 1):
+        lines = [rng.choice(fillers)]
+        if rng.random() < SHARE:
+            lines.append(hot)
+        carts.add(CartRecord(
+            id=id,
+            items={item.id: line(item) for item in lines},
+            price=sum(item.price for item in lines),
+            total_quantity=len(lines),
+        ))
+    return carts
+
+
+def full_scan(carts, item):
+    for cart in carts.values():
+        if item.id in cart.items and sync_line(cart, item):
+            cart.version += 1
+
+
+def main():
+    hot = ItemRecord(id=1, name='Ходовой товар', price=100.0)
+    start = time.perf_counter()
+    carts = build(hot)
+    affected = sum(1 for cart in carts.values() if hot.id in cart.items)
+    print(f'build: {time.perf_counter() - start:.1f} s, '
+          f'{affected:,} of {CARTS_COUNT:,} carts hold the item')
+
+    for name, refresh in (('full scan', full_scan),
+                          ('reverse index', CartStore.refresh_item)):
+        best = float('inf')
+        for _ in range(UPDATES):
+            hot.price += 1.0
+            start = time.perf_counter()
+            refresh(carts, hot)
+            best = min(best, time.perf_counter() - start)
+        print(f'{name:>14}: {best * 1e3:>8.2f} ms per price update')
+
+    assert all(
+        cart.items[hot.id].price == hot.price
+        for cart in carts.values() if hot.id in cart.items
+    )
+
+
+if __name__ == '__main__':
+    main()
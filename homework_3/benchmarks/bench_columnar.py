@@ -0,0 +1,117 @@
+'''
+GET /item?min_price=..&max_price=..&show_deleted=false на 10^5, 10^6 и
+10^7 товарах (10% удалены): перебор объектов с предикатом в Python (как
+было в get_item), ItemStore.by_price и ColumnarItemStore.by_price.
+
+На 10^7 объектные варианты не запускаются - им не хватает памяти. Имен
+1000 разных: колоночное хранилище интернирует их, как и в жизни, где
+названия повторяются.
+
+Запуск из homework_3/: python -m benchmarks.bench_columnar
+'''
+
+import random
+import time
+
+import numpy as np
+
+from server.columnar_store import ColumnarItemStore
+from server.domain import ItemRecord
+from server.store import ItemStore
+
+SIZES = (100_000, 1_000_000, 10_000_000)
+OBJECTS_LIMIT = 1_000_000
+BATCH = 1_000_000
+UPDATES = 1_000
+QUERIES = [
+    # min_price, max_price, offset, limit
+    (100.0, 110.0, 0, 10),
+    (100.0, 900.0, 0, 10),
+    (100.0, 900.0, 10_000, 100),
+    (None, 5.0, 0, 1000),
+]
+
+
+def legacy_filter(items, min_price, max_price, offset, limit):
+    filtered_items = [
+        item for item in items.values()
+        if (min_price is None or item.price >= min_price) and
+           (max_price is None or item.price <= max_price) and
+           not item.deleted
+    ]
+    return filtered_items[offset:offset + limit]
+
+
+def measure(func, *args, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def catalog(size, first):
+    rng = np.random.default_rng(first)
+    prices = np.round(rng.uniform(1, 1000, BATCH), 2).tolist()
+    for id in range(first, min(first + BATCH, size + 1)):
+        yield ItemRecord(
+            id=id, name=f'Товар {id % 1000}', price=prices[id - first]
+        )
+
+
+def fill(store, size, deleted):
+    start = time.perf_counter()
+    for first in range(1, size + 1, BATCH):
+        store.add_many(catalog(size, first))
+    for id in deleted:
+        store.delete(store[id])
+    return time.perf_counter() - start
+
+
+def run(size):
+    rng = random.Random(size)
+    deleted = rng.sample(range(1, size + 1), size // 10)
+    updates = [
+        (id, round(rng.uniform(1, 1000), 2))
+        for id in rng.sample(range(1, size + 1), UPDATES)
+    ]
+    stores = {'columnar': ColumnarItemStore()}
+    if size <= OBJECTS_LIMIT:
+        stores['index'] = ItemStore()
+
+    for name, store in stores.items():
+        elapsed = fill(store, size, deleted)
+        print(f'{size:>10,} {name:>8}: load {elapsed:.1f} s', end='')
+        start = time.perf_counter()
+        for id, price in updates:
+            store.update(store[id], price=price)
+        elapsed = (time.perf_counter() - start) / UPDATES
+        print(f', price update {elapsed * 1e6:.0f} us')
+
+    columnar = stores['columnar']
+    index = stores.get('index')
+    if index is not None:
+        legacy = {item.id: item for item in index.values()}
+    for query in QUERIES:
+        found = columnar.by_price(*query)
+        times = [measure(columnar.by_price, *query)]
+        if index is not None:
+            # Перебор отдает товары по id, а не по цене - сверяем число
+            assert found == index.by_price(*query)
+            assert len(found) == len(legacy_filter(legacy, *query))
+            times.append(measure(index.by_price, *query))
+            times.append(measure(legacy_filter, legacy, *query, repeat=1))
+        cells = ' | '.join(f'{t * 1e3:>9.3f}' for t in times)
+        print(f'{size:>10,} {str(query):>28} | {cells}')
+
+
+def main():
+    print(f'{"items":>10} {"query":>28} | columnar, ms | index, ms | '
+          'scan, ms')
+    for size in SIZES:
+        run(size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Размер и цена сжатия страниц GET /item (10, 100, 1000 товаров) и
+GET /cart (10 корзин по 50 строк) для каждой доступной кодировки и
+нескольких уровней. Показывает, с какого размера тела сжатие окупается,
+и сколько стоит попадание в кэш сжатых представлений.
+
+Запуск из homework_3/: python -m benchmarks.bench_compression
+'''
+
+import time
+
+from server.caching import RepresentationCache
+from server.compression import CODECS, Compressor
+from server.domain import CartLineRecord, CartRecord, ItemRecord
+from server.serialization import dump_cart, dump_carts, dump_items
+
+LEVELS = (1, None, 9)
+LINES_PER_CART = 50
+
+
+def measure(func, *args, budget: float = 0.2) -> float:
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < budget:
+        func(*args)
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    items = [
+        ItemRecord(id=id, name=f'Товар {id}', price=round(id * 1.37, 2))
+        for id in range(1, 1001)
+    ]
+    carts = [
+        CartRecord(
+            id=id,
+            items={
+                item.id: CartLineRecord(
+                    id=item.id, name=item.name, quantity=id % 5 + 1,
+                    available=True, price=item.price,
+                )
+                for item in items[id:id + LINES_PER_CART]
+            },
+        )
+        for id in range(1, 11)
+    ]
+    pages = [
+        ('items, 10', dump_items(items[:10])),
+        ('items, 100', dump_items(items[:100])),
+        ('items, 1000', dump_items(items)),
+        ('carts, 10', dump_carts(carts)),
+    ]
+
+    print(f'{"page":>12} | {"codec":>5} | {"level":>7} | {"bytes":>7} | '
+          f'{"ratio":>5} | {"us":>8}')
+    for name, body in pages:
+        print(f'{name:>12} | {"-":>5} | {"-":>7} | {len(body):>7,} | '
+              f'{1:>5.2f} | {0:>8.1f}')
+        for codec in CODECS:
+            for level in LEVELS:
+                compressor = Compressor(level=level)
+                packed = compressor.compress(body, codec)
+                took = measure(compressor.compress, body, codec)
+                print(f'{name:>12} | {codec:>5} | {str(level):>7} | '
+                      f'{len(packed):>7,} | {len(body) / len(packed):>5.2f} | '
+                      f'{took * 1e6:>8.1f}')
+
+    cache = RepresentationCache(dump_cart, Compressor())
+    cart = carts[0]
+    cache.get(cart, 'gzip')
+    print(f'\ncart cache hit, gzip: {measure(cache.get, cart, "gzip") * 1e6:.2f} us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''
+Опрос корзины на 50 строк, как это делает фронтенд: GET /cart/{id}
+без заголовков (200, тело из кэша представлений) против GET с
+If-None-Match последнего ETag (304 без тела). Плюс цена самого
+представления: модель Cart через jsonable_encoder (как было), dump_cart
+и попадание в RepresentationCache.
+
+Запросы идут через httpx.ASGITransport, без сети; хранилище - по
+SHOP_STORAGE, по умолчанию в памяти.
+
+Запуск из homework_3/: python -m benchmarks.bench_conditional_get
+'''
+
+import asyncio
+import time
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server.caching import RepresentationCache
+from server.serialization import dump_cart
+from server.shop_api import app, carts
+
+LINES = 50
+POLLS = 5_000
+
+
+def measure(func, *args, repeat: int = 10_000) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+async def poll(client, url, headers):
+    received = 0
+    start = time.perf_counter()
+    for _ in range(POLLS):
+        response = await client.get(url, headers=headers)
+        received += len(response.content)
+    return POLLS / (time.perf_counter() - start), received / POLLS
+
+
+async def main():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url='http://shop'
+    ) as client:
+        response = await client.post('/item/bulk', json=[
+            {'name': f'Товар {i}', 'price': 10.0 + i} for i in range(LINES)
+        ])
+        item_ids = [item['id'] for item in response.json()]
+        cart_id = (await client.post('/cart')).json()['id']
+        await client.post(
+            f'/cart/{cart_id}/add', json={str(id): 2 for id in item_ids}
+        )
+        url = f'/cart/{cart_id}'
+        tag = (await client.get(url)).headers['etag']
+
+        print(f'{"poll":>14} | {"req/s":>7} | {"body, bytes":>11}')
+        for name, headers in (('200 from cache', {}),
+                              ('304', {'if-none-match': tag})):
+            rps, size = await poll(client, url, headers)
+            print(f'{name:>14} | {rps:>7,.0f} | {size:>11,.0f}')
+
+    cart = carts[cart_id]
+    cache = RepresentationCache(dump_cart)
+    legacy = measure(
+        lambda: JSONResponse(jsonable_encoder(cart.to_model())).body
+    )
+    print(f'\nlegacy model: {legacy * 1e6:.1f} us, '
+          f'dump_cart: {measure(dump_cart, cart) * 1e6:.1f} us, '
+          f'cache hit: {measure(cache.get, cart) * 1e6:.2f} us')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+'''
+Нагрузка на shop_api с хранилищем в памяти при 1, 50 и 500 одновременных
+клиентах: обработчики async (в цикле событий) против обычных def (через
+пул потоков). Запросы идут через httpx.ASGITransport, без сети, так что
+разница - это именно переход в пул потоков и ожидание свободного потока.
+
+Смесь запросов: 70% GET /item/{id}, 20% GET /item?limit=10,
+10% POST /cart/{id}/add/{item_id}.
+
+Запуск из homework_3/: python -m benchmarks.bench_handlers
+'''
+
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+MODES = ('threadpool', 'async')
+CONCURRENCY = (1, 50, 500)
+REQUESTS = 5_000
+ITEMS_COUNT = 1_000
+CARTS_COUNT = 100
+
+
+def pick_request(rng):
+    roll = rng.random()
+    if roll < 0.7:
+        return 'GET', f'/item/{rng.randint(1, ITEMS_COUNT)}'
+    if roll < 0.9:
+        return 'GET', f'/item?limit=10&offset={rng.randint(0, ITEMS_COUNT - 10)}'
+    cart_id = rng.randint(1, CARTS_COUNT)
+    return 'POST', f'/cart/{cart_id}/add/{rng.randint(1, ITEMS_COUNT)}'
+
+
+async def load(client, concurrency):
+    rng = random.Random(concurrency)
+    plan = [pick_request(rng) for _ in range(REQUESTS)]
+    latencies = []
+
+    async def worker(requests):
+        for method, url in requests:
+            start = time.perf_counter()
+            response = await client.request(method, url)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(worker(plan[i::concurrency]) for i in range(concurrency))
+    )
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return REQUESTS / elapsed, quantiles[49], quantiles[98]
+
+
+async def run(mode):
+    from server.shop_api import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url='http://shop'
+    ) as client:
+        await client.post('/item/bulk', json=[
+            {'name': f'Товар {i}', 'price': 1.0 + i} for i in range(ITEMS_COUNT)
+        ])
+        for _ in range(CARTS_COUNT):
+            await client.post('/cart')
+
+        for concurrency in CONCURRENCY:
+            rps, p50, p99 = await load(client, concurrency)
+            print(
+                f'{mode:>10} | {concurrency:>7} | {rps:>9,.0f} | '
+                f'{p50 * 1e3:>8.2f} | {p99 * 1e3:>8.2f}',
+                flush=True,
+            )
+
+
+def main():
+    if len(sys.argv) > 1:
+        asyncio.run(run(sys.argv[1]))
+        return
+
+    # Режим выбирается при импорте shop_api, поэтому каждый - в своем
+    # процессе
+    print(f'{"mode":>10} | {"clients":>7} | {"req/s":>9} | '
+          f'{"p50, ms":>8} | {"p99, ms":>8}', flush=True)
+    for mode in MODES:
+        env = dict(os.environ, SHOP_STORAGE='memory', SHOP_HANDLERS=mode)
+        subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_handlers', mode],
+            env=env,
+            check=True,
+        )
+
+
+if __name__ == '__main__':
+    main()
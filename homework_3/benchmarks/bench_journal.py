@@ -0,0 +1,118 @@
+'''
+Хранилище в памяти с журналом (SHOP_STORAGE=journal): время запуска с
+миллионом товаров из снимка и из одного журнала без снимка, и пропускная
+способность записи (PATCH товара) при разном числе параллельных
+запросов для режимов sync: group (общий fsync на пачку), always (fsync
+на каждую запись) и none (без fsync).
+
+Каталог журнала создается в текущем каталоге (а не в /tmp, который
+бывает в памяти), чтобы fsync шел на настоящий диск; после замера он
+удаляется. SHOP_JOURNAL_BENCH_DIR задает другой каталог.
+
+Запуск из homework_3/: python -m benchmarks.bench_journal
+'''
+
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from server.domain import ItemRecord
+from server.journal import open_journal
+
+N = 1_000_000
+BATCH = 10_000
+WRITES = 2_000
+THREADS = (1, 8, 64)
+
+
+def fill(path: str, count: int, snapshot: bool) -> None:
+    rng = random.Random(1)
+    items, _ = open_journal(path, sync='none', snapshot_every=10 * count)
+    for first in range(1, count + 1, BATCH):
+        items.add_many(
+            ItemRecord(
+                id=id, name=f'Товар {id}', price=round(rng.uniform(1, 1e4), 2)
+            )
+            for id in range(first, min(first + BATCH, count + 1))
+        )
+    if snapshot:
+        items._journal.snapshot()
+    items._journal.close()
+
+
+def startup(path: str) -> float:
+    start = time.perf_counter()
+    items, _ = open_journal(path, snapshot_every=10 * N)
+    took = time.perf_counter() - start
+    assert len(items) == N
+    items._journal.close()
+    return took
+
+
+def fsync_latency(path: str, repeat: int = 1_000) -> float:
+    with open(path, 'ab') as file:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            file.write(b'{}\n')
+            file.flush()
+            os.fsync(file.fileno())
+        return (time.perf_counter() - start) / repeat
+
+
+def throughput(path: str, sync: str, threads: int) -> float:
+    items, _ = open_journal(path, sync=sync, snapshot_every=10 * WRITES)
+    items.add_many(
+        ItemRecord(id=id, name=f'Товар {id}', price=1.0)
+        for id in range(1, threads + 1)
+    )
+
+    def patch(id: int) -> None:
+        item = items[id]
+        for price in range(WRITES // threads):
+            items.update(item, price=float(price))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(patch, range(1, threads + 1)))
+    took = time.perf_counter() - start
+    items._journal.close()
+    return WRITES // threads * threads / took
+
+
+def main():
+    root = tempfile.mkdtemp(
+        dir=os.environ.get('SHOP_JOURNAL_BENCH_DIR', '.'), prefix='journal-'
+    )
+    try:
+        for snapshot in (True, False):
+            path = os.path.join(root, f'startup-{snapshot}')
+            fill(path, N, snapshot)
+            size = sum(
+                os.path.getsize(os.path.join(path, name))
+                for name in os.listdir(path)
+            )
+            source = 'snapshot' if snapshot else 'log only'
+            print(f'startup, {N:,} items, {source}: {startup(path):.1f} s '
+                  f'({size / 2 ** 20:.0f} MB)')
+            shutil.rmtree(path)
+
+        # Выигрыш group commit растет с ценой fsync: на диске с
+        # кэшем записи она мала, и запись упирается в сам Python
+        latency = fsync_latency(os.path.join(root, 'fsync'))
+        print(f'\nfsync: {latency * 1e6:.0f} us')
+        print(f'{"sync":>6} | {"threads":>7} | {"writes/s":>9}')
+        for sync in ('group', 'always', 'none'):
+            for threads in THREADS:
+                path = os.path.join(root, f'{sync}-{threads}')
+                rate = throughput(path, sync, threads)
+                print(f'{sync:>6} | {threads:>7} | {rate:>9,.0f}')
+                shutil.rmtree(path)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
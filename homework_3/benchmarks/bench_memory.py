@@ -0,0 +1,43 @@
+'''
+Память на хранение 1 000 000 товаров: pydantic-модели Item (как
+хранилось раньше) против слотовых ItemRecord из server.domain. По
+tracemalloc считается словарь id -> объект, как ItemStore._data, без
+индексов; время сборки под tracemalloc завышено.
+
+Запуск из homework_3/: python -m benchmarks.bench_memory
+'''
+
+import gc
+import time
+import tracemalloc
+
+from server.domain import ItemRecord
+from server.models import Item
+
+ITEMS_COUNT = 1_000_000
+
+
+def measure(factory):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    stored = {
+        id: factory(id=id, name=f'Товар {id}', price=1.0 + id % 1000)
+        for id in range(1, ITEMS_COUNT + 1)
+    }
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del stored
+    return size / ITEMS_COUNT, elapsed
+
+
+def main():
+    print(f'{"storage":>12} | {"bytes/item":>10} | {"build, s":>8}')
+    for name, factory in (('pydantic', Item), ('ItemRecord', ItemRecord)):
+        per_item, elapsed = measure(factory)
+        print(f'{name:>12} | {per_item:>10,.0f} | {elapsed:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+GET /item с фильтром по цене на 1 000 000 товаров: полный перебор
+словаря (как было в get_item) против ItemStore.by_price.
+
+Запуск из homework_3/: python -m benchmarks.bench_price_index
+'''
+
+import random
+import time
+
+from server.domain import ItemRecord
+from server.store import ItemStore
+
+ITEMS_COUNT = 1_000_000
+QUERIES = [
+    # min_price, max_price, offset, limit
+    (100.0, 110.0, 0, 10),
+    (100.0, 900.0, 0, 10),
+    (100.0, 900.0, 10_000, 100),
+    (None, 5.0, 0, 1000),
+]
+
+
+def legacy_filter(items, min_price, max_price, offset, limit):
+    filtered_items = [
+        item for item in items.values()
+        if (min_price is None or item.price >= min_price) and
+           (max_price is None or item.price <= max_price) and
+           not item.deleted
+    ]
+    return filtered_items[offset:offset + limit]
+
+
+def measure(func, *args, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    random.seed(0)
+    start = time.perf_counter()
+    items = [
+        ItemRecord(
+            id=id, name=f'Товар {id}', price=round(random.uniform(1, 1000), 2)
+        )
+        for id in range(1, ITEMS_COUNT + 1)
+    ]
+    print(f'models: {time.perf_counter() - start:.1f} s')
+
+    legacy = {item.id: item for item in items}
+    start = time.perf_counter()
+    store = ItemStore()
+    for item in items:
+        store.add(item)
+    elapsed = time.perf_counter() - start
+    print(
+        f'index build: {elapsed:.1f} s '
+        f'({elapsed / ITEMS_COUNT * 1e6:.2f} us/item)'
+    )
+
+    start = time.perf_counter()
+    for item in random.sample(items, 10_000):
+        store.update(item, price=round(random.uniform(1, 1000), 2))
+    elapsed = time.perf_counter() - start
+    print(f'price update: {elapsed / 10_000 * 1e6:.2f} us')
+
+    print(f'{"query":>34} | {"scan, ms":>9} | {"index, ms":>9}')
+    for query in QUERIES:
+        min_price, max_price, _, _ = query
+        found = store.by_price(*query)
+        assert len(found) == len(legacy_filter(legacy, *query))
+        assert all(
+            (min_price is None or item.price >= min_price)
+            and (max_price is None or item.price <= max_price)
+            for item in found
+        )
+        scan = measure(legacy_filter, legacy, *query, repeat=2)
+        index = measure(store.by_price, *query)
+        print(f'{str(query):>34} | {scan * 1e3:>9.2f} | {index * 1e3:>9.4f}')
+
+
+if __name__ == '__main__':
+    main()
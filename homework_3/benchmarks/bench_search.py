@@ -0,0 +1,118 @@
+'''
+Поиск по названиям GET /item/search на миллионе товаров: NameIndex
+(обратный индекс по словам и префиксам) против перебора всех названий,
+как пришлось бы без индекса, и SQLite FTS5 на той же выборке. Плюс время
+построения индекса и цена поддержки его при переименовании.
+
+Названия собираются из русских прилагательных, существительных и
+артикулов, так что есть и частые слова (десятки тысяч товаров), и
+редкие (единицы).
+
+Запуск из homework_3/: python -m benchmarks.bench_search
+'''
+
+import os
+import random
+import tempfile
+import time
+
+from server.domain import ItemRecord
+from server.search import NameIndex, normalize, tokenize
+from server.sqlite_store import SQLiteDatabase, SQLiteItemStore
+
+N = 1_000_000
+LIMIT = 10
+
+ADJECTIVES = (
+    'красный синий зелёный белый черный большой малый детский '
+    'стеклянный деревянный металлический ёлочный садовый кухонный'
+).split()
+NOUNS = (
+    'чайник стол стул шар гирлянда лампа ковер ведро нож ложка '
+    'кружка тарелка подушка одеяло фонарь зонт рюкзак ёжик'
+).split()
+QUERIES = (
+    'чайник', 'ЧАЙ', 'елочн', 'ёлочный гирл', 'красный стул',
+    'синий зонт арт-12', 'подушка арт-99999', 'ковер ш', 'шкаф',
+)
+
+
+def make_names(count: int) -> list:
+    rng = random.Random(1)
+    return [
+        f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} арт-{rng.randrange(10 ** 6)}'
+        for _ in range(count)
+    ]
+
+
+def scan(names: list, query: str, limit: int) -> list:
+    # Без индекса: токенизировать каждое название до первых limit совпадений
+    prefixes = tokenize(query)
+    found = []
+    for id, name in enumerate(names, 1):
+        words = tokenize(name)
+        if all(any(word.startswith(p) for word in words) for p in prefixes):
+            found.append(id)
+            if len(found) == limit:
+                break
+    return found
+
+
+def measure(func, *args, budget: float = 0.3) -> float:
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < budget:
+        func(*args)
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    names = make_names(N)
+
+    start = time.perf_counter()
+    index = NameIndex()
+    for id, name in enumerate(names, 1):
+        index.add(id, name)
+    print(f'NameIndex build, {N:,} names: {time.perf_counter() - start:.1f} s')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLiteDatabase(os.path.join(tmp, 'shop.db'))
+        store = SQLiteItemStore(db)
+        start = time.perf_counter()
+        store.add_many(
+            ItemRecord(id=id, name=name, price=1.0)
+            for id, name in enumerate(names, 1)
+        )
+        print(f'SQLite + FTS5 load: {time.perf_counter() - start:.1f} s\n')
+
+        print(f'{"query":>20} | {"index, us":>9} | {"fts5, us":>9} | '
+              f'{"scan, ms":>9} | {"found":>5}')
+        # Плюс запросы по артикулу существующего товара
+        _, noun, article = names[N // 2].split()
+        for query in (*QUERIES, article, f'{noun} {article}'):
+            found = index.search(query, 0, LIMIT)
+            assert found == scan(names, query, LIMIT)
+            assert found == [item.id for item in store.search(query, 0, LIMIT)]
+            took = measure(index.search, query, 0, LIMIT)
+            took_fts = measure(store.search, query, 0, LIMIT)
+            start = time.perf_counter()
+            scan(names, query, LIMIT)
+            took_scan = time.perf_counter() - start
+            print(f'{query:>20} | {took * 1e6:>9.1f} | {took_fts * 1e6:>9.1f} | '
+                  f'{took_scan * 1e3:>9.1f} | {len(found):>5}')
+        db.close()
+
+    # Переименование = удаление из индекса и добавление заново
+    rng = random.Random(2)
+    renames = [(rng.randrange(1, N + 1), normalize(rng.choice(NOUNS)))
+               for _ in range(10_000)]
+    start = time.perf_counter()
+    for id, name in renames:
+        index.remove(id)
+        index.add(id, name)
+    took = (time.perf_counter() - start) / len(renames)
+    print(f'\nrename: {took * 1e6:.1f} us')
+
+
+if __name__ == '__main__':
+    main()
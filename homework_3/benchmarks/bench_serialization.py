@@ -0,0 +1,71 @@
+'''
+Цена сериализации страницы GET /item и GET /cart на 10, 100 и 1000
+объектов: как было (модели Item/Cart из записей, jsonable_encoder и
+JSONResponse - то, что FastAPI делает с возвращенным списком) против
+dump_items/dump_carts из server.serialization.
+
+Запуск из homework_3/: python -m benchmarks.bench_serialization
+'''
+
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from server.domain import CartLineRecord, CartRecord, ItemRecord
+from server.serialization import dump_carts, dump_items
+
+PAGE_SIZES = (10, 100, 1000)
+LINES_PER_CART = 20
+
+
+def legacy_body(page):
+    return JSONResponse(
+        jsonable_encoder([record.to_model() for record in page])
+    ).body
+
+
+def measure(func, page, budget: float = 0.5) -> float:
+    # Повторяем, пока не наберется budget секунд; возвращаем время на вызов
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < budget:
+        func(page)
+        calls += 1
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    items = [
+        ItemRecord(id=id, name=f'Товар {id}', price=id * 1.01, version=id)
+        for id in range(1, 1001)
+    ]
+    carts = [
+        CartRecord(
+            id=id,
+            items={
+                line: CartLineRecord(
+                    id=line, name=f'Товар {line}', quantity=2,
+                    available=True, price=1.0,
+                )
+                for line in range(1, LINES_PER_CART + 1)
+            },
+            price=40.0,
+            total_quantity=2 * LINES_PER_CART,
+        )
+        for id in range(1, 1001)
+    ]
+
+    print(f'{"page":>11} | {"legacy, ms":>10} | {"fast, ms":>9} | speedup')
+    for name, records, fast in (('item', items, dump_items),
+                                ('cart', carts, dump_carts)):
+        for size in PAGE_SIZES:
+            page = records[:size]
+            assert fast(page) == legacy_body(page)
+            legacy = measure(legacy_body, page)
+            new = measure(fast, page)
+            print(f'{name:>5} {size:>5} | {legacy * 1e3:>10.3f} | '
+                  f'{new * 1e3:>9.3f} | {legacy / new:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
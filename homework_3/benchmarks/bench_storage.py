@@ -0,0 +1,104 @@
+'''
+Одна и та же нагрузка на хранилища memory и sqlite (см. server.storage):
+импорт каталога, поштучное создание, чтение по id, фильтр по цене,
+обновления, наполнение корзин и страницы списка корзин.
+
+Запуск из homework_3/: python -m benchmarks.bench_storage
+'''
+
+import os
+import random
+import tempfile
+import time
+from itertools import islice
+
+from server.domain import CartRecord, ItemRecord
+from server.storage import create_storage
+
+CATALOG_SIZE = 100_000
+SINGLE_ITEMS = 2_000
+CARTS_COUNT = 1_000
+LINES_PER_CART = 20
+READS = 10_000
+PRICE_QUERIES = 1_000
+UPDATES = 2_000
+PAGES = 1_000
+
+
+def workload(items, carts):
+    '''
+    Фазы нагрузки: (название, число операций, функция)
+    '''
+    rng = random.Random(0)
+    last_item = CATALOG_SIZE + SINGLE_ITEMS
+
+    def import_catalog():
+        items.add_many(
+            ItemRecord(id=id, name=f'Товар {id}', price=rng.uniform(1, 1000))
+            for id in range(1, CATALOG_SIZE + 1)
+        )
+
+    def create_single():
+        for id in range(CATALOG_SIZE + 1, last_item + 1):
+            price = rng.uniform(1, 1000)
+            items.add(ItemRecord(id=id, name=f'Товар {id}', price=price))
+
+    def read_by_id():
+        for _ in range(READS):
+            items.get(rng.randint(1, last_item))
+
+    def filter_by_price():
+        for _ in range(PRICE_QUERIES):
+            low = rng.uniform(1, 990)
+            items.by_price(low, low + 10, limit=10)
+
+    def update_items():
+        for _ in range(UPDATES):
+            item = items[rng.randint(1, last_item)]
+            items.update(item, price=rng.uniform(1, 1000))
+
+    def fill_carts():
+        for id in range(1, CARTS_COUNT + 1):
+            carts.add(CartRecord(id=id))
+            cart = carts[id]
+            for _ in range(LINES_PER_CART):
+                carts.add_item(cart, items[rng.randint(1, last_item)])
+
+    def list_carts():
+        for _ in range(PAGES):
+            list(islice(carts.values(rng.randint(0, CARTS_COUNT - 10)), 10))
+
+    return [
+        ('import (add_many)', CATALOG_SIZE, import_catalog),
+        ('create item (add)', SINGLE_ITEMS, create_single),
+        ('get item', READS, read_by_id),
+        ('by_price, limit=10', PRICE_QUERIES, filter_by_price),
+        ('update price', UPDATES, update_items),
+        ('add to cart', CARTS_COUNT * LINES_PER_CART, fill_carts),
+        ('list carts, 10', PAGES, list_carts),
+    ]
+
+
+def run(backend, path):
+    items, carts = create_storage(backend, path)
+    results = []
+    for name, count, phase in workload(items, carts):
+        start = time.perf_counter()
+        phase()
+        results.append((name, count / (time.perf_counter() - start)))
+    return results
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'shop.db')
+        memory = run('memory', path)
+        sqlite = run('sqlite', path)
+
+    print(f'{"phase":>20} | {"memory, op/s":>13} | {"sqlite, op/s":>13}')
+    for (name, memory_rate), (_, sqlite_rate) in zip(memory, sqlite):
+        print(f'{name:>20} | {memory_rate:>13,.0f} | {sqlite_rate:>13,.0f}')
+
+
+if __name__ == '__main__':
+    main()
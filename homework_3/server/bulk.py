@@ -0,0 +1,46 @@
+from typing import Dict, List
+
+from pydantic import TypeAdapter, ValidationError, conint
+
+from .models import NewItem
+
+
+NDJSON_CONTENT_TYPES = frozenset(
+    {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+)
+
+# {id товара: количество} для POST /cart/{cart_id}/add
+CartQuantities = Dict[int, conint(gt=0)]  # type: ignore
+
+new_item_adapter = TypeAdapter(NewItem)
+new_items_adapter = TypeAdapter(List[NewItem])
+
+
+def is_ndjson(content_type: str) -> bool:
+    return content_type.split(';', 1)[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
+def parse_new_items(body: bytes, ndjson: bool = False) -> List[NewItem]:
+    '''
+    Разбирает тело POST /item/bulk: JSON-массив или NDJSON (по товару в
+    строке). Массив проверяется за один проход validate_json, без
+    json.loads. Строки NDJSON проверяются каждая отдельно: склеенные в
+    массив, они пропустили бы объект, разорванный между строками.
+    Бросает pydantic.ValidationError со всеми ошибками пакета.
+    '''
+    if not ndjson:
+        return new_items_adapter.validate_json(body)
+
+    new_items, errors = [], []
+    lines = (line for line in body.splitlines() if line.strip())
+    for index, line in enumerate(lines):
+        try:
+            new_items.append(new_item_adapter.validate_json(line))
+        except ValidationError as exc:
+            errors.extend(
+                {**error, 'loc': (index, *error['loc'])}
+                for error in exc.errors(include_url=False)
+            )
+    if errors:
+        raise ValidationError.from_exception_data('NewItem', errors)
+    return new_items
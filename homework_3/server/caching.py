@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Response, status
+
+from .compression import Compressor
+from .concurrency import etag, not_modified
+
+
+class RepresentationCache:
+    '''
+    Закодированные ответы GET по id объекта вместе с версией, из которой
+    они получены; хранится не больше size последних (LRU). Рядом с JSON
+    лежат его сжатые варианты, так что популярный объект сжимается один
+    раз на версию, а не на каждый запрос.
+
+    Любая запись увеличивает версию объекта, поэтому ответ, закодированный
+    до нее, просто перестает совпадать по версии и кодируется заново при
+    следующем чтении - сбрасывать кэш в каждом месте записи не нужно, и
+    правки другого воркера (SQLite) учитываются так же.
+    '''
+
+    def __init__(
+        self,
+        encode: Callable[[Any], bytes],
+        compressor: Optional[Compressor] = None,
+        size: int = 10_000,
+    ):
+        self._encode = encode
+        self._compressor = compressor
+        self._size = size
+        # id -> (версия, {content-encoding или None: тело})
+        self._entries: OrderedDict[
+            int, Tuple[int, Dict[Optional[str], bytes]]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, obj, accept_encoding: Optional[str] = None
+    ) -> Tuple[bytes, Optional[str]]:
+        '''
+        Тело ответа для объекта и его content-encoding (None - без
+        сжатия)
+        '''
+        variants = self._variants(obj)
+        encoding = self.encoding(obj, accept_encoding)
+        if encoding is None:
+            return variants[None], None
+        compressed = variants.get(encoding)
+        if compressed is None:
+            # Два запроса могут сжать одно тело параллельно - результат
+            # одинаковый, запишется любой
+            compressed = self._compressor.compress(variants[None], encoding)
+            variants[encoding] = compressed
+        return compressed, encoding
+
+    def encoding(self, obj, accept_encoding: Optional[str] = None) -> Optional[str]:
+        '''
+        content-encoding, в котором get отдаст объект; для выбора нужен
+        только размер JSON, сжимать не приходится
+        '''
+        if self._compressor is None:
+            return None
+        return self._compressor.choose(
+            accept_encoding, len(self._variants(obj)[None])
+        )
+
+    def _variants(self, obj) -> Dict[Optional[str], bytes]:
+        # Версию читаем до кодирования: если объект изменится посередине,
+        # запись останется со старой версией и больше не совпадет
+        id, version = obj.id, obj.version
+        with self._lock:
+            entry = self._entries.get(id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(id)
+                return entry[1]
+
+        variants = {None: self._encode(obj)}
+        with self._lock:
+            self._entries[id] = (version, variants)
+            self._entries.move_to_end(id)
+            if len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+        return variants
+
+
+def cached_response(
+    cache: RepresentationCache,
+    obj,
+    if_none_match: Optional[str],
+    accept_encoding: Optional[str] = None,
+) -> Response:
+    '''
+    Ответ на GET объекта: JSON из кэша, сжатый по Accept-Encoding, или
+    304 без тела и без сжатия, если в If-None-Match есть тег этого
+    представления.
+
+    Сжатые байты - другое представление, поэтому у них свой строгий
+    ETag ("3-gzip"), иначе общий кэш мог бы по 304 отдать gzip клиенту
+    без его поддержки. If-Match понимает оба тега как версию объекта.
+    Vary: Accept-Encoding есть всегда, в том числе у несжатых ответов и
+    у 304: от заголовка зависит, какое представление выбрано.
+    '''
+    encoding = cache.encoding(obj, accept_encoding)
+    headers = {
+        'etag': etag(obj.version, encoding),
+        'vary': 'Accept-Encoding',
+    }
+    if not_modified(if_none_match, obj.version, encoding):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    body, encoding = cache.get(obj, accept_encoding)
+    if encoding is not None:
+        headers['content-encoding'] = encoding
+    return Response(
+        content=body, media_type='application/json', headers=headers
+    )
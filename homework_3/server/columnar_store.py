@@ -0,0 +1,310 @@
+import math
+import sys
+import threading
+from typing import FrozenSet, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .concurrency import VersionConflict
+from .domain import ItemRecord
+from .search import NameIndex
+
+
+class ColumnarItemStore:
+    '''
+    Товары по колонкам NumPy: цена (float64), флаги deleted и present,
+    версия (int64) и список имен - все по индексу id. Имена интернируются,
+    так что одинаковые строки хранятся один раз.
+
+    Для фильтра по цене товары дополнительно упорядочены по (цене, id):
+    _order - id в этом порядке, _sorted_prices - их цены, _sorted_active -
+    маска неудаленных. Диапазон цен находится бинарным поиском
+    (searchsorted), неудаленные в нем - векторной маской, а страница
+    отсчитывается по np.flatnonzero, без перебора объектов в Python.
+
+    Цена запроса - O(log n + offset + limit), зато добавление и смена
+    цены сдвигают упорядоченные массивы (O(n) копирования памяти в
+    худшем случае). Хранилище рассчитано на большие каталоги, которые
+    читают чаще, чем меняют; удаление - O(log n).
+
+    Поиск по названиям - тот же NameIndex, что и в ItemStore.
+
+    Объекты, которые оно отдает, - снимки колонок: менять их можно
+    только через update/delete.
+    '''
+
+    # Операции не ждут ввода-вывода (см. execution.handler_mode)
+    blocking = False
+    # Столько позиций маски просматривается за раз при поиске страницы
+    CHUNK = 4096
+
+    def __init__(self, capacity: int = 1024):
+        self._prices = np.zeros(capacity, dtype=np.float64)
+        self._deleted = np.zeros(capacity, dtype=bool)
+        self._present = np.zeros(capacity, dtype=bool)
+        self._versions = np.zeros(capacity, dtype=np.int64)
+        self._names: List[Optional[str]] = [None] * capacity
+
+        self._order = np.empty(0, dtype=np.int64)
+        self._sorted_prices = np.empty(0, dtype=np.float64)
+        self._sorted_active = np.empty(0, dtype=bool)
+
+        self._search = NameIndex()
+
+        self._size = 0
+        self._last_id = 0
+        self._reserved = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, id: int) -> bool:
+        return 0 <= id < len(self._present) and bool(self._present[id])
+
+    def __getitem__(self, id: int) -> ItemRecord:
+        item = self.get(id)
+        if item is None:
+            raise KeyError(id)
+        return item
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def get(self, id: int) -> Optional[ItemRecord]:
+        if id not in self:
+            return None
+        return ItemRecord(
+            id=id,
+            name=self._names[id],
+            price=float(self._prices[id]),
+            deleted=bool(self._deleted[id]),
+            version=int(self._versions[id]),
+        )
+
+    def reserve_ids(self, count: int) -> int:
+        first = max(self._reserved, self._last_id) + 1
+        self._reserved = first + count - 1
+        return first
+
+    def values(self, after_id: int = 0) -> Iterator[ItemRecord]:
+        start = after_id + 1
+        while start <= self._last_id:
+            stop = min(start + self.CHUNK, self._last_id + 1)
+            ids = np.flatnonzero(self._present[start:stop]) + start
+            yield from self._records(ids)
+            start = stop
+
+    def add(self, item: ItemRecord) -> None:
+        self.add_many((item,))
+
+    def add_many(self, items: Iterable[ItemRecord]) -> None:
+        items = list(items)
+        if not items:
+            return
+        ids = np.fromiter((item.id for item in items), np.int64, len(items))
+        prices = np.fromiter(
+            (item.price for item in items), np.float64, len(items)
+        )
+        with self._lock:
+            # id выдаются по возрастанию, так что обычно вся пачка новее
+            # уже сохраненных товаров и среди равных цен встает последней
+            newest = int(ids.min()) > self._last_id
+            self._grow(int(ids.max()) + 1)
+            self._prices[ids] = prices
+            self._deleted[ids] = [item.deleted for item in items]
+            self._present[ids] = True
+            self._versions[ids] = [item.version for item in items]
+            for item in items:
+                self._names[item.id] = sys.intern(item.name)
+            self._search.add_many(
+                (item.id, item.name) for item in items if not item.deleted
+            )
+            self._size += len(items)
+            self._last_id = max(self._last_id, int(ids.max()))
+
+            # Пачка упорядочивается сама по себе и вставляется за один
+            # проход по упорядоченным массивам
+            batch = np.lexsort((ids, prices))
+            ids, prices = ids[batch], prices[batch]
+            if newest:
+                positions = np.searchsorted(
+                    self._sorted_prices, prices, 'right'
+                )
+            else:
+                positions = self._positions(prices, ids)
+            self._order = np.insert(self._order, positions, ids)
+            self._sorted_prices = np.insert(
+                self._sorted_prices, positions, prices
+            )
+            self._sorted_active = np.insert(
+                self._sorted_active, positions, ~self._deleted[ids]
+            )
+
+    def update(
+        self,
+        item: ItemRecord,
+        name: Optional[str] = None,
+        price: Optional[float] = None,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        if price is not None and not math.isfinite(price):
+            # NaN не равен сам себе, и упорядоченные массивы сломаются
+            raise ValueError(f'Некорректная цена: {price}')
+        id = item.id
+        with self._lock:
+            self._check_version(id, if_match)
+            if name is not None and name != self._names[id]:
+                self._names[id] = sys.intern(name)
+                if not self._deleted[id]:
+                    self._search.remove(id)
+                    self._search.add(id, name)
+            old_price = float(self._prices[id])
+            if price is not None and price != old_price:
+                self._move(id, old_price, price)
+                self._prices[id] = price
+            self._versions[id] += 1
+            item.name = self._names[id]
+            item.price = float(self._prices[id])
+            item.deleted = bool(self._deleted[id])
+            item.version = int(self._versions[id])
+
+    def delete(
+        self, item: ItemRecord, if_match: Optional[FrozenSet[int]] = None
+    ) -> None:
+        id = item.id
+        with self._lock:
+            self._check_version(id, if_match)
+            if not self._deleted[id]:
+                position = self._position(float(self._prices[id]), id)
+                self._sorted_active[position] = False
+                self._search.remove(id)
+                self._deleted[id] = True
+                self._versions[id] += 1
+            item.deleted = True
+            item.version = int(self._versions[id])
+
+    def by_price(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 10,
+        show_deleted: bool = False,
+    ) -> List[ItemRecord]:
+        '''
+        Товары с ценой из [min_price, max_price] по возрастанию цены.
+        Неудаленные отбираются маской _sorted_active порциями по CHUNK,
+        так что до нужной страницы просматривается только offset + limit
+        позиций диапазона.
+        '''
+        with self._lock:
+            prices = self._sorted_prices
+            low = 0 if min_price is None else int(
+                np.searchsorted(prices, min_price, 'left')
+            )
+            high = len(prices) if max_price is None else int(
+                np.searchsorted(prices, max_price, 'right')
+            )
+            if show_deleted:
+                start = min(low + offset, high)
+                ids = self._order[start:min(start + limit, high)]
+            else:
+                ids = self._active_page(low, high, offset, limit)
+            return self._records(ids)
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = 10
+    ) -> List[ItemRecord]:
+        with self._lock:
+            ids = self._search.search(query, offset, limit)
+            return self._records(np.array(ids, dtype=np.int64))
+
+    def _active_page(
+        self, low: int, high: int, offset: int, limit: int
+    ) -> np.ndarray:
+        pages = []
+        for start in range(low, high, self.CHUNK):
+            positions = np.flatnonzero(
+                self._sorted_active[start:min(start + self.CHUNK, high)]
+            )
+            if offset >= len(positions):
+                offset -= len(positions)
+                continue
+            positions = positions[offset:offset + limit] + start
+            offset = 0
+            pages.append(self._order[positions])
+            limit -= len(positions)
+            if limit == 0:
+                break
+        return np.concatenate(pages) if pages else self._order[:0]
+
+    def _records(self, ids: np.ndarray) -> List[ItemRecord]:
+        names = self._names
+        return [
+            ItemRecord(
+                id=id, name=names[id], price=price, deleted=deleted,
+                version=version,
+            )
+            for id, price, deleted, version in zip(
+                ids.tolist(),
+                self._prices[ids].tolist(),
+                self._deleted[ids].tolist(),
+                self._versions[ids].tolist(),
+            )
+        ]
+
+    def _check_version(
+        self, id: int, if_match: Optional[FrozenSet[int]]
+    ) -> None:
+        if if_match is not None and int(self._versions[id]) not in if_match:
+            raise VersionConflict(id)
+
+    def _position(self, price: float, id: int) -> int:
+        '''
+        Позиция пары (price, id) в упорядоченных массивах: среди равных
+        цен id идут по возрастанию, их ищем вторым бинарным поиском
+        '''
+        prices = self._sorted_prices
+        low = int(np.searchsorted(prices, price, 'left'))
+        high = int(np.searchsorted(prices, price, 'right'))
+        return low + int(np.searchsorted(self._order[low:high], id))
+
+    def _positions(self, prices: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        # То же для пачки: цены ищутся одним вызовом, а id - только там,
+        # где цена уже встречается
+        low = np.searchsorted(self._sorted_prices, prices, 'left')
+        high = np.searchsorted(self._sorted_prices, prices, 'right')
+        for i in np.flatnonzero(high > low).tolist():
+            low[i] += np.searchsorted(self._order[low[i]:high[i]], ids[i])
+        return low
+
+    def _move(self, id: int, old_price: float, price: float) -> None:
+        # Сдвигается только участок между старой и новой позицией
+        old = self._position(old_price, id)
+        new = self._position(price, id)
+        active = self._sorted_active[old]
+        for array in (self._order, self._sorted_prices, self._sorted_active):
+            if new > old:
+                new_position = new - 1
+                array[old:new_position] = array[old + 1:new]
+            else:
+                new_position = new
+                array[new + 1:old + 1] = array[new:old]
+        self._order[new_position] = id
+        self._sorted_prices[new_position] = price
+        self._sorted_active[new_position] = active
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._present)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        for name in ('_prices', '_deleted', '_present', '_versions'):
+            old = getattr(self, name)
+            array = np.zeros(capacity, dtype=old.dtype)
+            array[:len(old)] = old
+            setattr(self, name, array)
+        self._names.extend([None] * (capacity - len(self._names)))
@@ -0,0 +1,41 @@
+import os
+from functools import wraps
+from typing import Callable
+
+
+HANDLERS_ENV = 'SHOP_HANDLERS'
+
+
+def run_inline(func: Callable) -> Callable:
+    '''
+    Делает из обычного обработчика async def, который FastAPI вызывает
+    прямо в цикле событий, а не через пул потоков. Сигнатура берется из
+    func (через __wrapped__), так что параметры разбираются как раньше.
+
+    Годится только для обработчиков, которые не блокируют: хранилище в
+    памяти ничего не ждет, а каждая его операция выполняется в цикле
+    событий целиком, без переключения на другой запрос посередине.
+    '''
+    @wraps(func)
+    async def handler(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return handler
+
+
+def run_threaded(func: Callable) -> Callable:
+    return func
+
+
+def handler_mode(blocking: bool) -> Callable[[Callable], Callable]:
+    '''
+    Декоратор режима обработчиков: переменная окружения SHOP_HANDLERS
+    (async или threadpool), а без нее - async, если хранилище не
+    блокирует (память), и пул потоков для блокирующего (SQLite).
+    '''
+    mode = os.environ.get(HANDLERS_ENV, 'threadpool' if blocking else 'async')
+    if mode == 'async':
+        return run_inline
+    if mode == 'threadpool':
+        return run_threaded
+    raise ValueError(f'Неизвестный режим обработчиков: {mode}')
@@ -0,0 +1,44 @@
+import threading
+from typing import Callable, List
+
+
+class IdAllocator:
+    '''
+    Выдает id блоками (hi/lo).
+
+    reserve(count) атомарно резервирует в общем счетчике count id подряд
+    и возвращает первый из них. Счетчик трогаем раз в block_size id, а
+    внутри блока id выдаются из памяти под локальной блокировкой потока,
+    так что воркеры не синхронизируются между собой на каждый запрос и
+    никогда не получают одинаковых id. Неиспользованный остаток блока при
+    перезапуске пропадает - id уникальны, но не обязательно без дыр.
+    '''
+
+    def __init__(self, reserve: Callable[[int], int], block_size: int = 1000):
+        self.block_size = block_size
+        self._reserve = reserve
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        return self.take(1)[0]
+
+    def take(self, count: int) -> List[int]:
+        '''
+        count новых id по возрастанию; если остатка блока не хватает,
+        недостающие берутся из одного нового блока подряд
+        '''
+        with self._lock:
+            end = min(self._next + count, self._end)
+            ids = list(range(self._next, end))
+            self._next = end
+
+            missing = count - len(ids)
+            if missing:
+                size = max(missing, self.block_size)
+                start = self._reserve(size)
+                ids.extend(range(start, start + missing))
+                self._next = start + missing
+                self._end = start + size
+        return ids
@@ -0,0 +1,457 @@
+import gc
+import json
+import os
+import threading
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .domain import CartLineRecord, CartRecord, ItemRecord
+from .store import CartStore, ItemStore, sync_line
+
+
+# Когда запись считается сохраненной:
+# group - после fsync, общего для всех записей, пришедших, пока шел
+#   предыдущий fsync (group commit);
+# always - после собственного fsync каждой записи, по очереди;
+# none - после передачи ОС, без fsync (переживает падение процесса, но
+#   не машины).
+SYNC_MODES = ('group', 'always', 'none')
+
+SEGMENT = 'wal'
+SNAPSHOT = 'snapshot'
+
+
+def item_row(item: ItemRecord) -> list:
+    return ['i', item.id, item.name, item.price, item.deleted, item.version]
+
+
+def cart_row(cart: CartRecord) -> list:
+    return [
+        'c', cart.id, cart.price, cart.total_quantity, cart.version,
+        [
+            [line.id, line.name, line.quantity, line.available, line.price]
+            for line in cart.items.values()
+        ],
+    ]
+
+
+def _item(row: list) -> ItemRecord:
+    _, id, name, price, deleted, version = row
+    return ItemRecord(
+        id=id, name=name, price=price, deleted=deleted, version=version
+    )
+
+
+def _cart(row: list) -> CartRecord:
+    _, id, price, total_quantity, version, lines = row
+    return CartRecord(
+        id=id,
+        items={line[0]: CartLineRecord(*line) for line in lines},
+        price=price,
+        total_quantity=total_quantity,
+        version=version,
+    )
+
+
+def _encode(row: list) -> bytes:
+    return json.dumps(
+        row, ensure_ascii=False, separators=(',', ':')
+    ).encode() + b'\n'
+
+
+def _read(path: str) -> List[list]:
+    with open(path, 'rb') as file:
+        data = file.read()
+    # Запись, оборванная при сбое, не заканчивается переводом строки: ее
+    # fsync не завершился, и клиент не получил ответ
+    data = data[:data.rfind(b'\n') + 1]
+    if not data:
+        return []
+    # Внутри строк JSON переводов строки нет (они экранируются), так что
+    # файл разбирается как один массив - одним вызовом json вместо
+    # вызова на строку
+    return json.loads(b'[' + data[:-1].replace(b'\n', b',') + b']')
+
+
+class Journal:
+    '''
+    Журнал изменений (write-ahead log) и снимки состояния в каталоге.
+
+    Изменение записывается строкой NDJSON с полным состоянием товара или
+    корзины после него (см. item_row, cart_row) в текущий сегмент
+    wal.N.ndjson. Строки самодостаточны, поэтому их можно применять
+    повторно и не по порядку: побеждает большая версия.
+
+    После snapshot_every строк в фоне пишется снимок: текущий сегмент
+    закрывается, следующий получает номер N, состояние всех объектов
+    записывается в snapshot.N.ndjson, а сегменты и снимки до N
+    удаляются. Запуск читает последний снимок и сегменты с номерами от
+    него, то есть только хвост журнала.
+    '''
+
+    def __init__(
+        self,
+        directory: str,
+        sync: str = 'group',
+        snapshot_every: int = 100_000,
+    ):
+        if sync not in SYNC_MODES:
+            raise ValueError(f'Неизвестный режим sync: {sync}')
+        self.directory = directory
+        self.sync = sync
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+
+        # _lock - буфер и текущий файл, _flush_lock - кто пишет буфер на
+        # диск; снимки идут по одному под _snapshot_lock
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._buffer: List[bytes] = []
+        self._appended = 0
+        self._durable = 0
+        self._since_snapshot = 0
+        self._number = 0
+        self._file = None
+        self._dump: Optional[Callable[[], Iterable[list]]] = None
+
+    def load(self) -> Iterator[list]:
+        '''
+        Строки последнего снимка, затем сегментов после него в порядке
+        записи
+        '''
+        snapshots, segments = self._files()
+        base = max(snapshots, default=0)
+        if base:
+            yield from _read(self._path(SNAPSHOT, base))
+        for number in sorted(segments):
+            if number >= base:
+                rows = _read(self._path(SEGMENT, number))
+                self._since_snapshot += len(rows)
+                yield from rows
+
+    def open(self, dump: Callable[[], Iterable[list]]) -> None:
+        '''
+        Начинает новый сегмент для записи; dump отдает строки всех
+        объектов для снимка. Если хвост журнала при загрузке оказался
+        длиннее snapshot_every, сразу запускает снимок.
+        '''
+        self._dump = dump
+        snapshots, segments = self._files()
+        with self._lock:
+            self._start(max(snapshots | segments, default=0) + 1)
+        self._maybe_snapshot()
+
+    def write(self, rows: List[list]) -> None:
+        '''
+        Добавляет строки в журнал и ждет, пока они сохранятся по режиму
+        sync
+        '''
+        if not rows:
+            return
+        data = b''.join(map(_encode, rows))
+        if self.sync == 'group':
+            with self._lock:
+                self._buffer.append(data)
+                self._appended += 1
+                number = self._appended
+                self._since_snapshot += len(rows)
+            self._commit(number)
+        else:
+            with self._lock:
+                self._file.write(data)
+                self._file.flush()
+                if self.sync == 'always':
+                    os.fsync(self._file.fileno())
+                self._since_snapshot += len(rows)
+        self._maybe_snapshot()
+
+    def snapshot(self) -> None:
+        '''
+        Пишет снимок всего состояния и удаляет журнал до него
+        '''
+        with self._snapshot_lock:
+            self._snapshot()
+
+    def close(self) -> None:
+        with self._snapshot_lock, self._flush_lock, self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _commit(self, number: int) -> None:
+        # Пока один поток пишет и ждет fsync, остальные копят строки в
+        # буфере; следующий, кто возьмет _flush_lock, сохранит их все
+        # одним write и fsync. Свою запись поток может найти уже
+        # сохраненной чужим fsync.
+        with self._flush_lock:
+            if self._durable >= number:
+                return
+            with self._lock:
+                data = b''.join(self._buffer)
+                self._buffer.clear()
+                last = self._appended
+                file = self._file
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+            self._durable = last
+
+    def _maybe_snapshot(self) -> None:
+        if self._dump is None or self._since_snapshot < self.snapshot_every:
+            return
+        if self._snapshot_lock.acquire(blocking=False):
+            threading.Thread(
+                target=self._background_snapshot, daemon=True
+            ).start()
+
+    def _background_snapshot(self) -> None:
+        try:
+            self._snapshot()
+        finally:
+            self._snapshot_lock.release()
+
+    def _snapshot(self) -> None:
+        # Все записанное до смены сегмента уже применено к объектам, так
+        # что попадет в снимок. Изменения во время снимка попадают и в
+        # новый сегмент, и, возможно, в снимок - при загрузке повтор
+        # ничего не испортит.
+        with self._flush_lock, self._lock:
+            if self._buffer:
+                self._file.write(b''.join(self._buffer))
+                self._buffer.clear()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._durable = self._appended
+            self._file.close()
+            number = self._number + 1
+            self._start(number)
+            self._since_snapshot = 0
+
+        path = self._path(SNAPSHOT, number)
+        with open(path + '.tmp', 'wb') as file:
+            for row in self._dump():
+                file.write(_encode(row))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        self._sync_directory()
+
+        snapshots, segments = self._files()
+        for kind, numbers in ((SNAPSHOT, snapshots), (SEGMENT, segments)):
+            for old in numbers:
+                if old < number:
+                    os.remove(self._path(kind, old))
+
+    def _start(self, number: int) -> None:
+        # Вызывается под _lock
+        self._number = number
+        self._file = open(self._path(SEGMENT, number), 'ab')
+        self._sync_directory()
+
+    def _files(self) -> Tuple[Set[int], Set[int]]:
+        snapshots, segments = set(), set()
+        for name in os.listdir(self.directory):
+            kind, _, rest = name.partition('.')
+            number, _, extension = rest.partition('.')
+            if extension != 'ndjson' or not number.isdigit():
+                continue
+            if kind == SNAPSHOT:
+                snapshots.add(int(number))
+            elif kind == SEGMENT:
+                segments.add(int(number))
+        return snapshots, segments
+
+    def _path(self, kind: str, number: int) -> str:
+        return os.path.join(self.directory, f'{kind}.{number:08d}.ndjson')
+
+    def _sync_directory(self) -> None:
+        # Новый файл или переименование сохранены, только когда сохранен
+        # и сам каталог
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class JournaledItemStore(ItemStore):
+    '''
+    ItemStore, который записывает каждое изменение товара в Journal;
+    вызов возвращается, когда запись сохранена. Пока запись ждет fsync,
+    новое состояние уже видно другим запросам.
+    '''
+
+    def __init__(self, journal: Journal):
+        super().__init__()
+        self._journal = journal
+        # Ожидание fsync не должно останавливать цикл событий
+        self.blocking = journal.sync != 'none'
+
+    def add_many(self, items: Iterable[ItemRecord]) -> None:
+        items = list(items)
+        super().add_many(items)
+        self._journal.write([self._row(item) for item in items])
+
+    def update(
+        self,
+        item: ItemRecord,
+        name: Optional[str] = None,
+        price: Optional[float] = None,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        super().update(item, name, price, if_match)
+        self._journal.write([self._row(item)])
+
+    def delete(
+        self, item: ItemRecord, if_match: Optional[FrozenSet[int]] = None
+    ) -> None:
+        super().delete(item, if_match)
+        self._journal.write([self._row(item)])
+
+    def rows(self) -> Iterator[list]:
+        return map(self._row, self.values())
+
+    def restore(self, items: Iterable[ItemRecord]) -> None:
+        '''
+        Применяет состояния товаров из журнала, не записывая их в него:
+        новые добавляет одной пачкой, известные обновляет, если версия
+        новее
+        '''
+        new: Dict[int, ItemRecord] = {}
+        for item in items:
+            current = self.get(item.id)
+            if current is None:
+                if item.id not in new or new[item.id].version < item.version:
+                    new[item.id] = item
+            elif current.version < item.version:
+                super().update(current, item.name, item.price)
+                if item.deleted:
+                    super().delete(current)
+                current.version = item.version
+        super().add_many(new.values())
+
+    def _row(self, item: ItemRecord) -> list:
+        # Под блокировкой товара, чтобы не записать его наполовину
+        # измененным параллельным запросом
+        with self._locks(item.id):
+            return item_row(item)
+
+
+class JournaledCartStore(CartStore):
+    '''
+    CartStore, который записывает каждое изменение корзины в Journal.
+    Изменения строк из-за изменения товара (refresh_item) не пишутся:
+    при загрузке они заново выводятся из товаров (resync).
+    '''
+
+    def __init__(self, journal: Journal):
+        super().__init__()
+        self._journal = journal
+        self.blocking = journal.sync != 'none'
+
+    def add(self, cart: CartRecord) -> None:
+        super().add(cart)
+        self._journal.write([self._row(cart)])
+
+    def add_items(
+        self,
+        cart: CartRecord,
+        quantities: Iterable[Tuple[ItemRecord, int]],
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        super().add_items(cart, quantities, if_match)
+        self._journal.write([self._row(cart)])
+
+    def rows(self) -> Iterator[list]:
+        return map(self._row, self.values())
+
+    def restore(self, carts: Iterable[CartRecord]) -> None:
+        '''
+        Применяет состояния корзин из журнала, не записывая их в него
+        '''
+        for cart in carts:
+            current = self.get(cart.id)
+            if current is None:
+                super().add(cart)
+                continue
+            if current.version >= cart.version:
+                continue
+            with self._lock:
+                for item_id in cart.items.keys() - current.items.keys():
+                    self._link(item_id, cart.id)
+            current.items = cart.items
+            current.price = cart.price
+            self.add_quantity(
+                current, cart.total_quantity - current.total_quantity
+            )
+            current.version = cart.version
+
+    def resync(self, items: ItemStore) -> None:
+        '''
+        Сверяет строки всех корзин с загруженными товарами.
+
+        Порядку строк в журнале тут верить нельзя: add_items может
+        прочитать корзину со старой ценой товара, а записать ее после
+        строки нового товара, чей refresh_item еще не дошел до корзины.
+        Поэтому сверка идет один раз, когда загружено все.
+        '''
+        for cart in self.values():
+            for item_id in cart.items:
+                item = items.get(item_id)
+                if item is not None and sync_line(cart, item):
+                    cart.version += 1
+
+    def _row(self, cart: CartRecord) -> list:
+        with self._locks(cart.id):
+            return cart_row(cart)
+
+
+def restore(
+    rows: Iterable[list], items: JournaledItemStore, carts: JournaledCartStore
+) -> None:
+    '''
+    Восстанавливает хранилища по строкам Journal.load. Подряд идущие
+    строки товаров и корзин применяются пачками, так что снимок с
+    миллионом товаров индексируется одним add_many. Строки корзин
+    сверяются с товарами в конце, за один проход.
+    '''
+    for kind, group in groupby(rows, key=itemgetter(0)):
+        if kind == 'i':
+            items.restore(map(_item, group))
+        else:
+            carts.restore(map(_cart, group))
+    carts.resync(items)
+
+
+def open_journal(
+    directory: str, sync: str = 'group', snapshot_every: int = 100_000
+) -> Tuple[JournaledItemStore, JournaledCartStore]:
+    '''
+    Хранилища в памяти, восстановленные из журнала в directory и
+    продолжающие писать в него
+    '''
+    journal = Journal(directory, sync, snapshot_every)
+    items, carts = JournaledItemStore(journal), JournaledCartStore(journal)
+    # Загрузка создает миллионы объектов, которые живут до конца
+    # процесса: сборщик мусора обходил бы их снова и снова впустую
+    collect = gc.isenabled()
+    gc.disable()
+    try:
+        restore(journal.load(), items, carts)
+    finally:
+        if collect:
+            gc.enable()
+    journal.open(lambda: chain(items.rows(), carts.rows()))
+    return items, carts
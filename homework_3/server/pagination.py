@@ -0,0 +1,46 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import islice
+from typing import Iterable, List, Optional
+
+from fastapi import Response
+
+
+NEXT_CURSOR_HEADER = 'x-next-after-id'
+
+
+def encode_cursor(id: int) -> str:
+    return urlsafe_b64encode(str(id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[int]:
+    '''
+    Возвращает id из курсора after_id, 0 без курсора и None, если курсор
+    испорчен
+    '''
+    if token is None:
+        return 0
+    try:
+        id = int(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, binascii.Error):
+        return None
+    return id if id >= 0 else None
+
+
+def paginate(
+    objects: Iterable,
+    offset: int,
+    limit: int,
+    response: Response,
+    with_cursor: bool = True,
+) -> List:
+    '''
+    Берет страницу из ленивого потока объектов: обход останавливается на
+    offset + limit подходящих, а не проходит все хранилище. Если страница
+    полная, в заголовке x-next-after-id отдаем курсор на следующую -
+    только когда объекты идут по возрастанию id (with_cursor).
+    '''
+    page = list(islice(objects, offset, offset + limit))
+    if with_cursor and len(page) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page[-1].id)
+    return page
@@ -0,0 +1,142 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from itertools import islice, takewhile
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from .indexes import SortedIndex
+
+
+# Слова - цепочки букв и цифр любого алфавита; так же режет имена
+# токенизатор unicode61 в SQLite FTS5
+_WORD = re.compile(r'[^\W_]+')
+
+
+def normalize(text: str) -> str:
+    # Регистр не важен, а "ё" и "е" в названиях пишут как попало
+    return text.lower().replace('ё', 'е')
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+class NameIndex:
+    '''
+    Обратный индекс по словам названий товаров для поиска по префиксам.
+
+    Для каждого слова хранится упорядоченный список id товаров с ним, а
+    сами слова лежат в SortedIndex, так что все слова с префиксом - это
+    отрезок от префикса до первого слова без него. Запрос находит товары,
+    у которых каждое слово запроса - начало какого-нибудь слова названия.
+
+    Обход начинается с самого редкого слова запроса: его списки id
+    сливаются по возрастанию, а остальные слова проверяются по словам
+    названия кандидата, пока не наберется страница. Так что запрос на
+    частое слово и запрос "частое + редкое" одинаково не перебирают весь
+    каталог. Медленно, когда все слова запроса частые, а вместе почти не
+    встречаются: тогда перебираются все товары самого редкого из них.
+
+    Списки id - обычные списки, так что изменение названия с очень
+    частым словом сдвигает весь его список.
+    '''
+
+    # Сколько слов префикса просматривается, чтобы оценить его частоту
+    EXPAND = 1000
+
+    def __init__(self):
+        self._postings: Dict[str, List[int]] = {}
+        self._words = SortedIndex()
+        self._names: Dict[int, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, id: int, name: str) -> None:
+        self.add_many(((id, name),))
+
+    def add_many(self, names: Iterable[Tuple[int, str]]) -> None:
+        '''
+        Добавляет пары (id, название); новые слова попадают в список слов
+        одной пачкой
+        '''
+        new_words = []
+        for id, name in names:
+            words = tuple(dict.fromkeys(tokenize(name)))
+            self._names[id] = words
+            for word in words:
+                ids = self._postings.get(word)
+                if ids is None:
+                    self._postings[word] = [id]
+                    new_words.append((word, 0))
+                elif ids[-1] < id:
+                    # id растут, так что обычно это добавление в конец
+                    ids.append(id)
+                else:
+                    insort(ids, id)
+        self._words.update(new_words)
+
+    def remove(self, id: int) -> None:
+        for word in self._names.pop(id, ()):
+            ids = self._postings[word]
+            del ids[bisect_left(ids, id)]
+            if not ids:
+                del self._postings[word]
+                self._words.remove(word, 0)
+
+    def search(self, query: str, offset: int = 0, limit: int = 10) -> List[int]:
+        '''
+        id товаров по возрастанию, подходящих под все слова query
+        '''
+        prefixes = list(dict.fromkeys(tokenize(query)))
+        if not prefixes:
+            return []
+
+        plans = []
+        for prefix in prefixes:
+            words = list(islice(self._expand(prefix), self.EXPAND + 1))
+            if not words:
+                return []
+            if len(words) > self.EXPAND:
+                size = float('inf')
+            else:
+                size = sum(len(self._postings[word]) for word in words)
+            plans.append((size, prefix, words))
+        plans.sort(key=lambda plan: plan[0])
+
+        size, prefix, words = plans[0]
+        if size == float('inf'):
+            words = list(self._expand(prefix))
+        # Остальные слова запроса проверяем по словам названия кандидата:
+        # если слов с таким префиксом немного - пересечением множеств,
+        # иначе сравнением начал
+        sets = [frozenset(other) for size, _, other in plans[1:]
+                if size != float('inf')]
+        others = [other for size, other, _ in plans[1:] if size == float('inf')]
+        names = self._names
+        matches = (
+            id for id in self._merge(words)
+            if all(not other.isdisjoint(names[id]) for other in sets) and all(
+                any(word.startswith(other) for word in names[id])
+                for other in others
+            )
+        )
+        return list(islice(matches, offset, offset + limit))
+
+    def _expand(self, prefix: str) -> Iterator[str]:
+        return takewhile(
+            lambda word: word.startswith(prefix), self._words.keys(prefix)
+        )
+
+    def _merge(self, words: Iterable[str]) -> Iterator[int]:
+        # Списки id нескольких слов одного префикса по возрастанию, без
+        # повторов: в одном названии может быть несколько таких слов
+        lists = [self._postings[word] for word in words]
+        if len(lists) == 1:
+            yield from lists[0]
+            return
+        last = None
+        for id in heapq.merge(*lists):
+            if id != last:
+                yield id
+                last = id
@@ -0,0 +1,520 @@
+import math
+import sqlite3
+import threading
+from typing import FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from .concurrency import VersionConflict
+from .domain import CartLineRecord, CartRecord, ItemRecord
+from .search import normalize, tokenize
+from .store import add_line
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    price REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS items_price ON items (price, id);
+CREATE INDEX IF NOT EXISTS items_active_price ON items (price, id)
+    WHERE deleted = 0;
+-- Названия неудаленных товаров для поиска, rowid = id товара. Текст
+-- приводится search_text (см. search.normalize) так же, как в NameIndex
+CREATE VIRTUAL TABLE IF NOT EXISTS items_search USING fts5(
+    name, tokenize = 'unicode61 remove_diacritics 0'
+);
+
+CREATE TABLE IF NOT EXISTS carts (
+    id INTEGER PRIMARY KEY,
+    price REAL NOT NULL DEFAULT 0,
+    total_quantity INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS carts_quantity ON carts (total_quantity, id);
+
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    available INTEGER NOT NULL,
+    PRIMARY KEY (cart_id, item_id)
+);
+-- Обратный индекс: корзины, в которых лежит товар
+CREATE INDEX IF NOT EXISTS cart_items_item ON cart_items (item_id);
+
+CREATE TABLE IF NOT EXISTS id_blocks (
+    name TEXT PRIMARY KEY,
+    hi INTEGER NOT NULL
+);
+'''
+
+# Колонки, появившиеся после первой версии схемы: в старые базы они
+# добавляются при открытии
+ADDED_COLUMNS = (
+    ('items', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('carts', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+ITEM_COLUMNS = 'id, name, price, deleted, version'
+CART_COLUMNS = 'id, price, total_quantity, version'
+
+UPSERT_LINE = '''
+INSERT INTO cart_items (cart_id, item_id, name, quantity, available)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (cart_id, item_id) DO UPDATE
+SET quantity = quantity + excluded.quantity
+'''
+
+# Цена корзин с товаром пересчитывается по строкам: удаленные товары
+# (available = 0) в нее не входят
+REPRICE_CARTS = '''
+UPDATE carts SET version = version + 1, price = (
+    SELECT coalesce(sum(cart_items.quantity * items.price), 0)
+    FROM cart_items JOIN items ON items.id = cart_items.item_id
+    WHERE cart_items.cart_id = carts.id AND cart_items.available
+)
+WHERE id IN (SELECT cart_id FROM cart_items WHERE item_id = ?)
+'''
+
+
+class SQLiteDatabase:
+    '''
+    Файл SQLite, общий для всех воркеров uvicorn.
+
+    Каждый поток получает свое соединение (sqlite3.Connection нельзя
+    делить между потоками без блокировки), а воркеры - свои потоки, так
+    что соединение на воркер получается само. Журнал WAL позволяет
+    читать параллельно с записью, busy_timeout ждет чужую транзакцию
+    вместо ошибки. SQL в хранилищах - постоянные строки с параметрами,
+    поэтому подготовленные запросы берутся из кэша соединения.
+    '''
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+        conn = self.connection()
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.executescript(SCHEMA)
+        self._add_columns(conn)
+        self._fill_search(conn)
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.timeout,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.create_function(
+                'search_text', 1, normalize, deterministic=True
+            )
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @staticmethod
+    def _add_columns(conn: sqlite3.Connection) -> None:
+        with conn:
+            # IMMEDIATE: воркеры открывают базу одновременно, и проверка с
+            # ALTER TABLE не должна перемежаться
+            conn.execute('BEGIN IMMEDIATE')
+            for table, column, declaration in ADDED_COLUMNS:
+                columns = {
+                    row[1] for row in conn.execute(f'PRAGMA table_info({table})')
+                }
+                if column not in columns:
+                    conn.execute(
+                        f'ALTER TABLE {table} ADD COLUMN {column} {declaration}'
+                    )
+
+    @staticmethod
+    def _fill_search(conn: sqlite3.Connection) -> None:
+        # База, созданная до поиска: индекс пуст, а товары есть
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT 1 FROM items_search LIMIT 1').fetchone():
+                return
+            conn.execute(
+                'INSERT INTO items_search (rowid, name) '
+                'SELECT id, search_text(name) FROM items WHERE deleted = 0'
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+def _item(row: Tuple) -> ItemRecord:
+    id, name, price, deleted, version = row
+    return ItemRecord(
+        id=id, name=name, price=price, deleted=bool(deleted), version=version
+    )
+
+
+def _where(conditions: List[str]) -> str:
+    return ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+
+def _version_condition(if_match: Optional[FrozenSet[int]]) -> Tuple[str, Tuple]:
+    '''
+    Условие на версию строки для UPDATE: If-Match проверяется по базе в
+    том же запросе, поэтому запись другого воркера между чтением и
+    изменением не проходит незамеченной
+    '''
+    if if_match is None:
+        return '', ()
+    return f' AND version IN ({", ".join("?" * len(if_match))})', tuple(if_match)
+
+
+class _SQLiteStore:
+    table = ''
+    # Запросы ждут диск и блокировки базы - не для цикла событий
+    blocking = True
+
+    def __init__(self, db: SQLiteDatabase):
+        self._db = db
+
+    def __contains__(self, id: int) -> bool:
+        return self._db.connection().execute(
+            f'SELECT 1 FROM {self.table} WHERE id = ?', (id,)
+        ).fetchone() is not None
+
+    def __getitem__(self, id: int):
+        obj = self.get(id)
+        if obj is None:
+            raise KeyError(id)
+        return obj
+
+    def __len__(self) -> int:
+        return self._db.connection().execute(
+            f'SELECT count(*) FROM {self.table}'
+        ).fetchone()[0]
+
+    @property
+    def last_id(self) -> int:
+        return self._db.connection().execute(
+            f'SELECT coalesce(max(id), 0) FROM {self.table}'
+        ).fetchone()[0]
+
+    def reserve_ids(self, count: int) -> int:
+        '''
+        Резервирует count id в общем для всех воркеров счетчике и
+        возвращает первый. Счетчик не отстает от max(id) таблицы, даже
+        если строки добавлены в обход него.
+        '''
+        conn = self._db.connection()
+        with conn:
+            conn.execute(
+                'INSERT OR IGNORE INTO id_blocks (name, hi) VALUES (?, 0)',
+                (self.table,),
+            )
+            (hi,), = conn.execute(
+                'UPDATE id_blocks SET hi = max(hi, '
+                f'(SELECT coalesce(max(id), 0) FROM {self.table})) + ? '
+                'WHERE name = ? RETURNING hi',
+                (count, self.table),
+            ).fetchall()
+        return hi - count + 1
+
+    def _rows(self, sql: str, params: Tuple = ()) -> Iterator[Tuple]:
+        # Курсор читается лениво; закрываем его, даже если страница
+        # набралась и генератор бросили недочитанным
+        cursor = self._db.connection().execute(sql, params)
+        try:
+            yield from cursor
+        finally:
+            cursor.close()
+
+
+class SQLiteItemStore(_SQLiteStore):
+    '''
+    Товары в таблице items. Фильтр по цене идет по индексу (price, id),
+    а для show_deleted=False - по частичному индексу только по
+    неудаленным товарам.
+    '''
+
+    table = 'items'
+
+    def get(self, id: int) -> Optional[ItemRecord]:
+        row = self._db.connection().execute(
+            f'SELECT {ITEM_COLUMNS} FROM items WHERE id = ?', (id,)
+        ).fetchone()
+        return None if row is None else _item(row)
+
+    def values(self, after_id: int = 0) -> Iterator[ItemRecord]:
+        return map(_item, self._rows(
+            f'SELECT {ITEM_COLUMNS} FROM items WHERE id > ? ORDER BY id',
+            (after_id,),
+        ))
+
+    def add(self, item: ItemRecord) -> None:
+        self.add_many((item,))
+
+    def add_many(self, items: Iterable[ItemRecord]) -> None:
+        items = list(items)
+        conn = self._db.connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO items (id, name, price, deleted, version) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (item.id, item.name, item.price, item.deleted, item.version)
+                    for item in items
+                ],
+            )
+            conn.executemany(
+                'INSERT INTO items_search (rowid, name) '
+                'VALUES (?, search_text(?))',
+                [(item.id, item.name) for item in items if not item.deleted],
+            )
+
+    def update(
+        self,
+        item: ItemRecord,
+        name: Optional[str] = None,
+        price: Optional[float] = None,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        if price is not None and not math.isfinite(price):
+            # NaN sqlite3 записал бы как NULL, и coalesce молча оставил бы
+            # старую цену
+            raise ValueError(f'Некорректная цена: {price}')
+        condition, versions = _version_condition(if_match)
+        conn = self._db.connection()
+        with conn:
+            # Непереданные поля берутся из базы, а не из прочитанного
+            # ранее item, чтобы не затереть чужую правку другого поля
+            rows = conn.execute(
+                'UPDATE items SET name = coalesce(?, name), '
+                'price = coalesce(?, price), version = version + 1 '
+                f'WHERE id = ?{condition} RETURNING {ITEM_COLUMNS}',
+                (name, price, item.id, *versions),
+            ).fetchall()
+            if rows and name is not None:
+                # Удаленного товара в индексе нет, тогда ничего не обновится
+                conn.execute(
+                    'UPDATE items_search SET name = search_text(?) '
+                    'WHERE rowid = ?',
+                    (name, item.id),
+                )
+        if not rows:
+            raise VersionConflict(item.id)
+        _, item.name, item.price, deleted, item.version = rows[0]
+        item.deleted = bool(deleted)
+
+    def delete(
+        self, item: ItemRecord, if_match: Optional[FrozenSet[int]] = None
+    ) -> None:
+        condition, versions = _version_condition(if_match)
+        conn = self._db.connection()
+        with conn:
+            # Повторное удаление версию не меняет
+            rows = conn.execute(
+                'UPDATE items SET version = version + (deleted = 0), deleted = 1 '
+                f'WHERE id = ?{condition} RETURNING version',
+                (item.id, *versions),
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    'DELETE FROM items_search WHERE rowid = ?', (item.id,)
+                )
+        if not rows:
+            raise VersionConflict(item.id)
+        item.deleted = True
+        item.version = rows[0][0]
+
+    def by_price(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 10,
+        show_deleted: bool = False,
+    ) -> List[ItemRecord]:
+        conditions = [] if show_deleted else ['deleted = 0']
+        params: List = []
+        if min_price is not None:
+            conditions.append('price >= ?')
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append('price <= ?')
+            params.append(max_price)
+        rows = self._db.connection().execute(
+            f'SELECT {ITEM_COLUMNS} FROM items{_where(conditions)} '
+            'ORDER BY price, id LIMIT ? OFFSET ?',
+            (*params, limit, offset),
+        )
+        return [_item(row) for row in rows]
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = 10
+    ) -> List[ItemRecord]:
+        # Каждое слово запроса - префикс слова названия ("слово"*); текст
+        # в индексе уже нормализован search_text, запрос - так же
+        words = dict.fromkeys(tokenize(query))
+        if not words:
+            return []
+        rows = self._db.connection().execute(
+            f'SELECT {ITEM_COLUMNS} FROM items WHERE id IN ('
+            'SELECT rowid FROM items_search WHERE items_search MATCH ? '
+            'ORDER BY rowid LIMIT ? OFFSET ?) ORDER BY id',
+            (' '.join(f'"{word}"*' for word in words), limit, offset),
+        )
+        return [_item(row) for row in rows]
+
+
+class SQLiteCartStore(_SQLiteStore):
+    '''
+    Корзины в таблице carts, строки - в cart_items в порядке добавления.
+    Цена и total_quantity корзины меняются в той же транзакции, что и
+    строки, приращением на стороне базы, поэтому параллельные добавления
+    из разных воркеров не теряют друг друга.
+    '''
+
+    table = 'carts'
+
+    def _cart(self, row: Tuple) -> CartRecord:
+        id, price, total_quantity, version = row
+        lines = self._db.connection().execute(
+            'SELECT item_id, cart_items.name, quantity, available, price '
+            'FROM cart_items JOIN items ON items.id = item_id '
+            'WHERE cart_id = ? ORDER BY cart_items.rowid',
+            (id,),
+        )
+        return CartRecord(
+            id=id,
+            items={
+                item_id: CartLineRecord(
+                    id=item_id,
+                    name=name,
+                    quantity=quantity,
+                    available=bool(available),
+                    price=price,
+                )
+                for item_id, name, quantity, available, price in lines
+            },
+            price=price,
+            total_quantity=total_quantity,
+            version=version,
+        )
+
+    def get(self, id: int) -> Optional[CartRecord]:
+        row = self._db.connection().execute(
+            f'SELECT {CART_COLUMNS} FROM carts WHERE id = ?', (id,)
+        ).fetchone()
+        return None if row is None else self._cart(row)
+
+    def values(self, after_id: int = 0) -> Iterator[CartRecord]:
+        return map(self._cart, self._rows(
+            f'SELECT {CART_COLUMNS} FROM carts WHERE id > ? ORDER BY id',
+            (after_id,),
+        ))
+
+    def add(self, cart: CartRecord) -> None:
+        conn = self._db.connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO carts (id, price, total_quantity, version) '
+                'VALUES (?, ?, ?, ?)',
+                (cart.id, cart.price, cart.total_quantity, cart.version),
+            )
+            conn.executemany(
+                'INSERT INTO cart_items '
+                '(cart_id, item_id, name, quantity, available) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (cart.id, line.id, line.name, line.quantity, line.available)
+                    for line in cart.items.values()
+                ],
+            )
+
+    def add_item(
+        self,
+        cart: CartRecord,
+        item: ItemRecord,
+        quantity: int = 1,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        self.add_items(cart, ((item, quantity),), if_match)
+
+    def add_items(
+        self,
+        cart: CartRecord,
+        quantities: Iterable[Tuple[ItemRecord, int]],
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        quantities = list(quantities)
+        condition, versions = _version_condition(if_match)
+        conn = self._db.connection()
+        with conn:
+            rows = conn.execute(
+                'UPDATE carts SET price = price + ?, '
+                'total_quantity = total_quantity + ?, version = version + 1 '
+                f'WHERE id = ?{condition} '
+                'RETURNING price, total_quantity, version',
+                (
+                    sum(item.price * quantity for item, quantity in quantities),
+                    sum(quantity for _, quantity in quantities),
+                    cart.id,
+                    *versions,
+                ),
+            ).fetchall()
+            if not rows:
+                # Исключение внутри with откатывает транзакцию
+                raise VersionConflict(cart.id)
+            conn.executemany(UPSERT_LINE, [
+                (cart.id, item.id, item.name, quantity, not item.deleted)
+                for item, quantity in quantities
+            ])
+        for item, quantity in quantities:
+            add_line(cart, item, quantity)
+        cart.price, cart.total_quantity, cart.version = rows[0]
+
+    def refresh_item(self, item: ItemRecord) -> None:
+        '''
+        Переносит изменение товара в корзины с ним по индексу
+        cart_items_item. Имя и deleted берутся из items, а не из item,
+        чтобы не записать устаревший снимок поверх правки другого воркера.
+        '''
+        conn = self._db.connection()
+        with conn:
+            conn.execute(
+                'UPDATE cart_items SET (name, available) = '
+                '(SELECT name, deleted = 0 FROM items WHERE id = ?) '
+                'WHERE item_id = ?',
+                (item.id, item.id),
+            )
+            conn.execute(REPRICE_CARTS, (item.id,))
+
+    def by_quantity(
+        self,
+        min_quantity: Optional[int] = None,
+        max_quantity: Optional[int] = None,
+    ) -> Iterator[CartRecord]:
+        conditions = []
+        params: List = []
+        if min_quantity is not None:
+            conditions.append('total_quantity >= ?')
+            params.append(min_quantity)
+        if max_quantity is not None:
+            conditions.append('total_quantity <= ?')
+            params.append(max_quantity)
+        return map(self._cart, self._rows(
+            f'SELECT {CART_COLUMNS} FROM carts{_where(conditions)} '
+            'ORDER BY total_quantity, id',
+            tuple(params),
+        ))
@@ -0,0 +1,146 @@
+import os
+from typing import (
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+)
+
+from .domain import CartRecord, ItemRecord
+from .journal import open_journal
+from .sqlite_store import SQLiteCartStore, SQLiteDatabase, SQLiteItemStore
+from .store import CartStore, ItemStore
+
+
+class ItemStorage(Protocol):
+    '''
+    Хранилище товаров, с которым работает shop_api. Объекты, которые
+    оно отдает, можно менять только через update/delete; они бросают
+    VersionConflict, если версия товара не из if_match.
+    '''
+
+    last_id: int
+    blocking: bool
+
+    def __contains__(self, id: int) -> bool: ...
+    def __getitem__(self, id: int) -> ItemRecord: ...
+    def __len__(self) -> int: ...
+    def get(self, id: int) -> Optional[ItemRecord]: ...
+    def reserve_ids(self, count: int) -> int: ...
+    def values(self, after_id: int = 0) -> Iterator[ItemRecord]: ...
+    def add(self, item: ItemRecord) -> None: ...
+    def add_many(self, items: Iterable[ItemRecord]) -> None: ...
+
+    def update(
+        self,
+        item: ItemRecord,
+        name: Optional[str] = None,
+        price: Optional[float] = None,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None: ...
+
+    def delete(
+        self, item: ItemRecord, if_match: Optional[FrozenSet[int]] = None
+    ) -> None: ...
+
+    def by_price(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 10,
+        show_deleted: bool = False,
+    ) -> List[ItemRecord]: ...
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = 10
+    ) -> List[ItemRecord]: ...
+
+
+class CartStorage(Protocol):
+    '''
+    Хранилище корзин, с которым работает shop_api. Строки корзины
+    меняются только через add_item/add_items; они бросают
+    VersionConflict, если версия корзины не из if_match. После изменения
+    товара refresh_item обновляет его строки и цену корзин с ним.
+    '''
+
+    last_id: int
+    blocking: bool
+
+    def __contains__(self, id: int) -> bool: ...
+    def __getitem__(self, id: int) -> CartRecord: ...
+    def __len__(self) -> int: ...
+    def get(self, id: int) -> Optional[CartRecord]: ...
+    def reserve_ids(self, count: int) -> int: ...
+    def values(self, after_id: int = 0) -> Iterator[CartRecord]: ...
+    def add(self, cart: CartRecord) -> None: ...
+    def add_item(
+        self,
+        cart: CartRecord,
+        item: ItemRecord,
+        quantity: int = 1,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None: ...
+
+    def add_items(
+        self,
+        cart: CartRecord,
+        quantities: Iterable[Tuple[ItemRecord, int]],
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None: ...
+
+    def refresh_item(self, item: ItemRecord) -> None: ...
+
+    def by_quantity(
+        self,
+        min_quantity: Optional[int] = None,
+        max_quantity: Optional[int] = None,
+    ) -> Iterator[CartRecord]: ...
+
+
+def create_storage(
+    backend: Optional[str] = None, path: Optional[str] = None
+) -> Tuple[ItemStorage, CartStorage]:
+    '''
+    Создает хранилища товаров и корзин.
+
+    По умолчанию backend и path берутся из переменных окружения
+    SHOP_STORAGE (memory, columnar, journal или sqlite, по умолчанию
+    memory) и SHOP_SQLITE_PATH (по умолчанию shop.db). В памяти данные
+    живут до перезапуска и видны только своему воркеру; с SQLite их
+    переживают и делят все воркеры uvicorn. columnar - то же, что memory,
+    но товары хранятся по колонкам NumPy (см. columnar_store); нужен
+    numpy.
+
+    journal - память, которая переживает перезапуск через журнал и
+    снимки в каталоге SHOP_JOURNAL_DIR (по умолчанию shop-journal, см.
+    journal). SHOP_JOURNAL_SYNC задает режим fsync (group, always или
+    none), SHOP_JOURNAL_SNAPSHOT_EVERY - через сколько записей писать
+    снимок. Каталог принадлежит одному воркеру.
+    '''
+    backend = backend or os.environ.get('SHOP_STORAGE', 'memory')
+    if backend == 'memory':
+        return ItemStore(), CartStore()
+    if backend == 'columnar':
+        # numpy - необязательная зависимость, импортируем только здесь
+        from .columnar_store import ColumnarItemStore
+
+        return ColumnarItemStore(), CartStore()
+    if backend == 'journal':
+        return open_journal(
+            path or os.environ.get('SHOP_JOURNAL_DIR', 'shop-journal'),
+            sync=os.environ.get('SHOP_JOURNAL_SYNC', 'group'),
+            snapshot_every=int(
+                os.environ.get('SHOP_JOURNAL_SNAPSHOT_EVERY', '100000')
+            ),
+        )
+    if backend == 'sqlite':
+        db = SQLiteDatabase(
+            path or os.environ.get('SHOP_SQLITE_PATH', 'shop.db')
+        )
+        return SQLiteItemStore(db), SQLiteCartStore(db)
+    raise ValueError(f'Неизвестное хранилище: {backend}')
@@ -0,0 +1,346 @@
+import math
+import threading
+from itertools import islice
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .concurrency import StripedLock, check_version
+from .domain import CartLineRecord, CartRecord, ItemRecord
+from .indexes import SortedIndex
+from .search import NameIndex
+
+
+def add_line(cart: CartRecord, item: ItemRecord, quantity: int) -> None:
+    '''
+    Добавляет quantity единиц товара в строки и цену корзины, не трогая
+    total_quantity - его обновляет хранилище
+    '''
+    line = cart.items.get(item.id)
+    if line is None:
+        cart.items[item.id] = CartLineRecord(
+            id=item.id,
+            name=item.name,
+            quantity=quantity,
+            available=not item.deleted,
+            price=item.price
+        )
+    else:
+        line.quantity += quantity
+    cart.price += item.price * quantity
+
+
+def sync_line(cart: CartRecord, item: ItemRecord) -> bool:
+    '''
+    Приводит строку товара в корзине к текущим имени, цене и флагу
+    deleted товара и пересчитывает цену корзины по строкам. Удаленный
+    товар остается строкой с available=False, но в цену не входит.
+    Возвращает False, если менять было нечего.
+    '''
+    line = cart.items[item.id]
+    available = not item.deleted
+    if (line.name, line.price, line.available) == (
+        item.name, item.price, available
+    ):
+        return False
+    line.name, line.price, line.available = item.name, item.price, available
+    # Сумма заново, а не поправка на разницу: иначе ошибка округления
+    # копится, и корзина без доступных товаров стоит не ровно 0
+    cart.price = math.fsum(
+        line.price * line.quantity
+        for line in cart.items.values() if line.available
+    )
+    return True
+
+
+class _Store:
+    '''
+    Объекты по id в порядке создания.
+
+    id выдаются по возрастанию и не удаляются (удаление мягкое), поэтому
+    продолжить обход после заданного id можно без перебора начала:
+    достаточно пройти по id от after_id + 1 до последнего. Обход по id,
+    а не по словарю, не ломается, когда другой поток добавляет объект.
+
+    Обработчики работают в пуле потоков, поэтому изменения объекта идут
+    под его блокировкой из _locks (и проверяют его version), а словарь
+    и индексы меняются под общей _lock - она держится только на время
+    правки индекса.
+    '''
+
+    # Операции не ждут ввода-вывода, обработчики можно звать из цикла
+    # событий (см. execution.handler_mode)
+    blocking = False
+
+    def __init__(self):
+        self._data: Dict[int, Any] = {}
+        self._last_id = 0
+        self._reserved = 0
+        self._lock = threading.Lock()
+        self._locks = StripedLock()
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._data
+
+    def __getitem__(self, id: int):
+        return self._data[id]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def get(self, id: int):
+        return self._data.get(id)
+
+    def reserve_ids(self, count: int) -> int:
+        '''
+        Резервирует count id после всех выданных и сохраненных и
+        возвращает первый; вызывается из IdAllocator под его блокировкой
+        '''
+        first = max(self._reserved, self._last_id) + 1
+        self._reserved = first + count - 1
+        return first
+
+    def values(self, after_id: int = 0) -> Iterator:
+        data = self._data
+        return (
+            data[id] for id in range(after_id + 1, self._last_id + 1)
+            if id in data
+        )
+
+    def _put(self, id: int, obj) -> None:
+        # Вызывается под _lock: иначе _last_id мог бы откатиться назад
+        self._data[id] = obj
+        if id > self._last_id:
+            self._last_id = id
+
+
+class CartStore(_Store):
+    '''
+    Хранилище корзин с индексом по общему количеству товаров.
+
+    total_quantity корзины обновляется при добавлении товара, так что
+    фильтр по количеству не суммирует строки корзин на каждый запрос.
+    Менять количество нужно через add_quantity, иначе индекс разойдется
+    с данными.
+
+    Обратный индекс id товара -> id корзин с ним пополняется при
+    добавлении строки; по нему refresh_item обходит только корзины, где
+    товар есть, а не все хранилище.
+    '''
+
+    # Сколько id индекса by_quantity читает за один захват блокировки
+    CHUNK = 256
+
+    def __init__(self):
+        super().__init__()
+        self._quantities = SortedIndex()
+        self._carts_by_item: Dict[int, Set[int]] = {}
+
+    def add(self, cart: CartRecord) -> None:
+        with self._lock:
+            self._put(cart.id, cart)
+            self._quantities.add(cart.total_quantity, cart.id)
+            for item_id in cart.items:
+                self._link(item_id, cart.id)
+
+    def add_item(
+        self,
+        cart: CartRecord,
+        item: ItemRecord,
+        quantity: int = 1,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        '''
+        Добавляет quantity единиц товара в корзину: строка, цена и индекс
+        по количеству обновляются вместе
+        '''
+        self.add_items(cart, ((item, quantity),), if_match)
+
+    def add_items(
+        self,
+        cart: CartRecord,
+        quantities: Iterable[Tuple[ItemRecord, int]],
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        '''
+        Добавляет пачку товаров одним изменением корзины: версия растет
+        на единицу, а при VersionConflict корзина не меняется
+        '''
+        with self._locks(cart.id):
+            check_version(cart, if_match)
+            quantities = list(quantities)
+            # Корзина попадает в обратный индекс до того, как add_line
+            # прочтет цену товара: refresh_item после изменения товара
+            # тогда увидит ее и дождется ее блокировки, а не пропустит
+            with self._lock:
+                for item, _ in quantities:
+                    if item.id not in cart.items:
+                        self._link(item.id, cart.id)
+            total = 0
+            for item, quantity in quantities:
+                add_line(cart, item, quantity)
+                total += quantity
+            self.add_quantity(cart, total)
+            cart.version += 1
+
+    def add_quantity(self, cart: CartRecord, delta: int) -> None:
+        with self._lock:
+            self._quantities.remove(cart.total_quantity, cart.id)
+            cart.total_quantity += delta
+            self._quantities.add(cart.total_quantity, cart.id)
+
+    def _link(self, item_id: int, cart_id: int) -> None:
+        # Вызывается под _lock
+        self._carts_by_item.setdefault(item_id, set()).add(cart_id)
+
+    def refresh_item(self, item: ItemRecord) -> None:
+        '''
+        Переносит изменение товара (имя, цена, удаление) в корзины с ним
+        за O(числа таких корзин); у измененных корзин растет версия
+        '''
+        with self._lock:
+            cart_ids = list(self._carts_by_item.get(item.id, ()))
+        for cart_id in cart_ids:
+            cart = self._data[cart_id]
+            with self._locks(cart_id):
+                if sync_line(cart, item):
+                    cart.version += 1
+
+    def by_quantity(
+        self,
+        min_quantity: Optional[int] = None,
+        max_quantity: Optional[int] = None,
+    ) -> Iterator[CartRecord]:
+        '''
+        Корзины с total_quantity из [min_quantity, max_quantity] по
+        возрастанию количества.
+
+        Индекс читается порциями под _lock, чтобы параллельная правка не
+        застала обход посередине корзины индекса. Между порциями корзина,
+        у которой изменилось количество, может пропасть или повториться.
+        '''
+        ids = self._quantities.range(min_quantity, max_quantity)
+        while True:
+            with self._lock:
+                chunk = list(islice(ids, self.CHUNK))
+            if not chunk:
+                return
+            for id in chunk:
+                yield self._data[id]
+
+
+class ItemStore(_Store):
+    '''
+    Хранилище товаров с индексом по цене.
+
+    Товары лежат в словаре по id, а SortedIndex держит их упорядоченными
+    по цене: один индекс по всем товарам, второй - только по неудаленным,
+    чтобы show_deleted=False не приходилось отфильтровывать перебором.
+    Названия неудаленных товаров - в NameIndex для поиска. Менять имя,
+    цену и флаг deleted нужно через update/delete, иначе индексы
+    разойдутся с данными.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self._prices = SortedIndex()
+        self._active_prices = SortedIndex()
+        self._names = NameIndex()
+
+    def add(self, item: ItemRecord) -> None:
+        self.add_many((item,))
+
+    def add_many(self, items: Iterable[ItemRecord]) -> None:
+        with self._lock:
+            prices, active, names = [], [], []
+            for item in items:
+                self._put(item.id, item)
+                prices.append((item.price, item.id))
+                if not item.deleted:
+                    active.append((item.price, item.id))
+                    names.append((item.id, item.name))
+            # Большая пачка (загрузка, массовое создание) строит индексы
+            # сортировкой, а не вставкой по одному
+            self._prices.update(prices)
+            self._active_prices.update(active)
+            self._names.add_many(names)
+
+    def update(
+        self,
+        item: ItemRecord,
+        name: Optional[str] = None,
+        price: Optional[float] = None,
+        if_match: Optional[FrozenSet[int]] = None,
+    ) -> None:
+        if price is not None and not math.isfinite(price):
+            # NaN не равен сам себе, и его уже не найти в индексе цен
+            raise ValueError(f'Некорректная цена: {price}')
+        with self._locks(item.id):
+            check_version(item, if_match)
+            if name is not None and name != item.name:
+                if not item.deleted:
+                    with self._lock:
+                        self._names.remove(item.id)
+                        self._names.add(item.id, name)
+                item.name = name
+            if price is not None and price != item.price:
+                with self._lock:
+                    self._prices.remove(item.price, item.id)
+                    self._prices.add(price, item.id)
+                    if not item.deleted:
+                        self._active_prices.remove(item.price, item.id)
+                        self._active_prices.add(price, item.id)
+                item.price = price
+            item.version += 1
+
+    def delete(
+        self, item: ItemRecord, if_match: Optional[FrozenSet[int]] = None
+    ) -> None:
+        with self._locks(item.id):
+            check_version(item, if_match)
+            if not item.deleted:
+                with self._lock:
+                    self._active_prices.remove(item.price, item.id)
+                    self._names.remove(item.id)
+                item.deleted = True
+                item.version += 1
+
+    def by_price(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        offset: int = 0,
+        limit: int = 10,
+        show_deleted: bool = False,
+    ) -> List[ItemRecord]:
+        '''
+        Товары с ценой из [min_price, max_price] по возрастанию цены.
+        Стоит O(log n + limit): offset пропускается по индексу.
+        '''
+        index = self._prices if show_deleted else self._active_prices
+        with self._lock:
+            ids = list(islice(index.range(min_price, max_price, offset), limit))
+        return [self._data[id] for id in ids]
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = 10
+    ) -> List[ItemRecord]:
+        '''
+        Неудаленные товары, в названии которых каждое слово query -
+        начало какого-нибудь слова, по возрастанию id
+        '''
+        with self._lock:
+            ids = self._names.search(query, offset, limit)
+        return [self._data[id] for id in ids]
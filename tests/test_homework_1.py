@@ -0,0 +1,534 @@
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from math import factorial
+from http import HTTPStatus
+from typing import Any
+
+import pytest
+
+from homework_1.asgi_app import body as body_module
+from homework_1.asgi_app.body import (
+    MAX_BODY_SIZE_ENV,
+    BodyTooLarge,
+    ClientDisconnected,
+    max_body_size,
+    read_body,
+)
+from homework_1.asgi_app.cache import ResultCache, result_cache
+from homework_1.asgi_app.digits import int_to_decimal_chunks
+from homework_1.asgi_app import stats
+from homework_1.asgi_app.executor import (
+    Budget,
+    BudgetExceeded,
+    ComputeExecutor,
+    Overloaded,
+)
+from homework_1.asgi_app.fibonacci import FibonacciEngine, fibonacci
+from homework_1.asgi_app import main
+from homework_1.asgi_app.main import app
+from homework_1.asgi_app.router import Router, parse_query
+from homework_1.asgi_app.statuses import bad_request, not_found, ok
+
+
+def call_app(
+    method: str, path: str, query_string: bytes = b'', body: bytes = b''
+) -> tuple[int, bytes]:
+    status, _, content = call_app_with_headers(method, path, query_string, body)
+    return status, content
+
+
+def call_app_with_headers(
+    method: str, path: str, query_string: bytes = b'', body: bytes = b''
+) -> tuple[int, dict[bytes, bytes], bytes]:
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query_string,
+        'headers': [],
+    }
+    messages: list[dict[str, Any]] = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+
+    status = messages[0]['status']
+    headers = dict(messages[0]['headers'])
+    content = b''.join(m.get('body', b'') for m in messages[1:])
+    return status, headers, content
+
+
+def fibonacci_loop(n: int) -> int:
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 10, 63, 64, 65, 1000, 4097])
+def test_fibonacci_engine(n: int) -> None:
+    assert FibonacciEngine()(n) == fibonacci_loop(n)
+
+
+def test_fibonacci_engine_cache_is_bounded() -> None:
+    engine = FibonacciEngine(cache_size=8)
+
+    for n in range(0, 5000, 37):
+        assert engine(n) == fibonacci_loop(n)
+
+    assert len(engine) <= 8
+
+
+def test_fibonacci_engine_nearby_anchor() -> None:
+    engine = FibonacciEngine(max_step=4)
+    engine(1000)
+
+    assert engine(1003) == fibonacci_loop(1003)
+    assert engine.pair(1003) == (fibonacci_loop(1003), fibonacci_loop(1004))
+
+
+def test_fibonacci_engine_negative() -> None:
+    with pytest.raises(ValueError):
+        FibonacciEngine()(-1)
+
+
+@pytest.mark.parametrize(
+    ('path', 'status_code', 'result'),
+    [
+        ('/fibonacci/10', HTTPStatus.OK, 55),
+        ('/fibonacci/0', HTTPStatus.OK, 0),
+        ('/fibonacci/-1', HTTPStatus.BAD_REQUEST, None),
+        ('/fibonacci/lol', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+    ],
+)
+def test_fibonacci(path: str, status_code: int, result: int | None) -> None:
+    status, content = call_app('GET', path)
+
+    assert status == status_code
+    if result is not None:
+        assert json.loads(content)['result'] == result
+
+
+def slow_identity(n: int) -> int:
+    time.sleep(n)
+    return n
+
+
+@pytest.fixture()
+def compute_executor():
+    executor = ComputeExecutor(max_workers=1, timeout=0.5, max_pending=1)
+    yield executor
+    executor.shutdown()
+
+
+def test_executor_inline_and_offload(compute_executor: ComputeExecutor) -> None:
+    budget = Budget(inline_max_n=10, max_n=10_000)
+
+    assert asyncio.run(compute_executor.run(fibonacci, 10, budget)) == 55
+    assert asyncio.run(compute_executor.run(fibonacci, 1000, budget)) == (
+        fibonacci_loop(1000)
+    )
+    assert compute_executor.pending == 0
+
+
+def test_executor_size_budget(compute_executor: ComputeExecutor) -> None:
+    with pytest.raises(BudgetExceeded):
+        asyncio.run(compute_executor.run(fibonacci, 11, Budget(0, 10)))
+
+
+def test_executor_time_budget(compute_executor: ComputeExecutor) -> None:
+    budget = Budget(inline_max_n=0, max_n=10)
+
+    async def run_twice():
+        with pytest.raises(Overloaded):
+            await compute_executor.run(slow_identity, 2, budget)
+        # Воркер все еще занят, новую задачу сразу отклоняем
+        with pytest.raises(Overloaded):
+            await compute_executor.run(slow_identity, 1, budget)
+
+    asyncio.run(run_twice())
+
+
+@pytest.mark.parametrize(
+    ('query_string', 'status_code'),
+    [
+        (b'n=10', HTTPStatus.OK),
+        (b'n=-1', HTTPStatus.BAD_REQUEST),
+        (b'n=lol', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'n=', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'x=10', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'', HTTPStatus.UNPROCESSABLE_ENTITY),
+        (b'n=100000000', HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+def test_factorial(query_string: bytes, status_code: int) -> None:
+    status, _ = call_app('GET', '/factorial', query_string)
+
+    assert status == status_code
+
+
+@pytest.fixture()
+def unlimited_int_str():
+    limit = sys.get_int_max_str_digits()
+    sys.set_int_max_str_digits(0)
+    yield
+    sys.set_int_max_str_digits(limit)
+
+
+@pytest.mark.parametrize(
+    'n',
+    [0, 7, -7, 10 ** 12, -(10 ** 4000), 10 ** 12000 - 1, factorial(5000)],
+    ids=['0', '7', '-7', '10^12', '-10^4000', '10^12000-1', '5000!'],
+)
+def test_int_to_decimal_chunks(unlimited_int_str, n: int) -> None:
+    assert b''.join(int_to_decimal_chunks(n, chunk_digits=5)) == str(n).encode()
+    assert b''.join(int_to_decimal_chunks(n)) == str(n).encode()
+
+
+def test_factorial_streamed(unlimited_int_str) -> None:
+    status, content = call_app('GET', '/factorial', b'n=20000')
+
+    assert status == HTTPStatus.OK
+    assert json.loads(content)['result'] == factorial(20000)
+
+
+def test_router_resolve() -> None:
+    router = Router()
+    router.add('GET', '/static', 'get_static')
+    router.add('POST', '/static', 'post_static')
+    router.add('GET', '/users/{uid}', 'get_user')
+    router.add('GET', '/users/{uid}/posts/{pid}', 'get_post')
+    router.add('DELETE', '/users/{uid}', 'delete_user')
+
+    assert router.resolve('GET', '/static').handler == 'get_static'
+    assert router.resolve('PUT', '/static').allow == ('GET', 'POST')
+    assert router.resolve('GET', '/users/7') == ('get_user', {'uid': '7'}, ())
+    assert router.resolve('GET', '/users/7/posts/9').params == {
+        'uid': '7',
+        'pid': '9',
+    }
+    assert router.resolve('PUT', '/users/7').allow == ('DELETE', 'GET')
+    assert router.resolve('GET', '/users').handler is None
+    assert router.resolve('GET', '/users').allow == ()
+    assert router.resolve('GET', '/users/7/posts').allow == ()
+    assert router.resolve('GET', '/nope').allow == ()
+
+
+@pytest.mark.parametrize(
+    ('query_string', 'expected'),
+    [
+        ('', {}),
+        ('n=', {'n': ['']}),
+        ('n=1&n=2&x=%D0%BA%20k', {'n': ['1', '2'], 'x': ['к k']}),
+        ('a+b=c+d', {'a b': ['c d']}),
+    ],
+)
+def test_parse_query(query_string: str, expected: dict) -> None:
+    assert parse_query(query_string) == expected
+
+
+@pytest.mark.parametrize(
+    ('method', 'path', 'status_code'),
+    [
+        ('GET', '/', HTTPStatus.NOT_FOUND),
+        ('POST', '/', HTTPStatus.NOT_FOUND),
+        ('GET', '/fibonacci', HTTPStatus.NOT_FOUND),
+        ('GET', '/not_found/fibonacci/1', HTTPStatus.NOT_FOUND),
+        ('POST', '/factorial', HTTPStatus.METHOD_NOT_ALLOWED),
+        ('DELETE', '/fibonacci/1', HTTPStatus.METHOD_NOT_ALLOWED),
+    ],
+)
+def test_routing(method: str, path: str, status_code: int) -> None:
+    status, headers, _ = call_app_with_headers(method, path)
+
+    assert status == status_code
+    if status_code == HTTPStatus.METHOD_NOT_ALLOWED:
+        assert headers[b'allow'] == b'GET'
+
+
+def make_receive(*messages: dict[str, Any]):
+    queue = list(messages)
+
+    async def receive():
+        return queue.pop(0)
+
+    return receive
+
+
+def body_message(body: bytes, more_body: bool) -> dict[str, Any]:
+    return {'type': 'http.request', 'body': body, 'more_body': more_body}
+
+
+@pytest.mark.parametrize('headers', [[], [(b'content-length', b'9')]])
+def test_read_body_chunks(headers: list) -> None:
+    receive = make_receive(
+        body_message(b'[1, ', True),
+        body_message(b'', True),
+        body_message(b'2, 3]', False),
+    )
+
+    body = asyncio.run(read_body({'headers': headers}, receive))
+
+    assert body == b'[1, 2, 3]'
+
+
+def test_read_body_wrong_content_length() -> None:
+    receive = make_receive(body_message(b'12345', True), body_message(b'6', False))
+
+    body = asyncio.run(read_body({'headers': [(b'content-length', b'2')]}, receive))
+
+    assert body == b'123456'
+
+
+@pytest.mark.parametrize(
+    ('headers', 'messages'),
+    [
+        ([(b'content-length', b'100')], []),
+        ([], [body_message(b'123', True), body_message(b'456', False)]),
+        (
+            [(b'content-length', b'3')],
+            [body_message(b'123', True), body_message(b'456', False)],
+        ),
+    ],
+)
+def test_read_body_too_large(headers: list, messages: list) -> None:
+    receive = make_receive(*messages)
+
+    with pytest.raises(BodyTooLarge):
+        asyncio.run(read_body({'headers': headers}, receive, max_size=5))
+
+
+def test_read_body_does_not_trust_content_length() -> None:
+    # Заявлено 32 МиБ, а пришло 3 байта: столько памяти заранее не берем
+    receive = make_receive(body_message(b'[1]', False))
+    headers = [(b'content-length', str(32 * 1024 * 1024).encode())]
+
+    tracemalloc.start()
+    try:
+        body = asyncio.run(read_body({'headers': headers}, receive))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert body == b'[1]'
+    assert peak < 4 * 1024 * 1024
+
+
+def test_max_body_size_is_configurable(monkeypatch) -> None:
+    monkeypatch.setenv(MAX_BODY_SIZE_ENV, '5')
+    assert max_body_size() == 5
+    monkeypatch.delenv(MAX_BODY_SIZE_ENV)
+    assert max_body_size() == 64 * 1024 * 1024
+
+    monkeypatch.setattr(body_module, 'MAX_BODY_SIZE', 5)
+    assert call_app('GET', '/mean', b'', b'[1, 2]')[0] == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    assert call_app('GET', '/mean', b'', b'[1]')[0] == HTTPStatus.OK
+
+
+def test_read_body_disconnect() -> None:
+    receive = make_receive(body_message(b'[1', True), {'type': 'http.disconnect'})
+
+    with pytest.raises(ClientDisconnected):
+        asyncio.run(read_body({'headers': []}, receive))
+
+
+def test_mean_chunked_body() -> None:
+    messages: list[dict[str, Any]] = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/mean',
+        'query_string': b'',
+        'headers': [],
+    }
+    receive = make_receive(body_message(b'[1, 2', True), body_message(b', 6]', False))
+    asyncio.run(app(scope, receive, send))
+
+    assert messages[0]['status'] == HTTPStatus.OK
+    assert json.loads(messages[1]['body']) == {'result': 3.0}
+
+
+def test_payload_too_large() -> None:
+    messages: list[dict[str, Any]] = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/mean',
+        'query_string': b'',
+        'headers': [(b'content-length', str(2 ** 40).encode())],
+    }
+    asyncio.run(app(scope, make_receive(), send))
+
+    assert messages[0]['status'] == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def stats_backend(request, monkeypatch):
+    if request.param == 'array':
+        monkeypatch.setattr(stats, 'np', None)
+    elif stats.np is None:
+        pytest.skip('numpy is not installed')
+    return request.param
+
+
+@pytest.mark.parametrize(
+    ('path', 'query_string', 'body', 'status_code', 'result'),
+    [
+        ('/mean', b'', b'[1, 2.0, 6]', HTTPStatus.OK, 3.0),
+        ('/mean', b'', b'[true, 2]', HTTPStatus.OK, 1.5),
+        ('/mean', b'', b'[]', HTTPStatus.BAD_REQUEST, None),
+        ('/mean', b'', b'', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/mean', b'', b'[1, "2"]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/mean', b'', b'[1, [2]]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/mean', b'', b'{"a": 1}', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/mean', b'', b'[1' + b'0' * 400 + b']', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/variance', b'', b'[2, 4, 4, 4, 5, 5, 7, 9]', HTTPStatus.OK, 4.0),
+        ('/variance', b'', b'[1]', HTTPStatus.OK, 0.0),
+        ('/mean', b'', b'[1e308, 1e308]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/mean', b'', b'[1, NaN]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/variance', b'', b'[1e308, -1e308]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/median', b'', b'[Infinity]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/median', b'', b'[5, 1, 3]', HTTPStatus.OK, 3.0),
+        ('/median', b'', b'[4, 1, 3, 2]', HTTPStatus.OK, 2.5),
+        ('/quantile', b'q=0', b'[4, 1, 3, 2]', HTTPStatus.OK, 1.0),
+        ('/quantile', b'q=1', b'[4, 1, 3, 2]', HTTPStatus.OK, 4.0),
+        ('/quantile', b'q=0.25', b'[4, 1, 3, 2]', HTTPStatus.OK, 1.75),
+        ('/quantile', b'q=2', b'[4, 1, 3, 2]', HTTPStatus.BAD_REQUEST, None),
+        ('/quantile', b'', b'[4, 1, 3, 2]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+        ('/quantile', b'q=x', b'[4]', HTTPStatus.UNPROCESSABLE_ENTITY, None),
+    ],
+)
+# Переполнение в NumPy не должно сыпать RuntimeWarning в обработке запроса
+@pytest.mark.filterwarnings('error::RuntimeWarning')
+def test_statistics(
+    stats_backend: str,
+    path: str,
+    query_string: bytes,
+    body: bytes,
+    status_code: int,
+    result: float | None,
+) -> None:
+    status, content = call_app('GET', path, query_string, body)
+
+    assert status == status_code
+    if result is not None:
+        assert json.loads(content)['result'] == pytest.approx(result)
+
+
+def test_constant_responses_are_shared() -> None:
+    assert not_found() is not_found()
+    assert bad_request() is bad_request()
+    assert bad_request('other') is not bad_request()
+    assert ok(1) is not ok(1)
+
+
+def test_not_found_skips_body() -> None:
+    messages: list[dict[str, Any]] = []
+
+    async def receive():
+        raise AssertionError('body must not be read')
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/wp-login.php',
+        'query_string': b'',
+        'headers': [],
+    }
+    asyncio.run(app(scope, receive, send))
+
+    assert messages == [not_found().start_message, not_found().body_message]
+
+
+def test_result_cache_evicts_by_bytes() -> None:
+    cache = ResultCache(max_bytes=10, max_item_bytes=6)
+
+    assert cache.put('a', 'A', 4)
+    assert cache.put('b', 'B', 4)
+    assert cache.get('a') == 'A'
+    assert cache.put('c', 'C', 4)
+    assert not cache.put('d', 'D', 7)
+
+    assert 'b' not in cache
+    assert cache.get('a') == 'A' and cache.get('c') == 'C'
+    assert cache.get('b') is None
+    assert cache.size == 8
+    assert cache.stats() == {
+        'entries': 2,
+        'bytes': 8,
+        'max_bytes': 10,
+        'max_item_bytes': 6,
+        'hits': 3,
+        'misses': 1,
+        'evictions': 1,
+    }
+
+
+def test_result_cache_hit_skips_computation(monkeypatch) -> None:
+    result_cache.clear()
+    status, content = call_app('GET', '/factorial', b'n=25')
+    assert status == HTTPStatus.OK
+
+    async def fail(*args):
+        raise AssertionError('must be served from cache')
+
+    monkeypatch.setattr(main.executor, 'run', fail)
+    hits = result_cache.hits
+
+    assert call_app('GET', '/factorial', b'n=25') == (status, content)
+    assert result_cache.hits == hits + 1
+    assert ('factorial', 25) in result_cache
+
+    status, content = call_app('GET', '/cache/stats')
+    assert status == HTTPStatus.OK
+    assert json.loads(content)['result']['entries'] == len(result_cache)
+
+
+def test_large_result_is_streamed_from_cache() -> None:
+    result_cache.clear()
+    scope = {
+        'type': 'http',
+        'method': 'GET',
+        'path': '/factorial',
+        'query_string': b'n=50000',
+        'headers': [],
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    bodies = []
+    for _ in range(2):
+        messages: list[dict[str, Any]] = []
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(app(scope, receive, send))
+        assert messages[0]['status'] == HTTPStatus.OK
+        assert sum(m.get('more_body', False) for m in messages[1:]) > 1
+        bodies.append(b''.join(m['body'] for m in messages[1:]))
+
+    # Второй ответ - из кэша, и тоже кусками
+    assert ('factorial', 50000) in result_cache
+    assert bodies[0] == bodies[1]
+    assert bodies[0].startswith(b'{"result": 334732') and bodies[0].endswith(b'}')
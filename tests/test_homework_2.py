@@ -1,3 +1,7 @@
+import gzip
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 from typing import Any
 from uuid import uuid4
@@ -5,8 +9,19 @@ from uuid import uuid4
 import pytest
 from faker import Faker
 from fastapi.testclient import TestClient
-
-from homework_2.shop_api.main import app
+from pydantic import TypeAdapter
+
+from homework_2.shop_api.compression import Compressor
+from homework_2.shop_api.execution import HANDLERS_ENV, handler_mode, run_inline
+from homework_2.shop_api.ids import IdAllocator
+from homework_2.shop_api.indexes import SortedIndex
+from homework_2.shop_api.main import app, items
+from homework_2.shop_api.domain import CartLineRecord, CartRecord, ItemRecord
+from homework_2.shop_api.models import Cart, Item
+from homework_2.shop_api.serialization import dump_carts, dump_items
+from homework_2.shop_api.pagination import encode_cursor
+from homework_2.shop_api import store
+from homework_2.shop_api.store import CartStore, ItemStore
 
 client = TestClient(app)
 faker = Faker()
@@ -290,4 +305,635 @@ def test_delete_item(existing_item: dict[str, Any]) -> None:
     assert response.status_code == HTTPStatus.NOT_FOUND
 
     response = client.delete(f"/item/{item_id}")
-    assert response.status_code == HTTPStatus.OK
\ No newline at end of file
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_sorted_index() -> None:
+    index = SortedIndex()
+    index.LOAD = 2
+    prices = [5.0, 1.0, 3.0, 3.0, 9.0, 1.0, 7.0, 3.0, 2.0]
+    for id, price in enumerate(prices):
+        index.add(price, id)
+
+    expected = sorted(range(len(prices)), key=lambda id: (prices[id], id))
+    assert list(index.range()) == expected
+    assert list(index.range(3.0, 7.0)) == [2, 3, 7, 0, 6]
+    assert list(index.range(3.0, 7.0, offset=2)) == [7, 0, 6]
+    assert list(index.range(3.5, 4.0)) == []
+    assert list(index.range(10.0)) == []
+    assert list(index.range(offset=100)) == []
+
+    index.remove(3.0, 3)
+    index.remove(1.0, 1)
+    assert list(index.range(None, 3.0)) == [5, 8, 2, 7]
+    assert len(index) == len(prices) - 2
+
+    with pytest.raises(KeyError):
+        index.remove(3.0, 3)
+
+
+def test_sorted_index_matches_sorted_list() -> None:
+    random = faker.random
+    index = SortedIndex()
+    index.LOAD = 4
+    expected: set[tuple[int, int]] = set()
+
+    for id in range(500):
+        key = random.randint(0, 20)
+        index.add(key, id)
+        expected.add((key, id))
+        if random.random() < 0.3:
+            removed = random.choice(sorted(expected))
+            index.remove(*removed)
+            expected.remove(removed)
+
+    ordered = sorted(expected)
+    assert list(index.range()) == [id for _, id in ordered]
+    assert list(index.range(5, 10, offset=3)) == [
+        id for key, id in ordered if 5 <= key <= 10
+    ][3:]
+
+    # Пачка меньше индекса вставляется по одной, больше - пересобирает его
+    for ids in (range(500, 520), range(520, 2000)):
+        batch = [(random.randint(0, 20), id) for id in ids]
+        index.update(batch)
+        expected.update(batch)
+    index.remove(*min(expected))
+    expected.remove(min(expected))
+    assert list(index.range()) == [id for _, id in sorted(expected)]
+    assert len(index) == len(expected)
+
+
+def test_item_store_price_index() -> None:
+    store = ItemStore()
+    for id, price in enumerate([30.0, 10.0, 20.0, 40.0], start=1):
+        store.add(ItemRecord(id=id, name=f'item {id}', price=price))
+
+    store.update(store[4], price=15.0)
+    store.delete(store[2])
+
+    assert [item.id for item in store.by_price(10.0, 30.0)] == [4, 3, 1]
+    assert [item.id for item in store.by_price(10.0, 30.0, show_deleted=True)] == [
+        2,
+        4,
+        3,
+        1,
+    ]
+    assert [item.id for item in store.by_price(min_price=16.0, offset=1)] == [1]
+
+
+def test_get_item_list_by_price() -> None:
+    prices = [faker.pyfloat(min_value=1000.0, max_value=1001.0) for _ in range(5)]
+    for price in prices:
+        client.post("/item", json={"name": "priced", "price": price})
+
+    response = client.get("/item", params={"min_price": 1000.0, "max_price": 1001.0})
+
+    assert response.status_code == HTTPStatus.OK
+    assert [item["price"] for item in response.json()] == sorted(prices)
+
+
+@pytest.mark.parametrize("path", ["/item", "/cart"])
+def test_cursor_pagination(path: str) -> None:
+    expected = client.get(path, params={"limit": 1000}).json()
+    assert len(expected) > 3
+
+    pages = []
+    params: dict[str, Any] = {"limit": 3}
+    while True:
+        response = client.get(path, params=params)
+        assert response.status_code == HTTPStatus.OK
+        pages.extend(response.json())
+        if "x-next-after-id" not in response.headers:
+            break
+        params["after_id"] = response.headers["x-next-after-id"]
+
+    assert pages == expected
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"after_id": "???"},
+        {"after_id": "LTE"},
+        {"after_id": "MQ", "min_price": 1.0},
+    ],
+)
+def test_cursor_pagination_invalid(params: dict[str, Any]) -> None:
+    response = client.get("/item", params=params)
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_get_cart_list_by_quantity(existing_not_empty_carts: list[int]) -> None:
+    response = client.get(
+        "/cart", params={"min_quantity": 5, "max_quantity": 12, "limit": 100}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    quantities = [
+        sum(item["quantity"] for item in cart["items"]) for cart in response.json()
+    ]
+    assert quantities == sorted(quantities)
+    assert set(quantities) == set(range(5, 13))
+    assert all("total_quantity" not in cart for cart in response.json())
+
+
+def test_cart_lines_keep_order_and_shape(existing_items: list[int]) -> None:
+    cart_id = client.post("/cart").json()["id"]
+    order = [existing_items[3], existing_items[1], existing_items[3], existing_items[7]]
+    for item_id in order:
+        client.post(f"/cart/{cart_id}/add/{item_id}")
+
+    response = client.get(f"/cart/{cart_id}")
+
+    assert response.status_code == HTTPStatus.OK
+    lines = response.json()["items"]
+    assert [line["id"] for line in lines] == [
+        existing_items[3], existing_items[1], existing_items[7]
+    ]
+    assert [line["quantity"] for line in lines] == [2, 1, 1]
+    assert Cart(id=cart_id, items=lines).model_dump()["items"] == lines
+
+
+def test_post_item_bulk_json() -> None:
+    batch = [{"name": f"Пакетный товар {i}", "price": 10.0 + i} for i in range(5)]
+
+    response = client.post("/item/bulk", json=batch)
+
+    assert response.status_code == HTTPStatus.CREATED
+    created = response.json()
+    assert [item["name"] for item in created] == [item["name"] for item in batch]
+    ids = [item["id"] for item in created]
+    assert ids == list(range(ids[0], ids[0] + len(batch)))
+    assert client.get(f"/item/{ids[-1]}").json() == created[-1]
+
+
+def test_post_item_bulk_ndjson() -> None:
+    body = '{"name": "Первый", "price": 1.5}\n\n{"name": "Второй", "price": 2.5}\n'
+
+    response = client.post(
+        "/item/bulk",
+        content=body.encode(),
+        headers={"content-type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert [item["price"] for item in response.json()] == [1.5, 2.5]
+
+
+@pytest.mark.parametrize(
+    ("body", "content_type"),
+    [
+        ('[{"name": "Хороший", "price": 1.0}, {"name": "Плохой", "price": -1.0}]',
+         "application/json"),
+        ('{"name": "Хороший", "price": 1.0}\n{"name": "Без цены"}',
+         "application/x-ndjson"),
+        ('{"name": "Хороший", "price": 1.0}\n{не json',
+         "application/x-ndjson"),
+        # Объект, разорванный между строками, - не NDJSON, хоть склейка
+        # строк через запятую и дала бы массив
+        ('{"name": "x", "price": 1},{"name": "y"\n"price": 2}',
+         "application/x-ndjson"),
+        ('{"name": "Не массив", "price": 1.0}', "application/json"),
+    ],
+)
+def test_post_item_bulk_invalid_is_atomic(body: str, content_type: str) -> None:
+    before = len(items)
+
+    response = client.post(
+        "/item/bulk", content=body.encode(), headers={"content-type": content_type}
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert len(items) == before
+
+
+def test_post_cart_add_bulk(existing_items: list[int]) -> None:
+    cart_id = client.post("/cart").json()["id"]
+    client.post(f"/cart/{cart_id}/add/{existing_items[0]}")
+
+    response = client.post(
+        f"/cart/{cart_id}/add",
+        json={str(existing_items[0]): 2, str(existing_items[1]): 3},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    cart = client.get(f"/cart/{cart_id}").json()
+    assert [(line["id"], line["quantity"]) for line in cart["items"]] == [
+        (existing_items[0], 3), (existing_items[1], 3)
+    ]
+    prices = [client.get(f"/item/{id}").json()["price"] for id in existing_items[:2]]
+    assert cart["price"] == pytest.approx(3 * prices[0] + 3 * prices[1])
+
+
+@pytest.mark.parametrize(
+    ("quantities", "status_code"),
+    [
+        ({"999999": 1}, HTTPStatus.NOT_FOUND),
+        ({"1": 0}, HTTPStatus.UNPROCESSABLE_ENTITY),
+        ({"abc": 1}, HTTPStatus.UNPROCESSABLE_ENTITY),
+    ],
+)
+def test_post_cart_add_bulk_invalid_is_atomic(
+    existing_items: list[int], quantities: dict[str, int], status_code: int
+) -> None:
+    cart_id = client.post("/cart").json()["id"]
+
+    response = client.post(
+        f"/cart/{cart_id}/add", json={str(existing_items[0]): 1, **quantities}
+    )
+
+    assert response.status_code == status_code
+    assert client.get(f"/cart/{cart_id}").json()["items"] == []
+
+
+def test_post_cart_add_empty_is_rejected() -> None:
+    cart_id = client.post("/cart").json()["id"]
+    tag = client.get(f"/cart/{cart_id}").headers["etag"]
+
+    response = client.post(f"/cart/{cart_id}/add", json={})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert client.get(f"/cart/{cart_id}").headers["etag"] == tag
+
+
+def test_id_allocator_blocks() -> None:
+    reserved = []
+
+    def reserve(count: int) -> int:
+        first = sum(reserved) + 1
+        reserved.append(count)
+        return first
+
+    ids = IdAllocator(reserve, block_size=4)
+
+    assert [ids.next(), ids.next()] == [1, 2]
+    assert ids.take(5) == [3, 4, 5, 6, 7]
+    assert ids.next() == 8
+    assert reserved == [4, 4]
+
+
+def test_id_allocator_threads_get_unique_ids() -> None:
+    store = ItemStore()
+    ids = IdAllocator(store.reserve_ids, block_size=16)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        taken = list(pool.map(lambda _: ids.next(), range(2000)))
+
+    assert sorted(taken) == list(range(1, 2001))
+
+
+def test_item_if_match(existing_item: dict[str, Any]) -> None:
+    item_id = existing_item["id"]
+    tag = client.get(f"/item/{item_id}").headers["etag"]
+
+    response = client.patch(
+        f"/item/{item_id}", json={"name": "Первая правка"}, headers={"if-match": tag}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["etag"] != tag
+
+    response = client.patch(
+        f"/item/{item_id}", json={"name": "Вторая правка"}, headers={"if-match": tag}
+    )
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert client.get(f"/item/{item_id}").json()["name"] == "Первая правка"
+
+    response = client.delete(f"/item/{item_id}", headers={"if-match": 'W/"0", junk'})
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+
+
+def test_cart_if_match(existing_items: list[int]) -> None:
+    cart_id = client.post("/cart").json()["id"]
+    tag = client.get(f"/cart/{cart_id}").headers["etag"]
+
+    response = client.post(
+        f"/cart/{cart_id}/add/{existing_items[0]}", headers={"if-match": tag}
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["etag"] == client.get(f"/cart/{cart_id}").headers["etag"]
+
+    response = client.post(
+        f"/cart/{cart_id}/add",
+        json={str(existing_items[1]): 2},
+        headers={"if-match": tag},
+    )
+    assert response.status_code == HTTPStatus.PRECONDITION_FAILED
+    assert len(client.get(f"/cart/{cart_id}").json()["items"]) == 1
+
+
+def test_item_changes_reach_carts() -> None:
+    item_ids = [
+        client.post("/item", json={"name": f"Товар {i}", "price": 10.0}).json()["id"]
+        for i in range(2)
+    ]
+    cart_id = client.post("/cart").json()["id"]
+    other_cart_id = client.post("/cart").json()["id"]
+    client.post(f"/cart/{cart_id}/add", json={str(item_ids[0]): 2, str(item_ids[1]): 1})
+    client.post(f"/cart/{other_cart_id}/add/{item_ids[1]}")
+    tag = client.get(f"/cart/{cart_id}").headers["etag"]
+
+    client.put(f"/item/{item_ids[0]}", json={"name": "Новое имя", "price": 25.0})
+    response = client.get(f"/cart/{cart_id}")
+    assert response.headers["etag"] != tag
+    assert response.json()["price"] == pytest.approx(60.0)
+    assert response.json()["items"][0]["name"] == "Новое имя"
+
+    client.delete(f"/item/{item_ids[1]}")
+    cart = client.get(f"/cart/{cart_id}").json()
+    assert cart["price"] == pytest.approx(50.0)
+    assert [line["available"] for line in cart["items"]] == [True, False]
+    assert client.get(f"/cart/{other_cart_id}").json()["price"] == pytest.approx(0.0)
+
+
+@pytest.mark.parametrize("price", [0, -7])
+def test_patch_item_rejects_non_positive_price(
+    existing_item: dict[str, Any], price: float
+) -> None:
+    item_id = existing_item["id"]
+    tag = client.get(f"/item/{item_id}").headers["etag"]
+
+    response = client.patch(f"/item/{item_id}", json={"price": price})
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+    response = client.get(f"/item/{item_id}")
+    assert response.headers["etag"] == tag
+    assert response.json()["price"] == existing_item["price"]
+
+
+@pytest.mark.parametrize("price", ["NaN", "Infinity"])
+def test_item_rejects_non_finite_price(
+    existing_item: dict[str, Any], price: str
+) -> None:
+    item_id = existing_item["id"]
+    body = f'{{"name": "Товар", "price": {price}}}'
+    headers = {"content-type": "application/json"}
+
+    for method in ("PATCH", "PUT"):
+        response = client.request(
+            method, f"/item/{item_id}", content=body, headers=headers
+        )
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert client.post("/item", content=body, headers=headers).status_code == (
+        HTTPStatus.UNPROCESSABLE_ENTITY
+    )
+
+    item_store = ItemStore()
+    item_store.add(ItemRecord(id=1, name="Товар", price=1.0))
+    with pytest.raises(ValueError):
+        item_store.update(item_store[1], price=float(price))
+    item_store.update(item_store[1], price=2.0)
+    item_store.delete(item_store[1])
+    assert item_store[1].price == 2.0 and item_store.by_price() == []
+
+    assert client.patch(f"/item/{item_id}", json={"price": 5.0}).status_code == HTTPStatus.OK
+    assert client.delete(f"/item/{item_id}").status_code == HTTPStatus.OK
+
+
+def test_search_items() -> None:
+    names = ["Ёлочная Гирлянда", "гирлянда-сетка LED", "Ёжик резиновый", "Елочный шар"]
+    ids = [client.post("/item", json={"name": name, "price": 1.0}).json()["id"] for name in names]
+
+    def search(q: str, **params: Any) -> list[int]:
+        response = client.get("/item/search", params={"q": q, **params})
+        assert response.status_code == HTTPStatus.OK
+        return [item["id"] for item in response.json()]
+
+    assert search("ГИРЛЯН") == ids[:2]
+    assert search("елоч") == [ids[0], ids[3]]
+    assert search("гир ёлоч") == [ids[0]]
+    assert search("led сет") == [ids[1]]
+    assert search("гирлянда", offset=1, limit=1) == [ids[1]]
+    assert search("ирлянд") == []
+    assert client.get("/item/search", params={"q": ""}).status_code == (
+        HTTPStatus.UNPROCESSABLE_ENTITY
+    )
+
+    client.put(f"/item/{ids[2]}", json={"name": "Ёлочная игрушка", "price": 2.0})
+    client.patch(f"/item/{ids[3]}", json={"name": "Шар стеклянный"})
+    assert search("ёж") == []
+    assert search("елочн") == [ids[0], ids[2]]
+
+    client.delete(f"/item/{ids[0]}")
+    assert search("елочн") == [ids[2]]
+    assert search("гирлянда") == [ids[1]]
+
+
+def test_item_change_during_cart_add_reaches_cart(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    items, carts = ItemStore(), CartStore()
+    items.add(ItemRecord(id=1, name="Товар", price=10.0))
+    carts.add(CartRecord(id=1))
+    item = items[1]
+
+    def change_item() -> None:
+        items.update(item, price=25.0)
+        carts.refresh_item(item)
+
+    def add_line(cart: CartRecord, item: ItemRecord, quantity: int) -> None:
+        # Цена уже прочитана, и тут же другой запрос меняет товар
+        original_add_line(cart, item, quantity)
+        thread.start()
+        thread.join(timeout=0.2)
+
+    original_add_line = store.add_line
+    thread = threading.Thread(target=change_item)
+    monkeypatch.setattr(store, "add_line", add_line)
+    carts.add_item(carts[1], item)
+    thread.join()
+
+    cart = carts[1]
+    assert cart.items[1].price == 25.0
+    assert cart.price == pytest.approx(25.0)
+
+
+def test_cart_price_is_zero_after_all_items_deleted() -> None:
+    item_ids = [
+        client.post("/item", json={"name": "Товар", "price": price}).json()["id"]
+        for price in (0.1, 0.2)
+    ]
+    cart_id = client.post("/cart").json()["id"]
+    client.post(f"/cart/{cart_id}/add", json={str(id): 1 for id in item_ids})
+    for id in item_ids:
+        client.delete(f"/item/{id}")
+
+    assert client.get(f"/cart/{cart_id}").json()["price"] == 0.0
+    response = client.get(
+        "/cart",
+        params={"after_id": encode_cursor(cart_id - 1), "limit": 1, "max_price": 0},
+    )
+    assert [cart["id"] for cart in response.json()] == [cart_id]
+
+
+def test_cart_store_concurrent_adds_are_not_lost() -> None:
+    carts = CartStore()
+    cart = CartRecord(id=1)
+    carts.add(cart)
+    items = [ItemRecord(id=id, name=f"Товар {id}", price=0.5) for id in range(1, 9)]
+
+    def add(item: ItemRecord) -> None:
+        for _ in range(500):
+            carts.add_item(cart, item)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(add, items))
+
+    assert cart.total_quantity == 4000
+    assert cart.price == 2000.0
+    assert cart.version == 4000
+    assert [line.quantity for line in cart.items.values()] == [500] * 8
+    assert [cart.id for cart in carts.by_quantity(4000, 4000)] == [1]
+
+
+def test_handler_mode(monkeypatch: pytest.MonkeyPatch) -> None:
+    def handler(id: int) -> int:
+        return id
+
+    monkeypatch.delenv(HANDLERS_ENV, raising=False)
+    assert inspect.iscoroutinefunction(handler_mode(blocking=False)(handler))
+    assert handler_mode(blocking=True)(handler) is handler
+    assert inspect.signature(run_inline(handler)) == inspect.signature(handler)
+
+    monkeypatch.setenv(HANDLERS_ENV, "threadpool")
+    assert handler_mode(blocking=False)(handler) is handler
+    monkeypatch.setenv(HANDLERS_ENV, "fibers")
+    with pytest.raises(ValueError):
+        handler_mode(blocking=False)
+
+
+def test_dump_records_matches_models() -> None:
+    records = [
+        ItemRecord(id=1, name="Товар \"1\"", price=9.99, version=3),
+        ItemRecord(id=2, name="Товар", price=1e-7, deleted=True),
+    ]
+    cart = CartRecord(
+        id=1,
+        items={
+            2: CartLineRecord(id=2, name="Товар", quantity=3, available=False, price=2.0),
+            1: CartLineRecord(id=1, name="Товар 1", quantity=1, available=True, price=10.5),
+        },
+        price=10.5,
+        total_quantity=4,
+        version=2,
+    )
+
+    assert dump_items(records) == TypeAdapter(list[Item]).dump_json(
+        [record.to_model() for record in records]
+    )
+    assert dump_carts([cart, CartRecord(id=2)]) == TypeAdapter(list[Cart]).dump_json(
+        [cart.to_model(), Cart(id=2)]
+    )
+
+
+@pytest.mark.parametrize("path", ["/item/{id}", "/cart/{id}"])
+def test_conditional_get(existing_item: dict[str, Any], path: str) -> None:
+    if path == "/cart/{id}":
+        id = client.post("/cart").json()["id"]
+        client.post(f"/cart/{id}/add/{existing_item['id']}")
+    else:
+        id = existing_item["id"]
+    url = path.format(id=id)
+    response = client.get(url)
+    tag = response.headers["etag"]
+
+    for header in (tag, f'"999", W/{tag}', "*"):
+        cached = client.get(url, headers={"if-none-match": header})
+        assert cached.status_code == HTTPStatus.NOT_MODIFIED
+        assert cached.headers["etag"] == tag and cached.content == b""
+    assert client.get(url, headers={"if-none-match": '"999"'}).json() == response.json()
+
+    # Смена цены меняет и товар, и корзину с ним
+    client.patch(f"/item/{existing_item['id']}", json={"price": 1234.5})
+    response = client.get(url, headers={"if-none-match": tag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["etag"] != tag
+    assert response.json()["price"] == pytest.approx(1234.5)
+
+
+def test_compressor_choose() -> None:
+    compressor = Compressor(minimum_size=100)
+
+    assert compressor.choose("gzip, deflate", 100) == "gzip"
+    assert compressor.choose("gzip", 99) is None
+    assert compressor.choose(None, 1000) is None
+    assert compressor.choose("identity", 1000) is None
+    assert compressor.choose("gzip;q=0, *;q=0.5", 1000) != "gzip"
+    assert compressor.choose("*", 1000) is not None
+    body = b'{"id": 1}' * 100
+    assert gzip.decompress(compressor.compress(body, "gzip")) == body
+
+
+def test_compressed_responses() -> None:
+    client.post("/item/bulk", json=[{"name": f"Товар {i}", "price": 5.0} for i in range(100)])
+    plain = client.get("/item", params={"limit": 100}, headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    packed = client.get("/item", params={"limit": 100}, headers={"accept-encoding": "gzip"})
+    assert packed.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in packed.headers["vary"].lower()
+    assert int(packed.headers["content-length"]) < len(plain.content)
+    assert packed.json() == plain.json()
+
+    small = client.get("/item", params={"limit": 1}, headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+
+    cart_id = client.post("/cart").json()["id"]
+    client.post(f"/cart/{cart_id}/add", json={str(item["id"]): 1 for item in plain.json()})
+    responses = [
+        client.get(f"/cart/{cart_id}", headers={"accept-encoding": "gzip"}) for _ in range(2)
+    ]
+    assert [response.headers["content-encoding"] for response in responses] == ["gzip"] * 2
+    assert responses[0].json() == responses[1].json()
+    assert len(responses[0].json()["items"]) == 100
+
+
+def test_compressed_etag_and_vary() -> None:
+    item_ids = [
+        item["id"]
+        for item in client.post(
+            "/item/bulk", json=[{"name": f"Товар {i}", "price": 5.0} for i in range(100)]
+        ).json()
+    ]
+    cart_id = client.post("/cart").json()["id"]
+    client.post(f"/cart/{cart_id}/add", json={str(id): 1 for id in item_ids})
+
+    plain = client.get(f"/cart/{cart_id}", headers={"accept-encoding": "identity"})
+    packed = client.get(f"/cart/{cart_id}", headers={"accept-encoding": "gzip"})
+    assert packed.headers["content-encoding"] == "gzip"
+    assert packed.headers["etag"] == plain.headers["etag"][:-1] + '-gzip"'
+    for response in (plain, packed):
+        assert response.headers["vary"] == "Accept-Encoding"
+
+    # Тег gzip не подтверждает несжатую копию и наоборот
+    response = client.get(
+        f"/cart/{cart_id}",
+        headers={"accept-encoding": "identity", "if-none-match": packed.headers["etag"]},
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert "content-encoding" not in response.headers
+
+    for headers, tag in (
+        ({"accept-encoding": "gzip"}, packed.headers["etag"]),
+        ({"accept-encoding": "identity"}, plain.headers["etag"]),
+    ):
+        response = client.get(f"/cart/{cart_id}", headers={**headers, "if-none-match": tag})
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+        assert response.headers["etag"] == tag
+        assert response.headers["vary"] == "Accept-Encoding"
+
+    item = client.get(f"/item/{item_ids[0]}", headers={"accept-encoding": "gzip"})
+    assert "content-encoding" not in item.headers
+    assert item.headers["vary"] == "Accept-Encoding"
+    response = client.get(f"/item/{item_ids[0]}", headers={"if-none-match": item.headers["etag"]})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    # If-Match сверяет версию: тег сжатой копии тоже подходит
+    response = client.patch(
+        f"/item/{item_ids[0]}",
+        json={"price": 6.0},
+        headers={"if-match": item.headers["etag"][:-1] + '-gzip"'},
+    )
+    assert response.status_code == HTTPStatus.OK
@@ -1,12 +1,21 @@
+import glob
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
-from typing import Any
+from typing import Any, Iterator
 from uuid import uuid4
 
 import pytest
 from faker import Faker
 from fastapi.testclient import TestClient
 
+from homework_3.server.concurrency import VersionConflict
+from homework_3.server.ids import IdAllocator
+from homework_3.server.journal import cart_row, open_journal
+from homework_3.server.domain import CartLineRecord, CartRecord, ItemRecord
 from homework_3.server.shop_api import app
+from homework_3.server.storage import create_storage
 
 client = TestClient(app)
 faker = Faker()
@@ -290,4 +299,288 @@ def test_delete_item(existing_item: dict[str, Any]) -> None:
     assert response.status_code == HTTPStatus.NOT_FOUND
 
     response = client.delete(f"/item/{item_id}")
-    assert response.status_code == HTTPStatus.OK
\ No newline at end of file
+    assert response.status_code == HTTPStatus.OK
+
+
+@pytest.fixture(params=["memory", "columnar", "journal", "sqlite"])
+def storage(request, tmp_path) -> Iterator[tuple[Any, Any]]:
+    if request.param == "columnar":
+        pytest.importorskip("numpy")
+    path = tmp_path / ("journal" if request.param == "journal" else "shop.db")
+    items, carts = create_storage(request.param, str(path))
+    yield items, carts
+    if request.param == "sqlite":
+        items._db.close()
+    if request.param == "journal":
+        items._journal.close()
+
+
+def test_storage_items(storage: tuple[Any, Any]) -> None:
+    items, _ = storage
+    items.add_many(
+        ItemRecord(id=id, name=f"Товар {id}", price=float(id % 7 + 1)) for id in range(1, 51)
+    )
+    items.add(ItemRecord(id=51, name="Последний", price=3.0))
+
+    assert len(items) == 51
+    assert items.last_id == 51
+    assert 51 in items and 52 not in items
+    assert items.get(52) is None
+    assert [item.id for item in items.values(after_id=48)] == [49, 50, 51]
+
+    item = items[7]
+    items.update(item, name="Новое имя", price=100.0)
+    items.delete(items[14])
+
+    assert items[7].name == "Новое имя" and items[7].price == 100.0
+    assert items[14].deleted
+    found = items.by_price(2.0, 3.0, offset=2, limit=5)
+    assert [(item.price, item.id) for item in found] == [
+        (2.0, 15), (2.0, 22), (2.0, 29), (2.0, 36), (2.0, 43)
+    ]
+    assert 14 not in {item.id for item in items.by_price(max_price=1.0, limit=100)}
+    assert 14 in {
+        item.id for item in items.by_price(max_price=1.0, limit=100, show_deleted=True)
+    }
+
+
+def test_storage_carts(storage: tuple[Any, Any]) -> None:
+    items, carts = storage
+    items.add_many(ItemRecord(id=id, name=f"Товар {id}", price=10.0 * id) for id in (1, 2, 3))
+    for id in (1, 2, 3):
+        carts.add(CartRecord(id=id))
+
+    carts.add_item(carts[1], items[2])
+    carts.add_items(carts[1], [(items[1], 3), (items[2], 1)])
+    carts.add_items(carts[2], [(items[3], 2)])
+
+    cart = carts[1]
+    assert [(line.id, line.quantity) for line in cart.items.values()] == [(2, 2), (1, 3)]
+    assert cart.price == pytest.approx(70.0)
+    assert cart.total_quantity == 5
+    assert [cart.id for cart in carts.by_quantity(min_quantity=1)] == [2, 1]
+    assert [cart.id for cart in carts.by_quantity(max_quantity=0)] == [3]
+    assert [cart.id for cart in carts.values(after_id=1)] == [2, 3]
+    assert carts.last_id == 3
+
+
+def test_storage_refresh_item(storage: tuple[Any, Any]) -> None:
+    items, carts = storage
+    items.add_many(ItemRecord(id=id, name=f"Товар {id}", price=10.0) for id in (1, 2))
+    for id in (1, 2, 3):
+        carts.add(CartRecord(id=id))
+    carts.add_items(carts[1], [(items[1], 2), (items[2], 1)])
+    carts.add_item(carts[2], items[2])
+
+    item = items[2]
+    items.update(item, price=4.0)
+    carts.refresh_item(item)
+    assert [carts[id].price for id in (1, 2, 3)] == pytest.approx([24.0, 4.0, 0.0])
+    assert carts[1].version == 2 and carts[3].version == 0
+
+    item = items[1]
+    items.delete(item)
+    carts.refresh_item(item)
+    cart = carts[1]
+    assert cart.price == pytest.approx(4.0)
+    assert [line.available for line in cart.items.values()] == [False, True]
+    assert carts[2].version == 2
+
+
+def test_storage_rejects_non_finite_price(storage: tuple[Any, Any]) -> None:
+    items, _ = storage
+    items.add(ItemRecord(id=1, name="Товар", price=1.0))
+    for price in (float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            items.update(items[1], price=price)
+
+    items.update(items[1], price=2.0)
+    items.delete(items[1])
+    assert (items[1].price, items[1].version) == (2.0, 2)
+    assert items.by_price() == []
+
+
+def test_storage_search(storage: tuple[Any, Any]) -> None:
+    items, _ = storage
+    names = ["Ёлочная гирлянда", "Гирлянда LED", "Ёжик", "Елочный шар", "Шар 10 см"]
+    items.add_many(
+        ItemRecord(id=id, name=name, price=1.0) for id, name in enumerate(names, 1)
+    )
+
+    def search(query: str, offset: int = 0, limit: int = 10) -> list[int]:
+        return [item.id for item in items.search(query, offset, limit)]
+
+    assert search("гирл") == [1, 2]
+    assert search("ЕЛОЧ") == [1, 4]
+    assert search("шар ёл") == [4]
+    assert search("10") == [5]
+    assert search("шар", offset=1, limit=1) == [5]
+    assert search("!!!") == [] and search("лочн") == []
+
+    items.update(items[3], name="Ёлочный дождик")
+    items.update(items[4], price=2.0)
+    items.delete(items[1])
+    assert search("ёлоч") == [3, 4]
+    assert search("ёж") == []
+    assert items.search("дождик")[0] == items[3]
+
+
+def test_sqlite_storage_survives_reopen(tmp_path) -> None:
+    path = str(tmp_path / "shop.db")
+    items, carts = create_storage("sqlite", path)
+    items.add(ItemRecord(id=1, name="Товар", price=5.0))
+    carts.add(CartRecord(id=1))
+    carts.add_item(carts[1], items[1], 2)
+    items._db.close()
+
+    items, carts = create_storage("sqlite", path)
+
+    assert items[1] == ItemRecord(id=1, name="Товар", price=5.0)
+    assert carts[1] == CartRecord(
+        id=1,
+        items={1: CartLineRecord(id=1, name="Товар", quantity=2, available=True, price=5.0)},
+        price=10.0,
+        total_quantity=2,
+        version=1,
+    )
+    items._db.close()
+
+
+@pytest.mark.parametrize("sync", ["group", "always", "none"])
+def test_journal_survives_restart(tmp_path, sync: str) -> None:
+    path = str(tmp_path / "journal")
+    items, carts = open_journal(path, sync=sync, snapshot_every=10**6)
+    items.add_many(ItemRecord(id=id, name=f"Товар {id}", price=float(id)) for id in range(1, 6))
+    carts.add(CartRecord(id=1))
+    carts.add_items(carts[1], [(items[1], 2), (items[2], 1)])
+    items._journal.snapshot()
+
+    items.update(items[1], name="Новое имя", price=10.0)
+    carts.refresh_item(items[1])
+    items.delete(items[2])
+    carts.refresh_item(items[2])
+    carts.add_item(carts[1], items[3])
+    expected = (list(items.values()), list(carts.values()))
+    items._journal.close()
+    # Оборванная при сбое запись в конце сегмента
+    with open(max(glob.glob(f"{path}/wal.*")), "ab") as file:
+        file.write('["i",6,"Недописан'.encode())
+
+    items, carts = open_journal(path, sync=sync)
+    assert (list(items.values()), list(carts.values())) == expected
+    assert carts[1].price == pytest.approx(23.0)
+    assert items.search("нов") == [items[1]] and items.by_price(max_price=2.5) == []
+    assert [cart.id for cart in carts.by_quantity(4, 4)] == [1]
+    assert items.last_id == 5
+    items.add(ItemRecord(id=6, name="Товар 6", price=6.0))
+    items._journal.close()
+
+    items, _ = open_journal(path, sync=sync, snapshot_every=1)
+    assert items[6].name == "Товар 6"
+    # Длинный хвост журнала при запуске сворачивается в снимок
+    items._journal.close()
+    assert [os.path.basename(name) for name in sorted(glob.glob(f"{path}/*"))] == [
+        "snapshot.00000005.ndjson",
+        "wal.00000005.ndjson",
+    ]
+
+
+def test_journal_replays_cart_logged_after_item_change(tmp_path) -> None:
+    path = str(tmp_path / "journal")
+    items, carts = open_journal(path, snapshot_every=10**6)
+    items.add(ItemRecord(id=1, name="Товар", price=10.0))
+    carts.add(CartRecord(id=1))
+    # add_items прочитал корзину со старой ценой, но записал ее уже после
+    # нового товара, а refresh_item в журнал не попадает
+    stale = CartRecord(
+        id=1,
+        items={1: CartLineRecord(id=1, name="Товар", quantity=1, available=True, price=10.0)},
+        price=10.0,
+        total_quantity=1,
+        version=1,
+    )
+    items.update(items[1], price=25.0)
+    items._journal.write([cart_row(stale)])
+    items._journal.close()
+
+    items, carts = open_journal(path)
+    assert items[1].price == 25.0
+    assert carts[1].items[1].price == 25.0
+    assert carts[1].price == 25.0
+    assert carts[1].version == 2
+    items._journal.close()
+
+
+def test_sqlite_ids_unique_across_workers(tmp_path) -> None:
+    path = str(tmp_path / "shop.db")
+    create_storage("sqlite", path)[0].add(ItemRecord(id=5, name="Товар", price=1.0))
+    # Отдельная база на поток - как отдельный воркер со своим соединением
+    allocators = [
+        IdAllocator(create_storage("sqlite", path)[0].reserve_ids, block_size=7)
+        for _ in range(4)
+    ]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        taken = list(pool.map(lambda ids: ids.take(1) + ids.take(30), allocators))
+
+    flat = [id for ids in taken for id in ids]
+    assert len(set(flat)) == len(flat)
+    assert min(flat) == 6
+
+
+def test_storage_version_conflicts(storage: tuple[Any, Any]) -> None:
+    items, carts = storage
+    items.add(ItemRecord(id=1, name="Товар", price=2.0))
+    carts.add(CartRecord(id=1))
+
+    item = items[1]
+    items.update(item, price=3.0, if_match=frozenset({0}))
+    assert item.version == 1
+    with pytest.raises(VersionConflict):
+        items.update(items[1], name="Чужая правка", if_match=frozenset({0}))
+    with pytest.raises(VersionConflict):
+        items.delete(items[1], if_match=frozenset())
+    assert items[1].name == "Товар" and not items[1].deleted
+
+    cart = carts[1]
+    carts.add_item(cart, items[1], 2, if_match=frozenset({0}))
+    with pytest.raises(VersionConflict):
+        carts.add_item(carts[1], items[1], if_match=frozenset({0}))
+    assert (cart.version, cart.total_quantity) == (1, 2)
+    assert carts[1].total_quantity == 2 and carts[1].price == 6.0
+
+
+def test_columnar_storage_matches_memory() -> None:
+    pytest.importorskip("numpy")
+
+    rng = random.Random(0)
+    memory, _ = create_storage("memory")
+    columnar, _ = create_storage("columnar")
+    columnar.CHUNK = 16
+    for store in (memory, columnar):
+        for ids in (range(1, 301, 2), range(2, 301, 2)):
+            store.add_many(
+                ItemRecord(id=id, name=f"Товар {id}", price=float(id % 13)) for id in ids
+            )
+
+    for id in rng.sample(range(1, 301), 100):
+        price = float(rng.randint(0, 15))
+        memory.update(memory[id], price=price)
+        columnar.update(columnar[id], price=price)
+    for id in rng.sample(range(1, 301), 50):
+        memory.delete(memory[id])
+        columnar.delete(columnar[id])
+    for store in (memory, columnar):
+        store.add_many(ItemRecord(id=id, name="Новый", price=5.0) for id in (302, 301))
+
+    for min_price, max_price, offset, limit, show_deleted in [
+        (None, None, 0, 400, True),
+        (None, None, 0, 400, False),
+        (3.0, 7.0, 17, 30, False),
+        (5.0, 5.0, 0, 10, True),
+        (14.0, None, 5, 10, False),
+        (20.0, None, 0, 10, False),
+    ]:
+        args = (min_price, max_price, offset, limit, show_deleted)
+        assert columnar.by_price(*args) == memory.by_price(*args)
+    assert list(columnar.values(after_id=290)) == list(memory.values(after_id=290))